@@ -0,0 +1,154 @@
+import calendar
+from dataclasses import dataclass, replace
+from datetime import datetime, date, timedelta
+from typing import List, Optional, Tuple
+from sqlalchemy import select, tuple_, exists
+from db import Reservation, User
+from router import cb, callback_payload
+from config import BOOKINGS_PAGE_SIZE
+
+# Коды статусов в данных кнопок (callback_data ограничены 64 байтами)
+STATUS_CODES = {'p': 'pending', 'c': 'confirmed', 'x': 'cancelled', 'e': 'expired'}
+STATUS_BY_NAME = {name: code for code, name in STATUS_CODES.items()}
+# Порядок переключения фильтра статуса кнопкой
+STATUS_CYCLE = (None, 'pending', 'confirmed', 'cancelled', 'expired')
+
+CALLBACK_PREFIX = 'ab'
+
+def encode_time(value: datetime) -> int:
+    # Наивное время как есть, без часового пояса: одинаково кодируется и декодируется в любой зоне
+    return calendar.timegm(value.timetuple())
+
+def decode_time(value: str) -> datetime:
+    return datetime(1970, 1, 1) + timedelta(seconds=int(value))
+
+@dataclass(frozen=True)
+class BookingListState:
+    """
+    Фильтры и положение страницы списка бронирований администратора.
+    Сериализуется в данные кнопки: v1:ab:<день>:<статус>:<стол>:<направление>:<время>:<id>,
+    например v1:ab:20300115:p:3:n:1894636800:812 (прочерк — фильтр или курсор не задан).
+    Направление: f — первая страница, n — после курсора, p — перед курсором.
+    """
+    day: Optional[date] = None
+    status: Optional[str] = None
+    table: Optional[int] = None
+    direction: str = 'f'
+    cursor: Optional[Tuple[datetime, int]] = None
+
+    def encode(self) -> str:
+        parts = [
+            CALLBACK_PREFIX,
+            self.day.strftime('%Y%m%d') if self.day else '-',
+            STATUS_BY_NAME[self.status] if self.status else '-',
+            str(self.table) if self.table is not None else '-',
+            self.direction,
+        ]
+        if self.cursor:
+            parts += [str(encode_time(self.cursor[0])), str(self.cursor[1])]
+        else:
+            parts += ['-', '-']
+        return cb(*parts)
+
+    @classmethod
+    def decode(cls, data: str) -> 'BookingListState':
+        """Разбирает данные кнопки (и старые, без версии); для 'all_bookings' и неизвестного формата — первая страница без фильтров"""
+        parts = callback_payload(data).split(':')
+        if len(parts) != 7 or parts[0] != CALLBACK_PREFIX:
+            return cls()
+        _, day, status, table, direction, cursor_time, cursor_id = parts
+        try:
+            cursor = (decode_time(cursor_time), int(cursor_id)) if cursor_time != '-' else None
+            return cls(
+                day=datetime.strptime(day, '%Y%m%d').date() if day != '-' else None,
+                status=STATUS_CODES.get(status),
+                table=int(table) if table != '-' else None,
+                direction=direction if cursor and direction in ('n', 'p') else 'f',
+                cursor=cursor
+            )
+        except ValueError:
+            return cls()
+
+    def with_filters(self, **changes) -> 'BookingListState':
+        """Новые фильтры всегда начинают список с первой страницы"""
+        return replace(self, direction='f', cursor=None, **changes)
+
+    def after(self, row) -> 'BookingListState':
+        return replace(self, direction='n', cursor=(row.start_time, row.id))
+
+    def before(self, row) -> 'BookingListState':
+        return replace(self, direction='p', cursor=(row.start_time, row.id))
+
+@dataclass
+class BookingPage:
+    rows: List
+    has_prev: bool
+    has_next: bool
+
+def _filtered(stmt, state: BookingListState, table_id: Optional[int]):
+    if state.day is not None:
+        day_start = datetime.combine(state.day, datetime.min.time())
+        stmt = stmt.where(Reservation.start_time >= day_start, Reservation.start_time < day_start + timedelta(days=1))
+    if state.status is not None:
+        stmt = stmt.where(Reservation.status == state.status)
+    if table_id is not None:
+        stmt = stmt.where(Reservation.table_id == table_id)
+    return stmt
+
+def page_anchor(state: BookingListState, now: datetime) -> Tuple[datetime, int]:
+    """Ключ, с которого начинается первая страница: начало выбранного дня или сегодняшнего"""
+    day = state.day or now.date()
+    return datetime.combine(day, datetime.min.time()), 0
+
+def bookings_page_stmt(state: BookingListState, table_id: Optional[int], now: datetime, limit: int):
+    """
+    Страница по ключу (start_time, id) через индекс ix_reservations_start: читается limit + 1
+    строка (лишняя показывает, есть ли продолжение) вместе с именем и телефоном клиента
+    """
+    key = tuple_(Reservation.start_time, Reservation.id)
+    stmt = _filtered(
+        select(
+            Reservation.id, Reservation.table_id, Reservation.start_time, Reservation.end_time,
+            Reservation.status, User.name, User.phone
+        ).join(User, User.id == Reservation.user_id, isouter=True),
+        state, table_id
+    )
+    if state.direction == 'p':
+        return (
+            stmt.where(key < tuple_(*state.cursor))
+            .order_by(Reservation.start_time.desc(), Reservation.id.desc())
+            .limit(limit + 1)
+        )
+    cursor = state.cursor if state.direction == 'n' else page_anchor(state, now)
+    # Первая страница включает строку якоря, следующие начинаются строго после курсора
+    condition = key > tuple_(*cursor) if state.direction == 'n' else key >= tuple_(*cursor)
+    return stmt.where(condition).order_by(Reservation.start_time, Reservation.id).limit(limit + 1)
+
+def _exists_stmt(state: BookingListState, table_id: Optional[int], condition):
+    return select(exists(_filtered(select(Reservation.id), state, table_id).where(condition)))
+
+async def fetch_bookings_page(session, state: BookingListState, table_id: Optional[int] = None,
+                              now: datetime = None, limit: int = BOOKINGS_PAGE_SIZE) -> BookingPage:
+    """Загружает только строки страницы; есть ли соседние страницы, проверяется по индексу"""
+    now = now or datetime.now()
+    rows = (await session.execute(bookings_page_stmt(state, table_id, now, limit))).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    key = tuple_(Reservation.start_time, Reservation.id)
+
+    if state.direction == 'p':
+        rows.reverse()
+        has_prev = more
+        # На пустой странице граница — сам курсор
+        condition = key > tuple_(rows[-1].start_time, rows[-1].id) if rows else key >= tuple_(*state.cursor)
+        has_next = await session.scalar(_exists_stmt(state, table_id, condition))
+    else:
+        has_next = more
+        if rows:
+            condition = key < tuple_(rows[0].start_time, rows[0].id)
+        elif state.direction == 'n':
+            condition = key <= tuple_(*state.cursor)
+        else:
+            condition = key < tuple_(*page_anchor(state, now))
+        has_prev = await session.scalar(_exists_stmt(state, table_id, condition))
+    return BookingPage(rows, bool(has_prev), bool(has_next))
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+"""
+Архив бронирований: перенос завершенных бронирований старше горизонта
+из reservations в reservations_archive и чтение истории из обеих таблиц.
+
+Пример:
+    python archive.py --after-days 90
+    python archive.py --enable-incremental-vacuum
+"""
+import argparse
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from sqlalchemy import select, insert, delete, func, literal, union_all
+from db import async_session, engine, init_db, Reservation, ArchivedReservation
+from sqlite_tuning import incremental_vacuum, enable_incremental_vacuum
+from availability_cache import availability_cache
+from config import ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE, ARCHIVE_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Колонки, которые переносятся в архив как есть
+ARCHIVED_COLUMNS = ('id', 'table_id', 'user_id', 'start_time', 'end_time', 'status', 'created_at')
+
+@dataclass
+class ArchiveReport:
+    """Итог одного прогона архивации"""
+    moved: int
+    batches: int
+    cutoff: datetime
+    freed_pages: int
+    duration: float
+
+    def __str__(self):
+        return (f"В архив перенесено бронирований: {self.moved} ({self.batches} пакетов, {self.duration * 1000:.0f} мс), "
+                f"закончившихся до {self.cutoff.strftime('%Y-%m-%d %H:%M')}; освобождено страниц: {self.freed_pages}")
+
+def archive_candidates_stmt(cutoff: datetime, batch_size: int):
+    """ID следующего пакета: бронирования, закончившиеся до cutoff (по индексу ix_reservations_end_status)"""
+    # Последнюю по id строку не переносим: SQLite без AUTOINCREMENT выдает новым строкам
+    # max(id) + 1 и после удаления самых новых id повторились бы и совпали с архивными
+    newest = select(func.max(Reservation.id)).scalar_subquery()
+    return (
+        select(Reservation.id)
+        .where(Reservation.end_time < cutoff, Reservation.id < newest)
+        .order_by(Reservation.end_time)
+        .limit(batch_size)
+    )
+
+async def _move_batch(cutoff: datetime, batch_size: int) -> int:
+    """Копирует пакет в архив и удаляет его из reservations в одной транзакции"""
+    async with async_session() as session:
+        ids = (await session.execute(archive_candidates_stmt(cutoff, batch_size))).scalars().all()
+        if not ids:
+            return 0
+        columns = [getattr(Reservation, name) for name in ARCHIVED_COLUMNS]
+        await session.execute(
+            insert(ArchivedReservation).from_select(ARCHIVED_COLUMNS, select(*columns).where(Reservation.id.in_(ids)))
+        )
+        await session.execute(delete(Reservation).where(Reservation.id.in_(ids)).execution_options(synchronize_session=False))
+        await session.commit()
+        return len(ids)
+
+async def archive_finished_bookings(now: datetime = None, after_days: int = ARCHIVE_AFTER_DAYS,
+                                    batch_size: int = ARCHIVE_BATCH_SIZE, vacuum: bool = True) -> ArchiveReport:
+    """
+    Переносит в архив бронирования, закончившиеся раньше чем after_days дней назад,
+    пакетами по batch_size строк, затем возвращает освободившееся место (incremental_vacuum).
+    На доступность будущих слотов такие бронирования не влияют; записи кэша доступности
+    за дни до cutoff сбрасываются, чтобы кэш не расходился с таблицей reservations.
+    """
+    started = time.perf_counter()
+    cutoff = (now or datetime.now()) - timedelta(days=after_days)
+    moved = batches = 0
+    while True:
+        count = await _move_batch(cutoff, batch_size)
+        if not count:
+            break
+        batches += 1
+        moved += count
+        if count < batch_size:
+            break
+    if moved:
+        # Бронирование, закончившееся до cutoff, могло начаться в предыдущий день и занимать день cutoff
+        availability_cache.invalidate_before(cutoff.date() + timedelta(days=1))
+    freed = await incremental_vacuum(engine) if vacuum and moved else 0
+    return ArchiveReport(moved, batches, cutoff, freed, time.perf_counter() - started)
+
+def history_stmt(user_id: int = None, table_id: int = None, start: datetime = None, end: datetime = None):
+    """
+    Бронирования из основной таблицы и архива одним запросом (UNION ALL), с признаком archived.
+    Фильтры: пользователь, стол, пересечение с [start, end).
+    """
+    def part(model, archived: bool):
+        stmt = select(
+            model.id, model.table_id, model.user_id, model.start_time, model.end_time, model.status,
+            literal(archived).label('archived')
+        )
+        if user_id is not None:
+            stmt = stmt.where(model.user_id == user_id)
+        if table_id is not None:
+            stmt = stmt.where(model.table_id == table_id)
+        if start is not None:
+            stmt = stmt.where(model.end_time > start)
+        if end is not None:
+            stmt = stmt.where(model.start_time < end)
+        return stmt
+
+    return union_all(part(Reservation, False), part(ArchivedReservation, True)).subquery('history')
+
+async def fetch_history(session, user_id: int = None, table_id: int = None, start: datetime = None,
+                        end: datetime = None, newest_first: bool = False, limit: int = None):
+    """История бронирований из основной таблицы и архива, отсортированная по времени начала"""
+    history = history_stmt(user_id, table_id, start, end)
+    order = (history.c.start_time.desc(), history.c.id.desc()) if newest_first else (history.c.start_time, history.c.id)
+    stmt = select(history).order_by(*order)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return (await session.execute(stmt)).all()
+
+async def archive_loop(interval: int = ARCHIVE_INTERVAL):
+    """Фоновая задача бота: архивирует раз в interval секунд"""
+    if interval <= 0:
+        return
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            report = await archive_finished_bookings()
+            if report.moved:
+                logger.info(str(report))
+        except Exception as e:
+            logger.error(f"Ошибка при архивации бронирований: {e}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--after-days', type=int, default=ARCHIVE_AFTER_DAYS, help='Горизонт архивации в днях')
+    parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE, help='Строк в одной транзакции')
+    parser.add_argument('--enable-incremental-vacuum', action='store_true',
+                        help='Перевести существующую базу SQLite в auto_vacuum=INCREMENTAL (полный VACUUM, разово)')
+    return parser.parse_args()
+
+async def main():
+    args = parse_args()
+    await init_db()
+    if args.enable_incremental_vacuum:
+        await enable_incremental_vacuum(engine)
+        logger.info("База переведена в режим auto_vacuum=INCREMENTAL")
+    logger.info(str(await archive_finished_bookings(after_days=args.after_days, batch_size=args.batch_size)))
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    asyncio.run(main())
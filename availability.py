@@ -0,0 +1,187 @@
+import bisect
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+Interval = Tuple[datetime, datetime]
+
+# Все интервалы полуоткрытые: [start, end). Бронирования, которые
+# касаются друг друга концами (15:00-17:00 и 17:00-19:00), не пересекаются.
+
+def merge_intervals(intervals: List[Interval]) -> List[Interval]:
+    """Сортирует интервалы и объединяет пересекающиеся"""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start < merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+def free_slots(slots: List[Interval], busy: List[Interval], now: Optional[datetime] = None) -> List[Interval]:
+    """
+    Возвращает слоты, не пересекающиеся ни с одним занятым интервалом.
+    Один проход по отсортированным слотам и занятым интервалам.
+    
+    Args:
+        slots: Список слотов (start, end), отсортированный по началу
+        busy: Занятые интервалы в любом порядке
+        now: Слоты, начавшиеся раньше этого времени, не предлагаются (как в AvailabilityGrid)
+        
+    Returns:
+        List[Interval]: Свободные слоты в исходном порядке
+    """
+    busy = merge_intervals(busy)
+    result = []
+    i = 0
+    for start, end in slots:
+        if now is not None and start < now:
+            continue
+        # Пропускаем занятые интервалы, закончившиеся до начала слота
+        while i < len(busy) and busy[i][1] <= start:
+            i += 1
+        if i == len(busy) or busy[i][0] >= end:
+            result.append((start, end))
+    return result
+
+def find_conflict(start: datetime, end: datetime, busy: List[Interval]) -> Optional[Interval]:
+    """Возвращает первый занятый интервал, пересекающийся с [start, end), или None"""
+    for busy_start, busy_end in sorted(busy):
+        if busy_start >= end:
+            break
+        if busy_end > start:
+            return (busy_start, busy_end)
+    return None
+
+def _field(reservation, name):
+    """Читает поле бронирования из словаря или ORM-объекта"""
+    if isinstance(reservation, dict):
+        return reservation.get(name)
+    return getattr(reservation, name, None)
+
+class AvailabilityIndex:
+    """
+    Индекс занятости столов: для каждого стола хранится отсортированный по
+    началу список интервалов (start, end, id). Поиск пересечений выполняется
+    бинарным поиском в окне [start - самая длинная бронь, end), поэтому стоит
+    O(log n + k) вместо полного перебора.
+    
+    Индекс не зависит от базы данных: его можно держать в памяти бота и
+    обновлять при создании, подтверждении и отмене бронирований, а можно
+    построить по выгрузке для отчетов.
+    
+    По умолчанию стол занимает бронирование в любом статусе, кроме отмененного
+    (как в active_reservations_stmt и ограничении исключения PostgreSQL).
+    """
+
+    def __init__(self, statuses=None):
+        # Бронирования с этими статусами считаются занимающими стол (None — все, кроме cancelled)
+        self.statuses = frozenset(statuses) if statuses is not None else None
+        self._intervals = {}
+        self._max_duration = {}
+        self._by_id = {}
+        self._next_key = -1
+
+    @classmethod
+    def from_reservations(cls, reservations, statuses=None) -> 'AvailabilityIndex':
+        """Строит индекс по списку бронирований (словари или ORM-объекты)"""
+        index = cls(statuses)
+        for reservation in reservations:
+            index.upsert(reservation)
+        return index
+
+    def occupies(self, status) -> bool:
+        """Занимает ли стол бронирование в этом статусе"""
+        if self.statuses is None:
+            return status is not None and status != 'cancelled'
+        return status in self.statuses
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def add(self, table_id: int, start: datetime, end: datetime, reservation_id=None):
+        """Добавляет занятый интервал. Без reservation_id используется внутренний ключ"""
+        if reservation_id is None:
+            reservation_id = self._next_key
+            self._next_key -= 1
+        elif reservation_id in self._by_id:
+            self.remove(reservation_id)
+        intervals = self._intervals.setdefault(table_id, [])
+        bisect.insort(intervals, (start, end, reservation_id))
+        self._max_duration[table_id] = max(self._max_duration.get(table_id, timedelta(0)), end - start)
+        self._by_id[reservation_id] = (table_id, start, end)
+        return reservation_id
+
+    def remove(self, reservation_id) -> bool:
+        """Удаляет интервал бронирования; возвращает False, если его не было в индексе"""
+        entry = self._by_id.pop(reservation_id, None)
+        if entry is None:
+            return False
+        table_id, start, end = entry
+        intervals = self._intervals[table_id]
+        position = bisect.bisect_left(intervals, (start, end, reservation_id))
+        del intervals[position]
+        # Максимальную длительность не пересчитываем: завышенное окно поиска не влияет на результат
+        return True
+
+    def upsert(self, reservation):
+        """Синхронизирует бронирование с индексом с учетом его текущего статуса"""
+        reservation_id = _field(reservation, 'id')
+        if self.occupies(_field(reservation, 'status')):
+            return self.add(
+                _field(reservation, 'table_id'),
+                _field(reservation, 'start_time'),
+                _field(reservation, 'end_time'),
+                reservation_id
+            )
+        if reservation_id is not None:
+            self.remove(reservation_id)
+        return None
+
+    def overlaps(self, table_id: int, start: datetime, end: datetime) -> List[Interval]:
+        """Возвращает занятые интервалы стола, пересекающиеся с [start, end)"""
+        intervals = self._intervals.get(table_id)
+        if not intervals:
+            return []
+        window_start = start - self._max_duration[table_id]
+        low = bisect.bisect_right(intervals, (window_start,))
+        high = bisect.bisect_left(intervals, (end,))
+        return [(s, e) for s, e, _ in intervals[low:high] if e > start]
+
+    def is_available(self, table_id: int, start: datetime, end: datetime) -> bool:
+        return not self.overlaps(table_id, start, end)
+
+    def free_slots(self, table_id: int, slots: List[Interval]) -> List[Interval]:
+        """Фильтрует слоты стола; слоты должны быть отсортированы по началу"""
+        if not slots:
+            return []
+        return free_slots(slots, self.overlaps(table_id, slots[0][0], max(e for _, e in slots)))
+
+    def earliest_gap(self, table_id: int, duration: timedelta, not_before: datetime,
+                     not_after: Optional[datetime] = None) -> Optional[datetime]:
+        """
+        Находит самое раннее начало свободного промежутка заданной длительности
+        
+        Args:
+            table_id: ID стола
+            duration: Требуемая длительность
+            not_before: Промежуток начинается не раньше этого времени
+            not_after: Промежуток заканчивается не позже этого времени (опционально)
+            
+        Returns:
+            Optional[datetime]: Начало промежутка или None, если его нет
+        """
+        candidate = not_before
+        intervals = self._intervals.get(table_id, [])
+        if intervals:
+            low = bisect.bisect_right(intervals, (not_before - self._max_duration[table_id],))
+            for start, end, _ in intervals[low:]:
+                if start >= candidate + duration:
+                    break
+                if end > candidate:
+                    candidate = end
+                if not_after is not None and candidate + duration > not_after:
+                    return None
+        if not_after is not None and candidate + duration > not_after:
+            return None
+        return candidate
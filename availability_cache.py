@@ -0,0 +1,142 @@
+import logging
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Tuple
+from config import AVAILABILITY_CACHE_TTL
+from availability_grid import AvailabilityGrid
+from queries import day_bounds, fetch_active_reservations
+
+logger = logging.getLogger(__name__)
+
+class AvailabilityCache:
+    """
+    Кэш занятости столов в памяти процесса с ключом (ID стола, день).
+    Для каждого ключа хранятся неотмененные бронирования {id: (start, end)}.
+    
+    Пути записи (создание, подтверждение, отмена бронирований, переключение
+    стола, очистка устаревших бронирований) обновляют или сбрасывают записи
+    явно, поэтому экраны выбора стола и времени обычно читают из памяти.
+    Записи старше TTL перечитываются из базы на случай изменений из других процессов.
+    """
+
+    def __init__(self, ttl: int = AVAILABILITY_CACHE_TTL):
+        self.ttl = ttl
+        # Счетчик изменений: увеличивается при каждой записи или сбросе
+        self.version = 0
+        self._entries: Dict[Tuple[int, date], Tuple[float, Dict[int, Tuple[datetime, datetime]]]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _fresh(self, key) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and time.monotonic() - entry[0] < self.ttl
+
+    async def get_reservations(self, session, table_ids: List[int], days: List[date]) -> List[Tuple[int, datetime, datetime]]:
+        """
+        Возвращает занимающие стол бронирования [(table_id, start, end), ...] для всех пар (стол, день).
+        Отсутствующие в кэше пары загружаются одним запросом.
+        """
+        missing = [(t, d) for t in table_ids for d in days if not self._fresh((t, d))]
+        self.hits += len(table_ids) * len(days) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            await self._load(session, missing)
+
+        seen = set()
+        reservations = []
+        for table_id in table_ids:
+            for day in days:
+                entry = self._entries.get((table_id, day))
+                if entry is None:
+                    continue
+                for reservation_id, (start, end) in entry[1].items():
+                    # Бронирование через полночь попадает в два дня, возвращаем его один раз
+                    if reservation_id not in seen:
+                        seen.add(reservation_id)
+                        reservations.append((table_id, start, end))
+        return reservations
+
+    async def get_busy(self, session, table_id: int, day: date) -> List[Tuple[datetime, datetime]]:
+        """Занятые интервалы стола в указанный день"""
+        reservations = await self.get_reservations(session, [table_id], [day])
+        return sorted((start, end) for _, start, end in reservations)
+
+    async def get_grid(self, session, days: List[date], tables, slot_times, now: datetime = None) -> AvailabilityGrid:
+        """Строит сетку доступности по данным кэша (см. queries.load_availability_grid)"""
+        table_ids = [t.id for t in tables]
+        reservations = await self.get_reservations(session, table_ids, days)
+        unavailable = [t.id for t in tables if not t.is_available]
+        return AvailabilityGrid.build(days, table_ids, slot_times, reservations, unavailable, now)
+
+    async def _load(self, session, keys):
+        version = self.version
+        table_ids = sorted({t for t, _ in keys})
+        days = sorted({d for _, d in keys})
+        range_start, _ = day_bounds(days[0])
+        _, range_end = day_bounds(days[-1])
+        rows = await fetch_active_reservations(session, range_start, range_end, table_ids, with_ids=True)
+
+        loaded = {key: {} for key in keys}
+        for reservation_id, table_id, start, end in rows:
+            for day in self._days_between(start, end):
+                if (table_id, day) in loaded:
+                    loaded[(table_id, day)][reservation_id] = (start, end)
+
+        # Если во время запроса что-то изменилось, результат может быть устаревшим: не сохраняем его
+        if version != self.version:
+            logger.debug("Кэш доступности изменился во время загрузки, результат не сохранен")
+            for key, reservations in loaded.items():
+                self._entries[key] = (float('-inf'), reservations)
+            return
+        loaded_at = time.monotonic()
+        for key, reservations in loaded.items():
+            self._entries[key] = (loaded_at, reservations)
+
+    @staticmethod
+    def _days_between(start: datetime, end: datetime):
+        day = start.date()
+        while datetime.combine(day, datetime.min.time()) < end:
+            yield day
+            day += timedelta(days=1)
+
+    def upsert(self, reservation_id: int, table_id: int, start: datetime, end: datetime, status: str):
+        """Отражает создание или изменение статуса бронирования в закэшированных днях"""
+        self.version += 1
+        for day in self._days_between(start, end):
+            entry = self._entries.get((table_id, day))
+            if entry is None:
+                continue
+            if status == 'cancelled':
+                entry[1].pop(reservation_id, None)
+            else:
+                entry[1][reservation_id] = (start, end)
+
+    def upsert_reservation(self, reservation):
+        self.upsert(reservation.id, reservation.table_id, reservation.start_time, reservation.end_time, reservation.status)
+
+    def invalidate(self, table_id: int = None, day: date = None):
+        """Сбрасывает записи для стола и/или дня; без аргументов сбрасывает весь кэш"""
+        self.version += 1
+        if table_id is None and day is None:
+            self._entries.clear()
+            return
+        for key in [k for k in self._entries if (table_id is None or k[0] == table_id) and (day is None or k[1] == day)]:
+            del self._entries[key]
+
+    def invalidate_before(self, day: date):
+        """Сбрасывает записи всех столов за дни раньше day (после переноса бронирований в архив)"""
+        self.version += 1
+        for key in [k for k in self._entries if k[1] < day]:
+            del self._entries[key]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'version': self.version,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+availability_cache = AvailabilityCache()
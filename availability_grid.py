@@ -0,0 +1,97 @@
+from datetime import date, datetime, time
+from typing import List, Optional, Tuple
+import numpy as np
+
+def _to_minutes(values) -> np.ndarray:
+    """Переводит datetime в минуты от эпохи (int64) для векторных сравнений"""
+    return np.array(values, dtype='datetime64[m]').astype(np.int64)
+
+class AvailabilityGrid:
+    """
+    Сетка доступности (дни × столы × слоты) в виде булевого массива NumPy.
+    Строится по одной выгрузке бронирований и сетке слотов клуба,
+    после чего любые сводки считаются векторно, без запросов к базе.
+    """
+
+    def __init__(self, days: List[date], table_ids: List[int], slot_times: List[Tuple[time, time]], free: np.ndarray):
+        self.days = list(days)
+        self.table_ids = list(table_ids)
+        self.slot_times = list(slot_times)
+        self.free = free
+        self._day_index = {d: i for i, d in enumerate(self.days)}
+        self._table_index = {t: i for i, t in enumerate(self.table_ids)}
+
+    @classmethod
+    def build(cls, days: List[date], table_ids: List[int], slot_times: List[Tuple[time, time]],
+              reservations, unavailable_tables=(), now: Optional[datetime] = None) -> 'AvailabilityGrid':
+        """
+        Строит сетку доступности
+
+        Args:
+            days: Дни сетки
+            table_ids: ID столов сетки
+            slot_times: Сетка слотов клуба [(начало, конец), ...]
+            reservations: Занимающие стол бронирования [(table_id, start_time, end_time), ...]
+            unavailable_tables: ID столов, отключенных администратором
+            now: Слоты, начавшиеся раньше этого времени, считаются занятыми (опционально)
+
+        Returns:
+            AvailabilityGrid: Сетка, где True означает свободную ячейку
+        """
+        shape = (len(days), len(table_ids), len(slot_times))
+        if not all(shape):
+            return cls(days, table_ids, slot_times, np.zeros(shape, dtype=bool))
+
+        slot_starts = _to_minutes([datetime.combine(d, s) for d in days for s, _ in slot_times])
+        slot_ends = _to_minutes([datetime.combine(d, e) for d in days for _, e in slot_times])
+        busy = np.zeros((len(table_ids), slot_starts.size), dtype=bool)
+
+        table_index = {t: i for i, t in enumerate(table_ids)}
+        rows = [(table_index[t], s, e) for t, s, e in reservations if t in table_index]
+        if rows:
+            row_tables = np.array([r[0] for r in rows], dtype=np.intp)
+            row_starts = _to_minutes([r[1] for r in rows])
+            row_ends = _to_minutes([r[2] for r in rows])
+            # Матрица пересечений (бронирования × ячейки день-слот), интервалы полуоткрытые
+            overlap = (row_starts[:, None] < slot_ends[None, :]) & (row_ends[:, None] > slot_starts[None, :])
+            np.logical_or.at(busy, row_tables, overlap)
+
+        for table_id in unavailable_tables:
+            if table_id in table_index:
+                busy[table_index[table_id]] = True
+        if now is not None:
+            busy |= (slot_starts < _to_minutes([now])[0])[None, :]
+
+        free = ~busy.reshape(len(table_ids), len(days), len(slot_times)).transpose(1, 0, 2)
+        return cls(days, table_ids, slot_times, np.ascontiguousarray(free))
+
+    def free_slots_per_day(self, table_id: Optional[int] = None) -> np.ndarray:
+        """Количество свободных слотов по дням: для одного стола или по всем столам"""
+        if table_id is None:
+            return self.free.sum(axis=(1, 2))
+        return self.free[:, self._table_index[table_id], :].sum(axis=1)
+
+    def free_slots_per_table(self, day: date) -> np.ndarray:
+        """Количество свободных слотов каждого стола в указанный день"""
+        return self.free[self._day_index[day]].sum(axis=1)
+
+    def free_tables_per_slot(self, day: date) -> np.ndarray:
+        """Количество свободных столов в каждом слоте указанного дня"""
+        return self.free[self._day_index[day]].sum(axis=0)
+
+    def is_free(self, day: date, table_id: int, slot: int) -> bool:
+        return bool(self.free[self._day_index[day], self._table_index[table_id], slot])
+
+    def first_free_cell(self, table_id: Optional[int] = None) -> Optional[Tuple[date, int, Tuple[time, time]]]:
+        """Возвращает первую свободную ячейку (день, ID стола, слот) в хронологическом порядке"""
+        if table_id is None:
+            # Порядок обхода: день, слот, стол
+            cells = self.free.transpose(0, 2, 1)
+        else:
+            cells = self.free[:, self._table_index[table_id], :][:, :, None]
+        flat = np.flatnonzero(cells)
+        if flat.size == 0:
+            return None
+        day_i, slot_i, table_i = np.unravel_index(flat[0], cells.shape)
+        found_table = self.table_ids[table_i] if table_id is None else table_id
+        return self.days[day_i], found_table, self.slot_times[slot_i]
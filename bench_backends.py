@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""
+Бенчмарк бэкендов хранилища (db.create_backend) на одной и той же нагрузке.
+Пока N конкурентных "пользователей" бронируют и читают неделю доступности,
+отдельная корутина каждые 5 мс измеряет, насколько позже положенного она
+просыпается: большая задержка означает, что вызовы базы блокируют весь бот.
+
+Бэкенды:
+    async        — асинхронный драйвер (aiosqlite)
+    sync         — синхронный драйвер в пуле потоков
+    memory       — SQLite в памяти
+    sync-inline  — синхронный драйвер прямо в цикле событий (прежнее поведение
+                   db_pythonanywhere, для сравнения)
+
+Пример:
+    python bench_backends.py --backends async sync memory --bookings 400 --concurrency 16 --profile wal
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+from sqlalchemy.orm import Session
+from db import BACKENDS, create_backend
+from config import SQLITE_PROFILE
+from bench_storage import Stats, book, read, setup
+
+class InlineSyncSession:
+    """Прежняя обертка db_pythonanywhere: синхронные вызовы прямо в цикле событий"""
+
+    def __init__(self, engine):
+        self.session = Session(engine, expire_on_commit=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.session.close()
+
+    async def execute(self, *args, **kwargs):
+        return self.session.execute(*args, **kwargs)
+
+    async def scalar(self, *args, **kwargs):
+        return self.session.scalar(*args, **kwargs)
+
+    async def commit(self):
+        self.session.commit()
+
+    def add(self, obj):
+        self.session.add(obj)
+
+    def add_all(self, objs):
+        self.session.add_all(objs)
+
+def make_backend(name, url, profile):
+    if name == 'sync-inline':
+        backend = create_backend(url, 'sync', profile)
+        backend.async_session = lambda: InlineSyncSession(backend.engine)
+        return backend
+    return create_backend(url, name, profile)
+
+async def measure_lag(stop, lags, interval=0.005):
+    while not stop.is_set():
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, time.perf_counter() - expected))
+
+async def user(session_factory, count, seed, stats):
+    rng = random.Random(seed)
+    for _ in range(count):
+        await book(session_factory, rng, stats)
+        await read(session_factory, rng, stats)
+
+def percentile(values, p):
+    if len(values) < 2:
+        return values[0] * 1000 if values else float('nan')
+    return statistics.quantiles(values, n=100, method='inclusive')[p - 1] * 1000
+
+async def run_backend(name, url, args):
+    backend = make_backend(name, url, args.profile)
+    await setup(backend)
+
+    stats = Stats()
+    lags = []
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(measure_lag(stop, lags))
+    started = time.perf_counter()
+    await asyncio.gather(*[
+        user(backend.async_session, args.bookings // args.concurrency, i, stats) for i in range(args.concurrency)
+    ])
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await ticker
+    await backend.dispose()
+
+    ops = len(stats.latencies['book']) + len(stats.latencies['read'])
+    print(f"{name:<12} {ops / elapsed:>8.0f} оп/с  "
+          f"бронь p95 {percentile(stats.latencies['book'], 95):6.1f} мс  "
+          f"чтение p95 {percentile(stats.latencies['read'], 95):6.1f} мс  "
+          f"задержка цикла: p99 {percentile(lags, 99):6.2f} мс, максимум {max(lags) * 1000:7.2f} мс  "
+          f"locked {stats.locked}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    choices = list(BACKENDS) + ['sync-inline']
+    parser.add_argument('--backends', nargs='+', default=choices, choices=choices)
+    parser.add_argument('--profile', default=SQLITE_PROFILE, help='Профиль PRAGMA из config.SQLITE_PROFILES')
+    parser.add_argument('--bookings', type=int, default=400, help='Количество бронирований (и столько же чтений)')
+    parser.add_argument('--concurrency', type=int, default=16, help='Конкурентных пользователей')
+    return parser.parse_args()
+
+async def main():
+    args = parse_args()
+    for name in args.backends:
+        # У каждого бэкенда своя временная база, чтобы результаты не влияли друг на друга
+        with tempfile.TemporaryDirectory() as directory:
+            await run_backend(name, f"sqlite:///{os.path.join(directory, 'bench.db')}", args)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""
+Бенчмарк маршрутизации нажатий кнопок: Router (словарь действий, дерево для старых
+данных) против прежней цепочки CallbackQueryHandler, которые PTB проверял по очереди
+регулярными выражениями до первого совпадения. Измеряется только выбор обработчика,
+без самих обработчиков: время на одно обновление для каждой кнопки и для смеси нажатий.
+
+Пример:
+    python bench_router.py --rounds 20000
+"""
+import argparse
+import os
+import time
+
+os.environ.setdefault('ADMIN_IDS', '1')
+
+from telegram import Update
+from telegram.ext import CallbackQueryHandler
+import bot
+from router import cb
+
+async def _noop(update, context):
+    pass
+
+# Прежняя регистрация обработчиков кнопок (порядок важен: первое совпадение выигрывает)
+OLD_PATTERNS = [
+    "register", "book", r"^(my_bookings|mb:)", r"^cancel_my_booking_\d+$", "admin_panel", "manage_tables",
+    "toggle_table_", "club_settings", r"^(all_bookings|ab:)", r"^(occupancy|occ:)", r"^confirm_booking_\d+$",
+    r"^cancel_booking_\d+$", "set_opening", "set_closing", "set_duration", r"^select_table_\d+$",
+    r"^select_date_\d{4}-\d{2}-\d{2}$", r"^select_time_[\d\.]+_[\d\.]+$", "confirm_booking", "back_to_main",
+]
+
+# Нажатия в сценарии бронирования и администрирования: (старые данные, данные v1)
+CLICKS = [
+    ("book", cb("book")),
+    ("select_table_3", cb("table", 3)),
+    ("select_date_2030-01-15", cb("date", "2030-01-15")),
+    ("select_time_1894694400.0_1894701600.0", cb("time", 1894694400.0, 1894701600.0)),
+    ("confirm_booking", cb("confirm")),
+    ("back_to_main", cb("menu")),
+    ("my_bookings", cb("mb")),
+    ("mb:u:1894694400:812", cb("mb", "u", 1894694400, 812)),
+    ("admin_panel", cb("admin")),
+    ("ab:20300115:p:3:n:1894636800:812", cb("ab", "20300115", "p", 3, "n", 1894636800, 812)),
+    ("confirm_booking_812", cb("adm_confirm", 812)),
+]
+
+def make_update(data: str) -> Update:
+    return Update.de_json({'update_id': 1, 'callback_query': {
+        'id': '1', 'chat_instance': '-1', 'data': data,
+        'from': {'id': 1, 'is_bot': False, 'first_name': 'Иван'}}}, None)
+
+def old_route(handlers, update):
+    """Как Application.process_update: check_update каждого обработчика до первого совпадения"""
+    for position, handler in enumerate(handlers):
+        if handler.check_update(update):
+            return position
+    return None
+
+def measure(fn, rounds: int) -> float:
+    """Наносекунды на вызов"""
+    started = time.perf_counter_ns()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter_ns() - started) / rounds
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=20000, help='Повторов на каждую кнопку')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    old_handlers = [CallbackQueryHandler(_noop, pattern=pattern) for pattern in OLD_PATTERNS]
+    router = bot.build_router()
+
+    print(f"{'кнопка':40} {'цепочка, нс':>12} {'проверок':>9} {'v1, нс':>8} {'старые, нс':>11}")
+    totals = [0.0, 0.0, 0.0]
+    for legacy, data in CLICKS:
+        old_update, new_update = make_update(legacy), make_update(data)
+        position = old_route(old_handlers, old_update)
+        assert router.resolve(data) and router.resolve(legacy), data
+        results = (
+            measure(lambda: old_route(old_handlers, old_update), args.rounds),
+            measure(lambda: router.resolve(new_update.callback_query.data), args.rounds),
+            measure(lambda: router.resolve(old_update.callback_query.data), args.rounds),
+        )
+        totals = [total + value for total, value in zip(totals, results)]
+        checks = position + 1 if position is not None else len(old_handlers)
+        print(f"{legacy:40} {results[0]:12.0f} {checks:9} {results[1]:8.0f} {results[2]:11.0f}")
+    count = len(CLICKS)
+    print(f"{'среднее по смеси':40} {totals[0] / count:12.0f} {'':9} {totals[1] / count:8.0f} {totals[2] / count:11.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+"""
+Бенчмарк хранилища: конкурентные бронирования, чтения доступности и
+массовая очистка на временной базе SQLite с разными профилями PRAGMA.
+
+Пример:
+    python bench_storage.py --profiles default wal durable --bookings 400 --writers 8 --readers 8
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, func
+from sqlalchemy.exc import OperationalError
+from db import User, Table, Reservation, create_backend
+from config import SQLITE_PROFILES
+from queries import active_reservations_stmt, active_reservations_range_stmt
+
+TABLES = 9
+BASE_TIME = datetime(2030, 1, 1, 15, 0)
+
+class Stats:
+    def __init__(self):
+        self.latencies = {'book': [], 'read': []}
+        self.locked = 0
+        self.conflicts = 0
+
+async def setup(backend):
+    await backend.create_schema()
+    async with backend.async_session() as session:
+        session.add_all([Table(number=n, is_available=True) for n in range(1, TABLES + 1)])
+        session.add_all([User(telegram_id=1000 + n, name=f"user{n}", phone="-") for n in range(50)])
+        await session.commit()
+
+async def book(session_factory, rng, stats):
+    """Проверка пересечения и вставка, как в confirm_booking"""
+    table_id = rng.randrange(1, TABLES + 1)
+    start = BASE_TIME + timedelta(days=rng.randrange(0, 60), hours=2 * rng.randrange(0, 3))
+    end = start + timedelta(hours=2)
+    started = time.perf_counter()
+    try:
+        async with session_factory() as session:
+            busy = (await session.execute(active_reservations_stmt(table_id, start, end))).all()
+            if busy:
+                stats.conflicts += 1
+            else:
+                session.add(Reservation(table_id=table_id, user_id=rng.randrange(1, 51),
+                                        start_time=start, end_time=end, status='pending'))
+                await session.commit()
+    except OperationalError as e:
+        if 'locked' not in str(e):
+            raise
+        stats.locked += 1
+        return
+    stats.latencies['book'].append(time.perf_counter() - started)
+
+async def read(session_factory, rng, stats):
+    """Выгрузка недели для сетки доступности, как в select_table"""
+    start = BASE_TIME + timedelta(days=rng.randrange(0, 53))
+    started = time.perf_counter()
+    try:
+        async with session_factory() as session:
+            (await session.execute(active_reservations_range_stmt(start, start + timedelta(days=7)))).all()
+    except OperationalError as e:
+        if 'locked' not in str(e):
+            raise
+        stats.locked += 1
+        return
+    stats.latencies['read'].append(time.perf_counter() - started)
+
+async def cleanup(session_factory, stop, stats):
+    """Периодическая массовая запись, как в cleanup_expired_bookings"""
+    while not stop.is_set():
+        try:
+            async with session_factory() as session:
+                await session.execute(
+                    update(Reservation)
+                    .where(Reservation.end_time < BASE_TIME + timedelta(days=30), Reservation.status == 'pending')
+                    .values(status='expired')
+                )
+                await session.commit()
+        except OperationalError as e:
+            if 'locked' not in str(e):
+                raise
+            stats.locked += 1
+        await asyncio.sleep(0.05)
+
+async def worker(operation, session_factory, count, seed, stats):
+    rng = random.Random(seed)
+    for _ in range(count):
+        await operation(session_factory, rng, stats)
+
+async def run_profile(url, profile, args):
+    backend = create_backend(url, 'async', profile)
+    session_factory = backend.async_session
+    await setup(backend)
+
+    stats = Stats()
+    stop = asyncio.Event()
+    cleaner = asyncio.create_task(cleanup(session_factory, stop, stats))
+    started = time.perf_counter()
+    tasks = [worker(book, session_factory, args.bookings // args.writers, i, stats) for i in range(args.writers)]
+    tasks += [worker(read, session_factory, args.reads // args.readers, 100 + i, stats) for i in range(args.readers)]
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await cleaner
+
+    async with session_factory() as session:
+        rows = await session.scalar(select(func.count()).select_from(Reservation))
+    await backend.dispose()
+    return stats, elapsed, rows
+
+def percentile(values, p):
+    if not values:
+        return float('nan')
+    return statistics.quantiles(values, n=100, method='inclusive')[p - 1] * 1000 if len(values) > 1 else values[0] * 1000
+
+def report(name, stats, elapsed, rows):
+    ops = len(stats.latencies['book']) + len(stats.latencies['read'])
+    print(f"{name:<10} {ops / elapsed:>8.0f} оп/с  "
+          f"бронь p50 {percentile(stats.latencies['book'], 50):6.1f} мс p95 {percentile(stats.latencies['book'], 95):6.1f} мс  "
+          f"чтение p95 {percentile(stats.latencies['read'], 95):6.1f} мс  "
+          f"locked {stats.locked:>4}  конфликты {stats.conflicts:>4}  строк {rows}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profiles', nargs='+', default=list(SQLITE_PROFILES), help='Профили из config.SQLITE_PROFILES')
+    parser.add_argument('--bookings', type=int, default=400, help='Количество попыток бронирования')
+    parser.add_argument('--reads', type=int, default=800, help='Количество чтений недели')
+    parser.add_argument('--writers', type=int, default=8, help='Конкурентных писателей')
+    parser.add_argument('--readers', type=int, default=8, help='Конкурентных читателей')
+    return parser.parse_args()
+
+async def main():
+    args = parse_args()
+    for profile in args.profiles:
+        with tempfile.TemporaryDirectory() as directory:
+            url = f"sqlite+aiosqlite:///{os.path.join(directory, 'bench.db')}"
+            report(profile, *await run_profile(url, profile, args))
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+"""
+Бенчмарк получения обновлений: webhook (WebhookServer) против long polling на одной машине.
+Записанные обновления Telegram (JSON) подаются в бота с заданной частотой:
+в режиме webhook — POST-запросами на локальный сервер, в режиме polling — через
+ответы getUpdates. Bot API заменен локальной заглушкой с задержкой --api-latency,
+бот работает с настоящими обработчиками и временной базой SQLite.
+
+Задержка — от появления обновления до первого ответа бота на него
+(sendMessage, editMessageText или answerCallbackQuery).
+
+Пример:
+    python bench_webhook.py --mode both --updates 2000 --rate 200 --concurrency 8
+    python bench_webhook.py --mode webhook --updates-file recorded.json
+"""
+import argparse
+import asyncio
+import copy
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# База и администраторы задаются до импорта бота: db создает движок при импорте
+BENCH_DB = os.path.join(tempfile.mkdtemp(prefix='bench_webhook_'), 'bench.db')
+os.environ.setdefault('DATABASE_URL', f'sqlite+aiosqlite:///{BENCH_DB}')
+os.environ.setdefault('ADMIN_IDS', '1')
+os.environ.setdefault('EXPIRY_INTERVAL', '0')
+
+from telegram.request import BaseRequest
+
+TOKEN = '123456:BENCH'
+BOT_USER = {'id': 123456, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+FIRST_USER_ID = 10_000
+
+# Записанные обновления (сокращенные): команды и нажатие кнопки "Мои бронирования"
+RECORDED_UPDATES = [
+    {'update_id': 0, 'message': {
+        'message_id': 1, 'date': 1700000000, 'text': '/start',
+        'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}],
+        'chat': {'id': 0, 'type': 'private', 'first_name': 'Иван'},
+        'from': {'id': 0, 'is_bot': False, 'first_name': 'Иван', 'language_code': 'ru'}}},
+    {'update_id': 0, 'message': {
+        'message_id': 2, 'date': 1700000000, 'text': '/help',
+        'entities': [{'type': 'bot_command', 'offset': 0, 'length': 5}],
+        'chat': {'id': 0, 'type': 'private', 'first_name': 'Иван'},
+        'from': {'id': 0, 'is_bot': False, 'first_name': 'Иван', 'language_code': 'ru'}}},
+    {'update_id': 0, 'callback_query': {
+        'id': '0', 'chat_instance': '-1', 'data': 'my_bookings',
+        'from': {'id': 0, 'is_bot': False, 'first_name': 'Иван', 'language_code': 'ru'},
+        'message': {'message_id': 3, 'date': 1700000000, 'text': 'Главное меню:',
+                    'chat': {'id': 0, 'type': 'private', 'first_name': 'Иван'}, 'from': BOT_USER}}},
+]
+
+def make_updates(count: int, users: int, templates=None):
+    """Обновления по шаблонам; у каждого свой update_id, пользователь — по кругу из users"""
+    templates = templates or RECORDED_UPDATES
+    updates = []
+    for i in range(count):
+        update = copy.deepcopy(templates[i % len(templates)])
+        update['update_id'] = i + 1
+        user_id = FIRST_USER_ID + i % users
+        for key in ('message', 'callback_query'):
+            if key in update:
+                update[key]['from']['id'] = user_id
+                message = update[key] if key == 'message' else update[key]['message']
+                message['chat']['id'] = user_id
+                if key == 'callback_query':
+                    update[key]['id'] = str(i + 1)
+        updates.append(update)
+    return updates
+
+class LocalBotApi(BaseRequest):
+    """
+    Заглушка Bot API: отвечает на вызовы с задержкой latency, отдает обновления
+    через getUpdates и отмечает время первого ответа бота на каждое обновление
+    """
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.polling_queue = asyncio.Queue()
+        self.arrived = {}
+        self.answered = {}
+        self.pending_by_chat = {}
+        self.calls = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def arrive(self, update: dict):
+        """Обновление появилось в Telegram"""
+        self.arrived[update['update_id']] = time.perf_counter()
+        if 'callback_query' in update:
+            self.pending_by_chat[('cb', update['callback_query']['id'])] = update['update_id']
+        else:
+            self.pending_by_chat.setdefault(('chat', update['message']['chat']['id']), []).append(update['update_id'])
+
+    def _answered(self, method: str, params: dict):
+        if method == 'answerCallbackQuery':
+            update_id = self.pending_by_chat.pop(('cb', str(params.get('callback_query_id'))), None)
+        elif method in ('sendMessage', 'editMessageText'):
+            waiting = self.pending_by_chat.get(('chat', int(params.get('chat_id', 0))))
+            update_id = waiting.pop(0) if waiting else None
+        else:
+            return
+        if update_id is not None and update_id not in self.answered:
+            self.answered[update_id] = time.perf_counter()
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls += 1
+        if api_method == 'getUpdates':
+            timeout = float(params.get('timeout') or 0)
+            try:
+                first = await asyncio.wait_for(self.polling_queue.get(), timeout=max(timeout, 0.01))
+            except asyncio.TimeoutError:
+                return 200, json.dumps({'ok': True, 'result': []}).encode()
+            batch = [first]
+            while not self.polling_queue.empty() and len(batch) < 100:
+                batch.append(self.polling_queue.get_nowait())
+            await asyncio.sleep(self.latency)
+            return 200, json.dumps({'ok': True, 'result': batch}).encode()
+
+        await asyncio.sleep(self.latency)
+        self._answered(api_method, params)
+        if api_method == 'getMe':
+            result = BOT_USER
+        elif api_method in ('sendMessage', 'editMessageText'):
+            chat_id = int(params.get('chat_id', 0))
+            result = {'message_id': 100, 'date': int(time.time()), 'text': params.get('text', ''),
+                      'chat': {'id': chat_id, 'type': 'private'}, 'from': BOT_USER}
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+async def seed_users(users: int):
+    """Половина пользователей зарегистрирована: /start читает их из базы и показывает меню"""
+    from db import async_session, User
+    async with async_session() as session:
+        session.add_all([
+            User(telegram_id=FIRST_USER_ID + i, name=f'Клиент {i}', phone='+70000000000')
+            for i in range(0, users, 2)
+        ])
+        await session.commit()
+
+async def offer(updates, rate: float, deliver):
+    """Подает обновления с частотой rate в секунду (0 — все сразу)"""
+    started = time.perf_counter()
+    tasks = []
+    for i, update in enumerate(updates):
+        if rate:
+            delay = started + i / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(deliver(update)))
+    await asyncio.gather(*tasks)
+
+async def wait_answered(api: LocalBotApi, count: int, timeout: float):
+    deadline = time.perf_counter() + timeout
+    while len(api.answered) < count and time.perf_counter() < deadline:
+        await asyncio.sleep(0.01)
+
+async def run_mode(args):
+    import bot
+    from db import init_db
+    from webhook_server import WebhookServer, SECRET_HEADER
+
+    await init_db()
+    await seed_users(args.users)
+    if args.updates_file:
+        with open(args.updates_file, encoding='utf-8') as f:
+            templates = json.load(f)
+    else:
+        templates = None
+    updates = make_updates(args.updates, args.users, templates)
+
+    api = LocalBotApi(args.api_latency / 1000)
+    app = bot.build_application(TOKEN, args.mode, args.concurrency, request=api)
+    await app.initialize()
+    await app.start()
+    server = None
+    if args.mode == 'webhook':
+        import aiohttp
+        server = WebhookServer(app, listen='127.0.0.1', port=free_port())
+        await server.start()
+        url = f'http://127.0.0.1:{server.port}{server.path}'
+        # Как Telegram: не больше max_connections одновременных запросов
+        connections = asyncio.Semaphore(args.connections)
+        async with aiohttp.ClientSession(headers={SECRET_HEADER: server.secret_token}) as http:
+            async def deliver(update):
+                async with connections:
+                    api.arrive(update)
+                    async with http.post(url, json=update) as response:
+                        response.raise_for_status()
+
+            started = time.perf_counter()
+            await offer(updates, args.rate, deliver)
+            await wait_answered(api, len(updates), args.timeout)
+    else:
+        await app.updater.start_polling(poll_interval=0.0, timeout=10)
+
+        async def deliver(update):
+            api.arrive(update)
+            api.polling_queue.put_nowait(update)
+
+        started = time.perf_counter()
+        await offer(updates, args.rate, deliver)
+        await wait_answered(api, len(updates), args.timeout)
+    elapsed = time.perf_counter() - started
+
+    await bot.stop_receiving(app, server)
+    await app.stop()
+    await app.shutdown()
+
+    latencies = sorted((api.answered[i] - api.arrived[i]) * 1000 for i in api.answered)
+    result = {
+        'mode': args.mode,
+        'updates': len(updates),
+        'answered': len(latencies),
+        'throughput': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(statistics.median(latencies), 1) if latencies else None,
+        'p95_ms': round(statistics.quantiles(latencies, n=100, method='inclusive')[94], 1) if len(latencies) > 1 else None,
+        'p99_ms': round(statistics.quantiles(latencies, n=100, method='inclusive')[98], 1) if len(latencies) > 1 else None,
+        'max_ms': round(latencies[-1], 1) if latencies else None,
+        'api_calls': api.calls,
+    }
+    if server:
+        result['server'] = server.stats()
+    if hasattr(app.update_processor, 'stats'):
+        result['processor'] = app.update_processor.stats()
+    return result
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=('webhook', 'polling', 'both'), default='both')
+    parser.add_argument('--updates', type=int, default=1000, help='Сколько обновлений подать')
+    parser.add_argument('--updates-file', help='JSON-список записанных обновлений вместо встроенных шаблонов')
+    parser.add_argument('--users', type=int, default=200, help='Сколько разных пользователей')
+    parser.add_argument('--rate', type=float, default=200, help='Обновлений в секунду (0 — все сразу)')
+    parser.add_argument('--concurrency', type=int, default=8, help='UPDATE_CONCURRENCY бота')
+    parser.add_argument('--connections', type=int, default=40, help='Одновременных POST-запросов (webhook)')
+    parser.add_argument('--api-latency', type=float, default=30, help='Задержка ответа Bot API, мс')
+    parser.add_argument('--timeout', type=float, default=120, help='Сколько ждать ответов на все обновления, с')
+    parser.add_argument('--json', action='store_true', help='Вывести результат одной строкой JSON')
+    return parser.parse_args()
+
+def print_result(result: dict):
+    print(f"{result['mode']:8} обработано {result['answered']}/{result['updates']}, {result['throughput']} обн/с, "
+          f"задержка p50 {result['p50_ms']} мс, p95 {result['p95_ms']} мс, p99 {result['p99_ms']} мс, "
+          f"макс. {result['max_ms']} мс")
+    if 'server' in result:
+        print(f"         сервер: {result['server']}")
+    if 'processor' in result:
+        stats = {k: v for k, v in result['processor'].items() if k != 'slowest_lanes'}
+        print(f"         обработка: {stats}")
+
+def main():
+    args = parse_args()
+    if args.mode != 'both':
+        result = asyncio.run(run_mode(args))
+        print(json.dumps(result) if args.json else '', end='\n' if args.json else '')
+        if not args.json:
+            print_result(result)
+        return
+    # Каждый режим — в отдельном процессе: свои кэши, своя база, свой цикл событий
+    for mode in ('polling', 'webhook'):
+        argv = [a for a in sys.argv[1:]]
+        if '--mode' in argv:
+            del argv[argv.index('--mode'):argv.index('--mode') + 2]
+        output = subprocess.run(
+            [sys.executable, __file__, '--mode', mode, '--json', *argv],
+            capture_output=True, text=True, env={k: v for k, v in os.environ.items() if k != 'DATABASE_URL'}
+        )
+        if output.returncode:
+            print(output.stderr, file=sys.stderr)
+            continue
+        print_result(json.loads(output.stdout.strip().splitlines()[-1]))
+
+if __name__ == "__main__":
+    main()
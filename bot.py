@@ -1,26 +1,48 @@
 import logging
 import asyncio
+import signal
+from contextlib import nullcontext
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, BotCommand
+from telegram.error import BadRequest
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes
-from db import async_session, User, Table, Reservation, ClubSettings, init_db
-from utils import create_table_layout_image, get_time_slots, format_time_slot, is_slot_available
-from config import BOT_TOKEN, ADMIN_IDS, get_club_settings
+from db import async_session, engine, User, Table, Reservation, ClubSettings, init_db
+from utils import get_table_layout_key, format_table_layout_key, format_time_slot, is_slot_available
+from photo_registry import photo_registry
+from render_service import render_service
+from notifications import notification_dispatcher
+from outbox import outbox_worker, enqueue, enqueue_many
+from webhook_server import WebhookServer
+from router import Router, cb, set_input_state, clear_input_state
+from update_processor import PerUserUpdateProcessor
+from availability import free_slots
+from queries import load_availability_index
+from availability_cache import availability_cache
+from settings_cache import settings_cache, ClubSettingsSnapshot
+from user_cache import user_cache, UserRecord
+from table_catalog import table_catalog
+from sqlite_tuning import wal_checkpoint_loop
+from expiry import expiry_loop
+from archive import archive_loop
+from occupancy import is_counted, record_transition, backfill_occupancy_if_empty, fetch_occupancy, occupancy_buckets
+from admin_bookings import BookingListState, STATUS_CYCLE, fetch_bookings_page
+from user_bookings import UserBookingsCursor, CANCELLABLE_STATUSES, fetch_user_bookings
+from config import (
+    BOT_TOKEN, ADMIN_IDS, BOT_MODE, WEBHOOK_URL, WEBHOOK_MAX_CONNECTIONS, UPDATE_CONCURRENCY
+)
 from sqlalchemy import select
-from sqlalchemy.orm import joinedload
+from sqlalchemy.exc import IntegrityError
 
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Блокировки столов на время проверки слота и записи бронирования
+table_booking_locks = defaultdict(asyncio.Lock)
+
 async def is_admin(user_id: int) -> bool:
     return user_id in ADMIN_IDS
 
-async def notify_admins(context: ContextTypes.DEFAULT_TYPE, message: str):
-    for admin_id in ADMIN_IDS:
-        try:
-            await context.bot.send_message(chat_id=admin_id, text=message)
-        except Exception as e:
-            logger.error(f"Ошибка при отправке уведомления администратору {admin_id}: {e}")
-
 async def safe_edit_message(update: Update, text: str, reply_markup=None):
     """
     Безопасно редактирует сообщение, учитывая его тип (текст или фото)
@@ -49,26 +71,86 @@ async def safe_edit_message(update: Update, text: str, reply_markup=None):
         # В случае ошибки отправляем новое сообщение
         return await message.reply_text(text, reply_markup=reply_markup)
 
+async def send_table_layout(message, table_states, caption: str, reply_markup=None):
+    """
+    Отправляет схему столов, повторно используя file_id ранее загруженного изображения.
+    Если Telegram отклоняет сохраненный file_id, изображение загружается заново.
+    
+    Args:
+        message: Сообщение, в ответ на которое отправляется схема
+        table_states: Список словарей с номерами и доступностью столов
+        caption: Подпись к изображению
+        reply_markup: Клавиатура (опционально)
+    """
+    key = format_table_layout_key(get_table_layout_key(table_states))
+    file_id = photo_registry.get(key)
+    if file_id:
+        try:
+            return await message.reply_photo(photo=file_id, caption=caption, reply_markup=reply_markup)
+        except BadRequest as e:
+            logger.warning(f"Telegram отклонил сохраненный file_id для {key}: {e}")
+            await photo_registry.forget(key)
+    
+    img_bytes = await render_service.render_table_layout(table_states)
+    sent = await message.reply_photo(photo=img_bytes, caption=caption, reply_markup=reply_markup)
+    if sent and sent.photo:
+        await photo_registry.remember(key, sent.photo[-1].file_id)
+    return sent
+
+def free_badge(count) -> str:
+    return f"своб. {count}" if count else "занято"
+
+def build_table_keyboard(tables, free_counts=None):
+    """
+    Клавиатура выбора стола: доступные столы по 3 в ряд
+    
+    Args:
+        tables: Список столов
+        free_counts: Словарь {ID стола: число свободных слотов сегодня} (опционально)
+    """
+    keyboard = []
+    row = []
+    for table in tables:
+        if not table.is_available:
+            continue
+        label = f"Стол {table.number}"
+        if free_counts is not None:
+            label += f" · {free_badge(free_counts.get(table.id, 0))}"
+        row.append(InlineKeyboardButton(label, callback_data=cb("table", table.number)))
+        if len(row) == 3:  # Максимум 3 кнопки в ряду
+            keyboard.append(row)
+            row = []
+    if row:  # Добавляем оставшиеся кнопки
+        keyboard.append(row)
+    keyboard.append([InlineKeyboardButton("Назад", callback_data=cb("menu"))])
+    return InlineKeyboardMarkup(keyboard)
+
+async def count_free_slots_today(session, tables) -> dict:
+    """Число оставшихся на сегодня свободных слотов для каждого стола"""
+    now = datetime.now()
+    slot_times = await settings_cache.get_slot_times()
+    grid = await availability_cache.get_grid(session, [now.date()], tables, slot_times, now=now)
+    return dict(zip(grid.table_ids, grid.free_slots_per_table(now.date()).tolist()))
+
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    async with async_session() as session:
-        user = await session.scalar(select(User).where(User.telegram_id == update.effective_user.id))
-        if not user:
-            keyboard = [[InlineKeyboardButton("Зарегистрироваться", callback_data="register")]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await update.message.reply_text(
-                f"Привет, {update.effective_user.first_name}! Для использования бота необходимо зарегистрироваться.",
-                reply_markup=reply_markup
-            )
-        else:
-            await show_main_menu(update, context)
+    user = await user_cache.get(update.effective_user.id)
+    if not user:
+        keyboard = [[InlineKeyboardButton("Зарегистрироваться", callback_data=cb("register"))]]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        await update.message.reply_text(
+            f"Привет, {update.effective_user.first_name}! Для использования бота необходимо зарегистрироваться.",
+            reply_markup=reply_markup
+        )
+    else:
+        await show_main_menu(update, context)
 
 async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     keyboard = [
-        [InlineKeyboardButton("Забронировать стол", callback_data="book")],
-        [InlineKeyboardButton("Мои бронирования", callback_data="my_bookings")]
+        [InlineKeyboardButton("Забронировать стол", callback_data=cb("book"))],
+        [InlineKeyboardButton("Мои бронирования", callback_data=cb("mb"))]
     ]
     if await is_admin(update.effective_user.id):
-        keyboard.append([InlineKeyboardButton("Админ панель", callback_data="admin_panel")])
+        keyboard.append([InlineKeyboardButton("Админ панель", callback_data=cb("admin"))])
     reply_markup = InlineKeyboardMarkup(keyboard)
     
     if update.message:
@@ -79,6 +161,7 @@ async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def register_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.callback_query.answer()
     context.user_data['registration'] = {'step': 'name'}
+    set_input_state(context, 'registration')
     await update.callback_query.edit_message_text("Пожалуйста, введите ваше имя:")
 
 async def process_registration(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -109,6 +192,7 @@ async def process_registration(update: Update, context: ContextTypes.DEFAULT_TYP
                 existing_user.name = name
                 existing_user.phone = phone
                 await session.commit()
+                user_cache.put(UserRecord.from_model(existing_user))
                 await update.message.reply_text(f"Ваши данные обновлены, {name}!")
             else:
                 # Если пользователь не существует, создаем нового
@@ -120,10 +204,12 @@ async def process_registration(update: Update, context: ContextTypes.DEFAULT_TYP
                 )
                 session.add(user)
                 await session.commit()
+                user_cache.put(UserRecord.from_model(user))
                 await update.message.reply_text(f"Спасибо за регистрацию, {name}!")
         
         # Очищаем данные регистрации
         context.user_data.pop('registration', None)
+        clear_input_state(context)
         
         # Показываем главное меню
         await show_main_menu(update, context)
@@ -131,54 +217,52 @@ async def process_registration(update: Update, context: ContextTypes.DEFAULT_TYP
 async def book_table(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.callback_query.answer()
     
+    # Получаем все столы из каталога
+    catalog = await table_catalog.get()
+    tables = catalog.tables
+    table_states = catalog.table_states()
+    
     async with async_session() as session:
-        # Получаем все столы
-        tables = (await session.execute(select(Table))).scalars().all()
-        table_states = [{'number': t.number, 'is_available': t.is_available} for t in tables]
-        
-        # Создаем изображение с расположением столов
-        img_bytes = create_table_layout_image(table_states)
-        
-        # Создаем клавиатуру для выбора стола
-        keyboard = []
-        row = []
-        for i, table in enumerate(tables):
-            if table.is_available:
-                button = InlineKeyboardButton(f"Стол {table.number}", callback_data=f"select_table_{table.number}")
-                row.append(button)
-                if (i + 1) % 3 == 0 or i == len(tables) - 1:
-                    keyboard.append(row)
-                    row = []
-        
-        keyboard.append([InlineKeyboardButton("Назад", callback_data="back_to_main")])
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        # Создаем клавиатуру для выбора стола с числом свободных слотов на сегодня
+        reply_markup = build_table_keyboard(tables, await count_free_slots_today(session, tables))
         
         # Отправляем изображение и клавиатуру
-        await update.callback_query.message.reply_photo(
-            photo=img_bytes,
-            caption="Выберите доступный стол для бронирования:",
-            reply_markup=reply_markup
+        await send_table_layout(
+            update.callback_query.message,
+            table_states,
+            "Выберите доступный стол для бронирования:",
+            reply_markup
         )
 
 async def select_table(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.callback_query.answer()
     
-    # Получаем номер стола из callback_data
-    table_number = int(update.callback_query.data.split('_')[-1])
+    # Номер стола — аргумент кнопки
+    table_number = int(context.args[0])
     context.user_data['selected_table'] = table_number
     
     # Получаем текущую дату и доступные слоты
-    from datetime import datetime, timedelta
-    today = datetime.now().date()
-    dates = [today + timedelta(days=i) for i in range(7)]  # Показываем на неделю вперед
+    now = datetime.now()
+    dates = [now.date() + timedelta(days=i) for i in range(7)]  # Показываем на неделю вперед
+    
+    # Считаем свободные слоты стола на всю неделю одной выгрузкой
+    free_per_day = None
+    table = (await table_catalog.get()).by_number.get(table_number)
+    if table:
+        async with async_session() as session:
+            slot_times = await settings_cache.get_slot_times()
+            grid = await availability_cache.get_grid(session, dates, [table], slot_times, now=now)
+            free_per_day = grid.free_slots_per_day(table.id).tolist()
     
     # Создаем клавиатуру для выбора даты
     keyboard = []
-    for date in dates:
+    for i, date in enumerate(dates):
         date_str = date.strftime("%d.%m.%Y")
-        keyboard.append([InlineKeyboardButton(date_str, callback_data=f"select_date_{date.strftime('%Y-%m-%d')}")])
+        if free_per_day is not None:
+            date_str += f" · {free_badge(free_per_day[i])}"
+        keyboard.append([InlineKeyboardButton(date_str, callback_data=cb("date", date.strftime('%Y-%m-%d')))])
     
-    keyboard.append([InlineKeyboardButton("Назад", callback_data="book")])
+    keyboard.append([InlineKeyboardButton("Назад", callback_data=cb("book"))])
     reply_markup = InlineKeyboardMarkup(keyboard)
     
     await safe_edit_message(update, f"Выбран стол {table_number}. Выберите дату бронирования:", reply_markup)
@@ -186,54 +270,27 @@ async def select_table(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def select_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.callback_query.answer()
     
-    # Получаем выбранную дату из callback_data
-    date_str = update.callback_query.data.split('_')[-1]
+    # Выбранная дата — аргумент кнопки
+    date_str = context.args[0]
     context.user_data['selected_date'] = date_str
     
-    # Получаем настройки клуба для определения доступных слотов
-    async with async_session() as session:
-        club_settings = await session.scalar(select(ClubSettings))
-        if not club_settings:
-            # Используем настройки по умолчанию, если в базе нет
-            from config import get_club_settings
-            default_settings = get_club_settings()
-            opening_time = default_settings["opening_time"]
-            closing_time = default_settings["closing_time"]
-            slot_duration = default_settings["slot_duration"]
-        else:
-            opening_time = club_settings.opening_time
-            closing_time = club_settings.closing_time
-            slot_duration = club_settings.slot_duration
-    
     # Получаем доступные слоты для выбранной даты и стола
-    from datetime import datetime
     selected_date = datetime.strptime(date_str, "%Y-%m-%d").date()
     table_number = context.user_data['selected_table']
     
-    # Получаем все слоты для этого дня
-    time_slots = get_time_slots(opening_time, closing_time, slot_duration)
+    # Получаем все слоты для этого дня (сетка слотов берется из кэша настроек клуба)
+    time_slots = [
+        (datetime.combine(selected_date, start_time), datetime.combine(selected_date, end_time))
+        for start_time, end_time in await settings_cache.get_slot_times()
+    ]
     
-    # Проверяем доступность каждого слота
-    available_slots = []
+    # Получаем все бронирования стола на этот день (из кэша или одним запросом)
+    table = (await table_catalog.get()).by_number.get(table_number)
     async with async_session() as session:
-        for slot in time_slots:
-            start_time, end_time = slot
-            # Используем время из datetime объектов и комбинируем с выбранной датой
-            start_datetime = datetime.combine(selected_date, start_time.time())
-            end_datetime = datetime.combine(selected_date, end_time.time())
-            
-            # Проверяем, есть ли уже бронирования на этот слот
-            existing_reservation = await session.scalar(
-                select(Reservation).where(
-                    Reservation.table_id == table_number,
-                    Reservation.start_time <= end_datetime,
-                    Reservation.end_time >= start_datetime,
-                    Reservation.status != 'cancelled'
-                )
-            )
-            
-            if not existing_reservation:
-                available_slots.append((start_datetime, end_datetime))
+        busy = await availability_cache.get_busy(session, table.id, selected_date) if table else []
+    
+    # Свободные слоты вычисляем в памяти; начавшиеся слоты не предлагаются, как и в сетке
+    available_slots = free_slots(time_slots, busy, now=datetime.now())
     
     # Создаем клавиатуру для выбора времени
     keyboard = []
@@ -242,26 +299,25 @@ async def select_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
         slot_str = format_time_slot((start_time, end_time))
         keyboard.append([InlineKeyboardButton(
             slot_str, 
-            callback_data=f"select_time_{start_time.timestamp()}_{end_time.timestamp()}"
+            callback_data=cb("time", start_time.timestamp(), end_time.timestamp())
         )])
     
-    keyboard.append([InlineKeyboardButton("Назад", callback_data=f"select_table_{table_number}")])
+    keyboard.append([InlineKeyboardButton("Назад", callback_data=cb("table", table_number))])
     reply_markup = InlineKeyboardMarkup(keyboard)
     
     if available_slots:
         await safe_edit_message(update, f"Выбран стол {table_number} на {selected_date.strftime('%d.%m.%Y')}. Выберите время:", reply_markup)
     else:
         await safe_edit_message(update, f"На выбранную дату нет доступных слотов для стола {table_number}. Выберите другую дату:", reply_markup=InlineKeyboardMarkup([
-            [InlineKeyboardButton("Назад к выбору даты", callback_data=f"select_table_{table_number}")]
+            [InlineKeyboardButton("Назад к выбору даты", callback_data=cb("table", table_number))]
         ]))
 
 async def select_time(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.callback_query.answer()
     
-    # Получаем данные о времени из callback_data
-    parts = update.callback_query.data.split('_')
-    start_timestamp = float(parts[-2])
-    end_timestamp = float(parts[-1])
+    # Начало и конец слота — аргументы кнопки
+    start_timestamp = float(context.args[0])
+    end_timestamp = float(context.args[1])
     
     # Сохраняем в контексте
     context.user_data['start_time'] = start_timestamp
@@ -285,8 +341,8 @@ async def select_time(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Создаем клавиатуру для подтверждения
     keyboard = [
-        [InlineKeyboardButton("Подтвердить", callback_data="confirm_booking")],
-        [InlineKeyboardButton("Отмена", callback_data=f"select_date_{date_str}")]
+        [InlineKeyboardButton("Подтвердить", callback_data=cb("confirm"))],
+        [InlineKeyboardButton("Отмена", callback_data=cb("date", date_str))]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
@@ -307,51 +363,61 @@ async def confirm_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Создаем бронирование в базе данных
     async with async_session() as session:
         # Получаем пользователя
-        user = await session.scalar(select(User).where(User.telegram_id == update.effective_user.id))
+        user = await user_cache.get(update.effective_user.id)
         if not user:
             await safe_edit_message(update, "Ошибка: пользователь не найден. Пожалуйста, зарегистрируйтесь.")
             return
         
         # Получаем стол
-        table = await session.scalar(select(Table).where(Table.number == table_number))
+        table = (await table_catalog.get()).by_number.get(table_number)
         if not table:
             await safe_edit_message(update, "Ошибка: выбранный стол не найден.")
             return
         
-        # Проверяем, не занят ли слот
-        existing_reservation = await session.scalar(
-            select(Reservation).where(
-                Reservation.table_id == table.id,
-                Reservation.start_time <= end_time,
-                Reservation.end_time >= start_time,
-                Reservation.status != 'cancelled'
-            )
-        )
-        
-        if existing_reservation:
-            await safe_edit_message(update, "Извините, этот слот уже забронирован. Пожалуйста, выберите другое время.")
+        # Проверка и запись под блокировкой стола: обновления разных пользователей
+        # обрабатываются параллельно, а SQLite не запрещает пересечения сам
+        # Кнопка могла остаться в старом сообщении: начавшийся слот уже не бронируется
+        if start_time < datetime.now():
+            await safe_edit_message(update, "Извините, это время уже прошло. Пожалуйста, выберите другое время.")
             return
         
-        # Создаем новое бронирование
-        new_reservation = Reservation(
-            table_id=table.id,
-            user_id=user.id,
-            start_time=start_time,
-            end_time=end_time,
-            status='pending'
-        )
-        session.add(new_reservation)
-        await session.commit()
+        async with table_booking_locks[table.id]:
+            # Проверяем по индексу занятости, не занят ли слот (те же статусы, что и при выборе времени)
+            index = await load_availability_index(session, start_time, end_time, table_ids=[table.id])
+            if not is_slot_available(table.id, start_time, end_time, index):
+                await safe_edit_message(update, "Извините, этот слот уже забронирован. Пожалуйста, выберите другое время.")
+                return
         
-        # Уведомляем администраторов о новом бронировании
-        admin_message = (
-            f"Новое бронирование!\n\n"
-            f"Пользователь: {user.name} ({user.phone})\n"
-            f"Стол: {table_number}\n"
-            f"Дата: {start_time.strftime('%d.%m.%Y')}\n"
-            f"Время: {start_time.strftime('%H:%M')} - {end_time.strftime('%H:%M')}"
-        )
-        await notify_admins(context, admin_message)
+            # Создаем новое бронирование
+            new_reservation = Reservation(
+                table_id=table.id,
+                user_id=user.id,
+                start_time=start_time,
+                end_time=end_time,
+                status='pending'
+            )
+            session.add(new_reservation)
+            await record_transition(session, table.id, start_time, end_time, None, 'pending')
+        
+            # Уведомляем администраторов о новом бронировании (очередь outbox, в той же транзакции)
+            admin_message = (
+                f"Новое бронирование!\n\n"
+                f"Пользователь: {user.name} ({user.phone})\n"
+                f"Стол: {table_number}\n"
+                f"Дата: {start_time.strftime('%d.%m.%Y')}\n"
+                f"Время: {start_time.strftime('%H:%M')} - {end_time.strftime('%H:%M')}"
+            )
+            enqueue_many(session, ADMIN_IDS, admin_message)
+            try:
+                await session.commit()
+            except IntegrityError:
+                # Слот успели занять между проверкой и записью: отказ исключающего ограничения (PostgreSQL)
+                await session.rollback()
+                availability_cache.invalidate(table_id=table.id, day=start_time.date())
+                await safe_edit_message(update, "Извините, этот слот уже забронирован. Пожалуйста, выберите другое время.")
+                return
+            availability_cache.upsert_reservation(new_reservation)
+            outbox_worker.wake()
     
     # Сообщаем пользователю об успешном бронировании
     success_message = (
@@ -362,7 +428,7 @@ async def confirm_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"Статус: Ожидает подтверждения администратором"
     )
     
-    keyboard = [[InlineKeyboardButton("Вернуться в главное меню", callback_data="back_to_main")]]
+    keyboard = [[InlineKeyboardButton("Вернуться в главное меню", callback_data=cb("menu"))]]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
     await safe_edit_message(update, success_message, reply_markup)
@@ -371,14 +437,56 @@ async def back_to_main(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.callback_query.answer()
     await show_main_menu(update, context)
 
-async def my_bookings(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def build_my_bookings_message(user: UserRecord, cursor: UserBookingsCursor):
+    """Текст и клавиатура страницы "Мои бронирования" (общие для кнопки и команды /my_bookings)"""
     async with async_session() as session:
-        bookings = (await session.execute(select(Reservation).where(Reservation.user_id == update.effective_user.id))).scalars().all()
-        text = "Ваши бронирования:\n"
-        for b in bookings:
-            text += f"Стол {b.table_id}: {format_time_slot((b.start_time, b.end_time))} — {b.status}\n"
-        await update.callback_query.answer()
-        await safe_edit_message(update, text)
+        page = await fetch_user_bookings(session, user.id, cursor)
+    tables = (await table_catalog.get()).by_id
+    now = datetime.now()
+    
+    text = "Ваши бронирования:\n\n"
+    keyboard = []
+    if not page.rows:
+        text += "У вас пока нет бронирований."
+    history_started = False
+    for b in page.rows:
+        if not b.upcoming and not history_started:
+            text += "Прошедшие:\n"
+            history_started = True
+        status_emoji, status_text = booking_status(b.status)
+        table = tables.get(b.table_id)
+        text += (
+            f"{status_emoji} Стол {table.number if table else b.table_id} · "
+            f"{b.start_time.strftime('%d.%m.%Y')} {b.start_time.strftime('%H:%M')} - {b.end_time.strftime('%H:%M')} · "
+            f"{status_text}\n"
+        )
+        if b.upcoming and b.status in CANCELLABLE_STATUSES and b.start_time > now:
+            keyboard.append([InlineKeyboardButton(
+                f"❌ Отменить: стол {table.number if table else b.table_id}, {b.start_time.strftime('%d.%m %H:%M')}",
+                callback_data=cb("cancel", b.id)
+            )])
+    
+    navigation = []
+    if cursor != UserBookingsCursor():
+        navigation.append(InlineKeyboardButton("« В начало", callback_data=cb("mb")))
+    if page.next_cursor:
+        navigation.append(InlineKeyboardButton("Дальше »", callback_data=page.next_cursor.encode()))
+    if navigation:
+        keyboard.append(navigation)
+    keyboard.append([InlineKeyboardButton("Вернуться в главное меню", callback_data=cb("menu"))])
+    return text, InlineKeyboardMarkup(keyboard)
+
+async def my_bookings(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    user = await user_cache.get(update.effective_user.id)
+    if not user:
+        keyboard = [[InlineKeyboardButton("Зарегистрироваться", callback_data=cb("register"))]]
+        await safe_edit_message(update, "Для просмотра бронирований необходимо зарегистрироваться.", InlineKeyboardMarkup(keyboard))
+        return
+    # Положение в списке приходит в данных кнопки ("my_bookings" — начало)
+    text, reply_markup = await build_my_bookings_message(user, UserBookingsCursor.decode(query.data))
+    await safe_edit_message(update, text, reply_markup)
 
 async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
@@ -387,10 +495,11 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("У вас нет доступа к админ-панели.")
         return
     keyboard = [
-        [InlineKeyboardButton("Управление столами", callback_data="manage_tables")],
-        [InlineKeyboardButton("Настройки клуба", callback_data="club_settings")],
-        [InlineKeyboardButton("Все бронирования", callback_data="all_bookings")],
-        [InlineKeyboardButton("Назад", callback_data="main_menu")]
+        [InlineKeyboardButton("Управление столами", callback_data=cb("tables"))],
+        [InlineKeyboardButton("Настройки клуба", callback_data=cb("settings"))],
+        [InlineKeyboardButton("Все бронирования", callback_data=cb("ab"))],
+        [InlineKeyboardButton("Загрузка столов", callback_data=cb("occ"))],
+        [InlineKeyboardButton("Назад", callback_data=cb("menu"))]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
@@ -407,31 +516,29 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def manage_tables(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    async with async_session() as session:
-        tables = (await session.execute(select(Table))).scalars().all()
-        keyboard = []
-        for table in tables:
-            status = "🟢 Доступен" if table.is_available else "🔴 Недоступен"
-            keyboard.append([
-                InlineKeyboardButton(
-                    f"Стол {table.number} - {status}",
-                    callback_data=f"toggle_table_{table.number}"
-                )
-            ])
-        keyboard.append([InlineKeyboardButton("Назад в админ панель", callback_data="admin_panel")])
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        message_text = "Управление столами:\nНажмите на стол, чтобы изменить его статус"
-        await safe_edit_message(update, message_text, reply_markup)
+    tables = (await table_catalog.get()).tables
+    keyboard = []
+    for table in tables:
+        status = "🟢 Доступен" if table.is_available else "🔴 Недоступен"
+        keyboard.append([
+            InlineKeyboardButton(
+                f"Стол {table.number} - {status}",
+                callback_data=cb("toggle", table.number)
+            )
+        ])
+    keyboard.append([InlineKeyboardButton("Назад в админ панель", callback_data=cb("admin"))])
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    message_text = "Управление столами:\nНажмите на стол, чтобы изменить его статус"
+    await safe_edit_message(update, message_text, reply_markup)
 
 async def toggle_table_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    table_number = int(query.data.split('_')[-1])
-    async with async_session() as session:
-        table = (await session.execute(select(Table).where(Table.number == table_number))).scalar_one_or_none()
-        if table:
-            table.is_available = not table.is_available
-            await session.commit()
+    table_number = int(context.args[0])
+    # Каталог записывает изменение в базу и атомарно подменяет снимок столов
+    table = await table_catalog.toggle(table_number)
+    if table:
+        availability_cache.invalidate(table_id=table.id)
     await manage_tables(update, context)
 
 async def club_settings(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -439,95 +546,172 @@ async def club_settings(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if query:
         await query.answer()
     
-    async with async_session() as session:
-        # Получаем настройки клуба напрямую из базы данных
-        stmt = select(ClubSettings)
-        result = await session.execute(stmt)
-        settings = result.scalar_one_or_none()
-        
-        if not settings:
-            from config import DEFAULT_CLUB_SETTINGS
-            settings = ClubSettings(
-                opening_time=DEFAULT_CLUB_SETTINGS['opening_time'],
-                closing_time=DEFAULT_CLUB_SETTINGS['closing_time'],
-                slot_duration=DEFAULT_CLUB_SETTINGS['slot_duration']
-            )
-            session.add(settings)
-            await session.commit()
-            
-            # Повторно получаем настройки, чтобы убедиться, что они сохранились
-            stmt = select(ClubSettings)
-            result = await session.execute(stmt)
-            settings = result.scalar_one_or_none()
-        
-        # Выводим текущие настройки из базы данных
-        keyboard = [
-            [InlineKeyboardButton("Изменить время открытия", callback_data="set_opening")],
-            [InlineKeyboardButton("Изменить время закрытия", callback_data="set_closing")],
-            [InlineKeyboardButton("Изменить длительность слота", callback_data="set_duration")],
-            [InlineKeyboardButton("Назад в админ панель", callback_data="admin_panel")]
+    # Настройки клуба берем из кэша (при первом обращении загружаются из базы)
+    settings = await settings_cache.get()
+    
+    # Выводим текущие настройки
+    keyboard = [
+        [InlineKeyboardButton("Изменить время открытия", callback_data=cb("set_opening"))],
+        [InlineKeyboardButton("Изменить время закрытия", callback_data=cb("set_closing"))],
+        [InlineKeyboardButton("Изменить длительность слота", callback_data=cb("set_duration"))],
+        [InlineKeyboardButton("Назад в админ панель", callback_data=cb("admin"))]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    message_text = (
+        f"Текущие настройки клуба:\n"
+        f"Время открытия: {settings.opening_time}\n"
+        f"Время закрытия: {settings.closing_time}\n"
+        f"Длительность слота: {settings.slot_duration} минут"
+    )
+    
+    # Используем правильный метод для отправки сообщения
+    if update.callback_query:
+        await safe_edit_message(update, message_text, reply_markup)
+    else:
+        # Если функция вызвана не из callback_query
+        await update.message.reply_text(message_text, reply_markup=reply_markup)
+
+# Отметка и подпись статуса бронирования в списках
+BOOKING_STATUSES = {
+    'pending': ("🟡", "Ожидает подтверждения"),
+    'confirmed': ("🟢", "Подтверждено"),
+    'cancelled': ("🔴", "Отменено"),
+    'expired': ("⚪", "Завершено"),
+}
+
+def booking_status(status: str):
+    return BOOKING_STATUSES.get(status, ("⚪", status))
+
+def build_bookings_filter_keyboard(state: BookingListState, tables) -> list:
+    """Кнопки фильтров списка бронирований: день, статус, стол"""
+    if state.day:
+        day_row = [
+            InlineKeyboardButton(f"◀ {(state.day - timedelta(days=1)).strftime('%d.%m')}",
+                                 callback_data=state.with_filters(day=state.day - timedelta(days=1)).encode()),
+            InlineKeyboardButton("Все дни", callback_data=state.with_filters(day=None).encode()),
+            InlineKeyboardButton(f"{(state.day + timedelta(days=1)).strftime('%d.%m')} ▶",
+                                 callback_data=state.with_filters(day=state.day + timedelta(days=1)).encode()),
         ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        message_text = (
-            f"Текущие настройки клуба:\n"
-            f"Время открытия: {settings.opening_time}\n"
-            f"Время закрытия: {settings.closing_time}\n"
-            f"Длительность слота: {settings.slot_duration} минут"
-        )
-        
-        # Используем правильный метод для отправки сообщения
-        if update.callback_query:
-            await safe_edit_message(update, message_text, reply_markup)
-        else:
-            # Если функция вызвана не из callback_query
-            await update.message.reply_text(message_text, reply_markup=reply_markup)
+    else:
+        day_row = [InlineKeyboardButton("📅 Сегодня", callback_data=state.with_filters(day=datetime.now().date()).encode())]
+    
+    next_status = STATUS_CYCLE[(STATUS_CYCLE.index(state.status) + 1) % len(STATUS_CYCLE)]
+    numbers = [None] + [t.number for t in tables]
+    next_table = numbers[(numbers.index(state.table) + 1) % len(numbers)] if state.table in numbers else None
+    filter_row = [
+        InlineKeyboardButton(f"Статус: {booking_status(state.status)[1] if state.status else 'все'}",
+                             callback_data=state.with_filters(status=next_status).encode()),
+        InlineKeyboardButton(f"Стол: {state.table if state.table is not None else 'все'}",
+                             callback_data=state.with_filters(table=next_table).encode()),
+    ]
+    return [day_row, filter_row]
 
 async def all_bookings(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
+    if not await is_admin(update.effective_user.id):
+        return
+    
+    # Фильтры и курсор страницы приходят в данных кнопки ("all_bookings" — первая страница)
+    state = BookingListState.decode(query.data)
+    catalog = await table_catalog.get()
+    table = catalog.by_number.get(state.table) if state.table is not None else None
     
     async with async_session() as session:
-        # Используем joinedload для предварительной загрузки связанных объектов
-        stmt = (
-            select(Reservation)
-            .options(joinedload(Reservation.table), joinedload(Reservation.user))
-            .order_by(Reservation.start_time)
+        page = await fetch_bookings_page(session, state, table.id if table else None)
+    
+    # Кнопка "Вернуться к списку" после подтверждения или отмены ведет на эту же страницу
+    context.user_data['bookings_page'] = query.data
+    
+    filters_text = []
+    if state.day:
+        filters_text.append(state.day.strftime('%d.%m.%Y'))
+    if state.status:
+        filters_text.append(booking_status(state.status)[1].lower())
+    if state.table is not None:
+        filters_text.append(f"стол {state.table}")
+    message = "Бронирования" + (f" ({', '.join(filters_text)})" if filters_text else "") + ":\n\n"
+    
+    keyboard = []
+    if not page.rows:
+        message += "Бронирований нет."
+    for res in page.rows:
+        status_emoji, status_text = booking_status(res.status)
+        res_table = catalog.by_id.get(res.table_id)
+        message += (
+            f"{status_emoji} #{res.id} · Стол {res_table.number if res_table else res.table_id}\n"
+            f"{res.start_time.strftime('%d.%m.%Y')} {res.start_time.strftime('%H:%M')} - {res.end_time.strftime('%H:%M')}\n"
+            f"Клиент: {res.name} ({res.phone if res.phone else 'нет телефона'})\n"
+            f"Статус: {status_text}\n\n"
         )
-        
-        result = await session.execute(stmt)
-        reservations = result.scalars().all()
-        
-        keyboard = []
-        message = "Все бронирования:\n\n"
-        
-        if not reservations:
-            message += "Бронирований нет."
-        else:
-            for res in reservations:
-                status_text = "Ожидает подтверждения" if res.status == 'pending' else "Подтверждено" if res.status == 'confirmed' else "Отменено"
-                status_emoji = "🟡" if res.status == 'pending' else "🟢" if res.status == 'confirmed' else "🔴"
-                message += (
-                    f"{status_emoji} Стол {res.table.number}\n"
-                    f"Время: {res.start_time.strftime('%H:%M')} - {res.end_time.strftime('%H:%M')}\n"
-                    f"Клиент: {res.user.name} ({res.user.phone if res.user.phone else 'нет телефона'})\n"
-                    f"Статус: {status_text}\n"
-                )
-                if res.status == 'pending':
-                    keyboard.append([
-                        InlineKeyboardButton("✅ Подтвердить", callback_data=f"confirm_booking_{res.id}"),
-                        InlineKeyboardButton("❌ Отменить", callback_data=f"cancel_booking_{res.id}")
-                    ])
-                    message += "\n"
-        keyboard.append([InlineKeyboardButton("Назад в админ панель", callback_data="admin_panel")])
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await safe_edit_message(update, message, reply_markup)
+        if res.status == 'pending':
+            keyboard.append([
+                InlineKeyboardButton(f"✅ Подтвердить #{res.id}", callback_data=cb("adm_confirm", res.id)),
+                InlineKeyboardButton(f"❌ Отменить #{res.id}", callback_data=cb("adm_cancel", res.id))
+            ])
+    
+    navigation = []
+    if page.has_prev:
+        navigation.append(InlineKeyboardButton("« Назад", callback_data=state.before(page.rows[0]).encode() if page.rows else state.with_filters().encode()))
+    if page.has_next:
+        navigation.append(InlineKeyboardButton("Дальше »", callback_data=state.after(page.rows[-1]).encode() if page.rows else state.with_filters().encode()))
+    if navigation:
+        keyboard.append(navigation)
+    keyboard += build_bookings_filter_keyboard(state, catalog.tables)
+    keyboard.append([InlineKeyboardButton("Назад в админ панель", callback_data=cb("admin"))])
+    await safe_edit_message(update, message, InlineKeyboardMarkup(keyboard))
+
+async def occupancy_report(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Загрузка столов за 7 дней по таблице occupancy_daily (бронирования не читаются)"""
+    query = update.callback_query
+    await query.answer()
+    if not await is_admin(update.effective_user.id):
+        return
+    
+    # Последний день периода — аргумент кнопки YYYYMMDD (без аргумента — сегодня)
+    try:
+        end_day = datetime.strptime(context.args[0], '%Y%m%d').date()
+    except (IndexError, ValueError):
+        end_day = datetime.now().date()
+    start_day = end_day - timedelta(days=6)
+    
+    async with async_session() as session:
+        summary = await fetch_occupancy(session, start_day, end_day)
+    tables = (await table_catalog.get()).tables
+    # Минуты работы клуба в каждом часе одного дня по сетке слотов
+    open_minutes = Counter()
+    day = datetime.now().date()
+    for slot_start, slot_end in await settings_cache.get_slot_times():
+        for (_, hour), minutes in occupancy_buckets(datetime.combine(day, slot_start), datetime.combine(day, slot_end)).items():
+            open_minutes[hour] += minutes
+    day_minutes = sum(open_minutes.values()) or 1
+    
+    message = f"Загрузка столов {start_day.strftime('%d.%m')}–{end_day.strftime('%d.%m.%Y')}:\n\nПо столам:\n"
+    for table in tables:
+        minutes, count = summary.by_table.get(table.id, (0, 0))
+        capacity = day_minutes * summary.days
+        message += f"Стол {table.number}: {minutes / 60:.1f} ч из {capacity / 60:.0f} ч ({minutes * 100 // capacity}%), бронирований: {count}\n"
+    message += "\nПо часам (все столы):\n"
+    for hour in sorted(set(open_minutes) | set(summary.by_hour)):
+        minutes = summary.by_hour.get(hour, 0)
+        capacity = open_minutes.get(hour, 0) * summary.days * max(len(tables), 1)
+        share = min(minutes / capacity, 1) if capacity else 0
+        bar = "█" * round(share * 10) + "░" * (10 - round(share * 10))
+        message += f"{hour:02d}:00 {bar} {share * 100:.0f}%\n"
+    
+    navigation = [InlineKeyboardButton("« Неделя назад", callback_data=cb("occ", (end_day - timedelta(days=7)).strftime('%Y%m%d')))]
+    if end_day < datetime.now().date():
+        navigation.append(InlineKeyboardButton("Неделя вперед »", callback_data=cb("occ", (end_day + timedelta(days=7)).strftime('%Y%m%d'))))
+    keyboard = [navigation, [InlineKeyboardButton("Назад в админ панель", callback_data=cb("admin"))]]
+    await safe_edit_message(update, message, InlineKeyboardMarkup(keyboard))
 
 async def handle_booking_confirmation(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    booking_id = int(query.data.split('_')[-1])
-    action = "confirm" if "confirm_booking" in query.data else "cancel"
+    booking_id = int(context.args[0])
+    back_markup = InlineKeyboardMarkup([[InlineKeyboardButton("Вернуться к списку", callback_data=context.user_data.get('bookings_page', cb("ab")))]])
+    conflict_text = f"Бронирование #{booking_id} нельзя подтвердить: слот уже занят другим бронированием."
     
     async with async_session() as session:
         booking = await session.get(Reservation, booking_id)
@@ -535,41 +719,55 @@ async def handle_booking_confirmation(update: Update, context: ContextTypes.DEFA
             await safe_edit_message(update, "Бронирование не найдено.")
             return
         
-        if action == "confirm":
-            booking.status = "confirmed"
-            status_text = "подтверждено"
-        else:
-            booking.status = "cancelled"
-            status_text = "отменено"
+        old_status = booking.status
+        table_id, start_time, end_time = booking.table_id, booking.start_time, booking.end_time
         
-        await session.commit()
+        # Возврат отмененного бронирования снова занимает слот: проверка и запись
+        # под той же блокировкой стола, что и у нового бронирования
+        reactivating = not is_counted(old_status)
+        async with table_booking_locks[table_id] if reactivating else nullcontext():
+            if reactivating:
+                index = await load_availability_index(session, start_time, end_time, table_ids=[table_id])
+                if not is_slot_available(table_id, start_time, end_time, index):
+                    await safe_edit_message(update, conflict_text, back_markup)
+                    return
+            
+            booking.status = "confirmed"
+            await record_transition(session, booking.table_id, booking.start_time, booking.end_time, old_status, booking.status)
         
-        # Уведомляем пользователя о изменении статуса бронирования
-        user = await session.get(User, booking.user_id)
-        if user:
-            try:
-                table = await session.get(Table, booking.table_id)
+            # Уведомление пользователю ставится в очередь outbox в той же транзакции
+            user = await session.get(User, booking.user_id)
+            if user:
+                table = (await table_catalog.get()).by_id.get(booking.table_id)
                 table_number = table.number if table else booking.table_id
-                
+            
                 user_message = (
                     f"Статус вашего бронирования изменен!\n\n"
                     f"Стол: {table_number}\n"
                     f"Дата: {booking.start_time.strftime('%d.%m.%Y')}\n"
                     f"Время: {booking.start_time.strftime('%H:%M')} - {booking.end_time.strftime('%H:%M')}\n"
-                    f"Новый статус: {status_text}"
+                    f"Новый статус: подтверждено"
                 )
-                await context.bot.send_message(chat_id=user.telegram_id, text=user_message)
-            except Exception as e:
-                logger.error(f"Ошибка при отправке уведомления пользователю: {e}")
+                enqueue(session, user.telegram_id, user_message)
+        
+            try:
+                await session.commit()
+            except IntegrityError:
+                # Слот успели занять в другом процессе: отказ исключающего ограничения (PostgreSQL)
+                await session.rollback()
+                availability_cache.invalidate(table_id=table_id, day=start_time.date())
+                await safe_edit_message(update, conflict_text, back_markup)
+                return
+            availability_cache.upsert_reservation(booking)
+            outbox_worker.wake()
         
         # Обновляем сообщение администратора
-        await safe_edit_message(update, f"Бронирование #{booking_id} {status_text}!", 
-                             InlineKeyboardMarkup([[InlineKeyboardButton("Вернуться к списку", callback_data="all_bookings")]]))
+        await safe_edit_message(update, f"Бронирование #{booking_id} подтверждено!", back_markup)
 
 async def handle_booking_cancellation(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    booking_id = int(query.data.split('_')[-1])
+    booking_id = int(context.args[0])
     
     async with async_session() as session:
         booking = await session.get(Reservation, booking_id)
@@ -577,6 +775,7 @@ async def handle_booking_cancellation(update: Update, context: ContextTypes.DEFA
             await safe_edit_message(update, "Бронирование не найдено.")
             return
         
+        await record_transition(session, booking.table_id, booking.start_time, booking.end_time, booking.status, 'cancelled')
         booking.status = "cancelled"
         
         # Обновляем статус стола, если нужно
@@ -584,181 +783,109 @@ async def handle_booking_cancellation(update: Update, context: ContextTypes.DEFA
         if table:
             table.is_available = True
         
-        await session.commit()
-        
-        # Уведомляем пользователя об отмене бронирования
+        # Уведомления пользователю и администраторам ставятся в очередь outbox в той же транзакции
         user = await session.get(User, booking.user_id)
         if user:
-            try:
-                table_number = table.number if table else booking.table_id
-                
-                user_message = (
-                    f"Ваше бронирование отменено!\n\n"
-                    f"Стол: {table_number}\n"
-                    f"Дата: {booking.start_time.strftime('%d.%m.%Y')}\n"
-                    f"Время: {booking.start_time.strftime('%H:%M')} - {booking.end_time.strftime('%H:%M')}"
-                )
-                await context.bot.send_message(chat_id=user.telegram_id, text=user_message)
-                
-                # Уведомляем администраторов
-                admin_message = (
-                    f"Бронирование отменено!\n"
-                    f"Стол: {table_number}\n"
-                    f"Время: {format_time_slot((booking.start_time, booking.end_time))}\n"
-                    f"Клиент: {user.name} ({user.phone if user.phone else 'нет телефона'})"
-                )
-                await notify_admins(context, admin_message)
-            except Exception as e:
-                logger.error(f"Ошибка при отправке уведомлений: {e}")
+            table_number = table.number if table else booking.table_id
+            
+            user_message = (
+                f"Ваше бронирование отменено!\n\n"
+                f"Стол: {table_number}\n"
+                f"Дата: {booking.start_time.strftime('%d.%m.%Y')}\n"
+                f"Время: {booking.start_time.strftime('%H:%M')} - {booking.end_time.strftime('%H:%M')}"
+            )
+            enqueue(session, user.telegram_id, user_message)
+            
+            admin_message = (
+                f"Бронирование отменено!\n"
+                f"Стол: {table_number}\n"
+                f"Время: {format_time_slot((booking.start_time, booking.end_time))}\n"
+                f"Клиент: {user.name} ({user.phone if user.phone else 'нет телефона'})"
+            )
+            enqueue_many(session, ADMIN_IDS, admin_message)
+        
+        await session.commit()
+        availability_cache.upsert_reservation(booking)
+        if table:
+            table_catalog.set_available(table.id, True)
+        outbox_worker.wake()
         
         # Обновляем сообщение администратора
         await safe_edit_message(update, f"Бронирование #{booking_id} отменено!", 
-                             InlineKeyboardMarkup([[InlineKeyboardButton("Вернуться к списку", callback_data="all_bookings")]]))
+                             InlineKeyboardMarkup([[InlineKeyboardButton("Вернуться к списку", callback_data=context.user_data.get('bookings_page', cb("ab")))]]))
 
 async def handle_user_booking_cancellation(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    reservation_id = int(query.data.split('_')[-1])
+    reservation_id = int(context.args[0])
+    user = await user_cache.get(update.effective_user.id)
+    if not user:
+        return
+    result_text = "Это бронирование уже нельзя отменить."
     async with async_session() as session:
-        reservation = (await session.execute(select(Reservation).where(Reservation.id == reservation_id))).scalar_one_or_none()
-        if reservation:
-            user = reservation.user
-            if user.telegram_id == update.effective_user.id:
-                reservation.status = 'cancelled'
-                table = (await session.execute(select(Table).where(Table.id == reservation.table_id))).scalar_one_or_none()
-                if table:
-                    table.is_available = True
-                await session.commit()
-                try:
-                    await notify_admins(context, f"Бронирование отменено!\nСтол: {reservation.table.number}\nВремя: {format_time_slot((reservation.start_time, reservation.end_time))}\nКлиент: {user.name} ({user.phone})")
-                except Exception as e:
-                    logger.error(f"Ошибка при отправке уведомления админам: {e}")
-    await my_bookings(update, context)
-
-async def confirm_booking_multiple(update: Update, context: ContextTypes.DEFAULT_TYPE, table_number: int, start_timestamp: int, end_timestamp: int):
-    try:
-        query = update.callback_query
-        await query.answer()
-        from datetime import datetime as dt
-        start_time = dt.fromtimestamp(start_timestamp)
-        end_time = dt.fromtimestamp(end_timestamp)
-        if start_time >= end_time:
-            await query.message.reply_text("Ошибка: время окончания должно быть позже времени начала.")
-            return
-        async with async_session() as session:
-            table = (await session.execute(select(Table).where(Table.number == table_number))).scalar_one_or_none()
-            user = (await session.execute(select(User).where(User.telegram_id == update.effective_user.id))).scalar_one_or_none()
-            if not (table and user):
-                await query.message.reply_text("Ошибка: не найден стол или пользователь.")
-                return
-            reservation = Reservation(
-                table_id=table.id,
-                user_id=user.id,
-                start_time=start_time,
-                end_time=end_time,
-                status='pending'
-            )
-            session.add(reservation)
+        reservation = await session.get(Reservation, reservation_id)
+        # Отменить можно только свое еще не начавшееся бронирование
+        if (reservation and reservation.user_id == user.id and reservation.status in CANCELLABLE_STATUSES
+                and reservation.start_time > datetime.now()):
+            await record_transition(session, reservation.table_id, reservation.start_time, reservation.end_time, reservation.status, 'cancelled')
+            reservation.status = 'cancelled'
+            table = await session.get(Table, reservation.table_id)
+            if table:
+                table.is_available = True
+            enqueue_many(session, ADMIN_IDS, f"Бронирование отменено!\nСтол: {table.number if table else reservation.table_id}\nВремя: {format_time_slot((reservation.start_time, reservation.end_time))}\nКлиент: {user.name} ({user.phone})")
             await session.commit()
-            await notify_admins(context, f"Новая заявка на бронирование:\nСтол: {table.number}\nВремя: {format_time_slot((start_time, end_time))}\nКлиент: {user.name} ({user.phone})")
-        await show_main_menu(update, context)
-    except Exception as e:
-        logger.error(f"Ошибка при подтверждении бронирования: {e}")
-        await update.callback_query.message.reply_text("Произошла ошибка при бронировании. Пожалуйста, попробуйте позже или обратитесь к администратору.")
+            availability_cache.upsert_reservation(reservation)
+            if table:
+                table_catalog.set_available(table.id, True)
+            outbox_worker.wake()
+            result_text = "Бронирование отменено."
+    text, reply_markup = await build_my_bookings_message(user, UserBookingsCursor())
+    await safe_edit_message(update, f"{result_text}\n\n{text}", reply_markup)
 
 async def book_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /book для бронирования стола"""
     # Проверяем, зарегистрирован ли пользователь
-    async with async_session() as session:
-        user = await session.scalar(select(User).where(User.telegram_id == update.effective_user.id))
-        if not user:
-            keyboard = [[InlineKeyboardButton("Зарегистрироваться", callback_data="register")]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await update.message.reply_text(
-                "Для бронирования стола необходимо зарегистрироваться.",
-                reply_markup=reply_markup
-            )
-            return
+    user = await user_cache.get(update.effective_user.id)
+    if not user:
+        keyboard = [[InlineKeyboardButton("Зарегистрироваться", callback_data=cb("register"))]]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        await update.message.reply_text(
+            "Для бронирования стола необходимо зарегистрироваться.",
+            reply_markup=reply_markup
+        )
+        return
     
     # Получаем доступные столы и отображаем их
+    catalog = await table_catalog.get()
+    tables = catalog.tables
+    table_states = catalog.table_states()
+    
     async with async_session() as session:
-        tables = (await session.execute(select(Table))).scalars().all()
-        table_states = []
-        
-        for table in tables:
-            table_states.append({
-                "number": table.number,
-                "is_available": table.is_available
-            })
-        
-        # Создаем изображение с расположением столов
-        img_bytes = create_table_layout_image(table_states)
-        
         # Создаем клавиатуру с доступными столами
-        keyboard = []
-        row = []
-        for i, table in enumerate(tables):
-            if table.is_available:
-                if len(row) < 3:  # Максимум 3 кнопки в ряду
-                    row.append(InlineKeyboardButton(f"Стол {table.number}", callback_data=f"select_table_{table.number}"))
-                else:
-                    keyboard.append(row)
-                    row = [InlineKeyboardButton(f"Стол {table.number}", callback_data=f"select_table_{table.number}")]
+        reply_markup = build_table_keyboard(tables, await count_free_slots_today(session, tables))
         
-        if row:  # Добавляем оставшиеся кнопки
-            keyboard.append(row)
-        
-        keyboard.append([InlineKeyboardButton("Назад", callback_data="back_to_main")])
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.message.reply_photo(
-            photo=img_bytes,
-            caption="Выберите доступный стол для бронирования:",
-            reply_markup=reply_markup
+        await send_table_layout(
+            update.message,
+            table_states,
+            "Выберите доступный стол для бронирования:",
+            reply_markup
         )
 
 async def my_bookings_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /my_bookings для просмотра бронирований пользователя"""
     # Проверяем, зарегистрирован ли пользователь
-    async with async_session() as session:
-        user = await session.scalar(select(User).where(User.telegram_id == update.effective_user.id))
-        if not user:
-            keyboard = [[InlineKeyboardButton("Зарегистрироваться", callback_data="register")]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await update.message.reply_text(
-                "Для просмотра бронирований необходимо зарегистрироваться.",
-                reply_markup=reply_markup
-            )
-            return
-        
-        # Получаем бронирования пользователя
-        stmt = (
-            select(Reservation)
-            .options(joinedload(Reservation.table))
-            .where(Reservation.user_id == user.id)
-            .order_by(Reservation.start_time)
-        )
-        result = await session.execute(stmt)
-        bookings = result.scalars().all()
-        
-        text = "Ваши бронирования:\n\n"
-        if not bookings:
-            text += "У вас нет активных бронирований."
-        else:
-            for b in bookings:
-                status_text = "Ожидает подтверждения" if b.status == 'pending' else "Подтверждено" if b.status == 'confirmed' else "Отменено"
-                status_emoji = "🟡" if b.status == 'pending' else "🟢" if b.status == 'confirmed' else "🔴"
-                text += (
-                    f"{status_emoji} Стол {b.table.number}\n"
-                    f"Дата: {b.start_time.strftime('%d.%m.%Y')}\n"
-                    f"Время: {b.start_time.strftime('%H:%M')} - {b.end_time.strftime('%H:%M')}\n"
-                    f"Статус: {status_text}\n\n"
-                )
-        
-        keyboard = [[InlineKeyboardButton("Вернуться в главное меню", callback_data="back_to_main")]]
+    user = await user_cache.get(update.effective_user.id)
+    if not user:
+        keyboard = [[InlineKeyboardButton("Зарегистрироваться", callback_data=cb("register"))]]
         reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.message.reply_text(text, reply_markup=reply_markup)
+        await update.message.reply_text(
+            "Для просмотра бронирований необходимо зарегистрироваться.",
+            reply_markup=reply_markup
+        )
+        return
+    
+    text, reply_markup = await build_my_bookings_message(user, UserBookingsCursor())
+    await update.message.reply_text(text, reply_markup=reply_markup)
 
 async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /admin для доступа к админ-панели"""
@@ -769,10 +896,11 @@ async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Создаем клавиатуру админ-панели
     keyboard = [
-        [InlineKeyboardButton("Все бронирования", callback_data="all_bookings")],
-        [InlineKeyboardButton("Управление столами", callback_data="manage_tables")],
-        [InlineKeyboardButton("Настройки клуба", callback_data="club_settings")],
-        [InlineKeyboardButton("Вернуться в главное меню", callback_data="back_to_main")]
+        [InlineKeyboardButton("Все бронирования", callback_data=cb("ab"))],
+        [InlineKeyboardButton("Управление столами", callback_data=cb("tables"))],
+        [InlineKeyboardButton("Настройки клуба", callback_data=cb("settings"))],
+        [InlineKeyboardButton("Загрузка столов", callback_data=cb("occ"))],
+        [InlineKeyboardButton("Вернуться в главное меню", callback_data=cb("menu"))]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
@@ -782,18 +910,21 @@ async def set_opening(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     context.user_data['settings_step'] = 'set_opening'
+    set_input_state(context, 'settings')
     await query.message.reply_text("Введите новое время открытия клуба (HH:MM):")
 
 async def set_closing(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     context.user_data['settings_step'] = 'set_closing'
+    set_input_state(context, 'settings')
     await query.message.reply_text("Введите новое время закрытия клуба (HH:MM):")
 
 async def set_duration(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     context.user_data['settings_step'] = 'set_duration'
+    set_input_state(context, 'settings')
     await query.message.reply_text("Введите новую длительность слота (в минутах):")
 
 async def handle_settings_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -861,6 +992,7 @@ async def handle_settings_input(update: Update, context: ContextTypes.DEFAULT_TY
                     
                     # Проверяем, что настройки обновились
                     await session.refresh(settings)
+                    settings_cache.set(ClubSettingsSnapshot.from_model(settings))
                     
                     await update.message.reply_text(f"Время открытия установлено: {settings.opening_time}")
                 except Exception as e:
@@ -903,6 +1035,7 @@ async def handle_settings_input(update: Update, context: ContextTypes.DEFAULT_TY
                     
                     # Проверяем, что настройки обновились
                     await session.refresh(settings)
+                    settings_cache.set(ClubSettingsSnapshot.from_model(settings))
                     
                     await update.message.reply_text(f"Время закрытия установлено: {settings.closing_time}")
                 except Exception as e:
@@ -924,6 +1057,7 @@ async def handle_settings_input(update: Update, context: ContextTypes.DEFAULT_TY
                     
                     # Проверяем, что настройки обновились
                     await session.refresh(settings)
+                    settings_cache.set(ClubSettingsSnapshot.from_model(settings))
                     
                     await update.message.reply_text(f"Длительность слота установлена: {settings.slot_duration} минут")
                 except ValueError:
@@ -932,17 +1066,10 @@ async def handle_settings_input(update: Update, context: ContextTypes.DEFAULT_TY
             
             # Очищаем шаг настройки
             context.user_data.pop('settings_step', None)
+            clear_input_state(context)
             
-            # Создаем объект для передачи в club_settings
-            class DummyCallback:
-                message = update.message
-                callback_query = None
-            
-            dummy_update = Update(update.update_id, message=update.message)
-            dummy_update.callback_query = DummyCallback()
-            
-            # Показываем обновленные настройки
-            await club_settings(dummy_update, context)
+            # Показываем обновленные настройки (club_settings ответит на текстовое сообщение)
+            await club_settings(update, context)
     
     except Exception as e:
         logger.error(f"Ошибка при обновлении настроек: {e}")
@@ -957,10 +1084,167 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
                                     "Мои бронирования - показать мои бронирования\n"
                                     "Админ панель - показать административную панель (для администраторов)")
 
+# Режимы получения обновлений (BOT_MODE)
+BOT_MODES = ('polling', 'webhook')
+
+async def unknown_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Кнопка из сообщения, формат которого бот больше не понимает"""
+    await update.callback_query.answer("Эта кнопка устарела, откройте меню заново: /start")
+
+def build_router() -> Router:
+    """Маршруты кнопок (действие → обработчик) и текстового ввода (шаг → обработчик)"""
+    router = Router(is_admin=is_admin)
+    router.add("register", register_handler)
+    router.add("menu", back_to_main)
+    router.add("book", book_table)
+    router.add("table", select_table)
+    router.add("date", select_date)
+    router.add("time", select_time)
+    router.add("confirm", confirm_booking)
+    router.add("mb", my_bookings)
+    router.add("cancel", handle_user_booking_cancellation)
+    router.add("admin", admin_panel, admin_only=True)
+    router.add("tables", manage_tables, admin_only=True)
+    router.add("toggle", toggle_table_status, admin_only=True)
+    router.add("settings", club_settings, admin_only=True)
+    router.add("set_opening", set_opening, admin_only=True)
+    router.add("set_closing", set_closing, admin_only=True)
+    router.add("set_duration", set_duration, admin_only=True)
+    router.add("ab", all_bookings, admin_only=True)
+    router.add("occ", occupancy_report, admin_only=True)
+    router.add("adm_confirm", handle_booking_confirmation, admin_only=True)
+    router.add("adm_cancel", handle_booking_cancellation, admin_only=True)
+    # Кнопки в сообщениях, отправленных до перехода на формат v1
+    # (mb:..., ab:..., occ:... разбираются по первому слову без дерева)
+    router.add_legacy("register", "register")
+    router.add_legacy("back_to_main", "menu")
+    router.add_legacy("main_menu", "menu")
+    router.add_legacy("book", "book")
+    router.add_legacy("select_table", "table", with_args=True)
+    router.add_legacy("select_date", "date", with_args=True)
+    router.add_legacy("select_time", "time", with_args=True)
+    router.add_legacy("confirm_booking", "confirm")
+    router.add_legacy("my_bookings", "mb")
+    router.add_legacy("cancel_my_booking", "cancel", with_args=True)
+    router.add_legacy("admin_panel", "admin")
+    router.add_legacy("manage_tables", "tables")
+    router.add_legacy("toggle_table", "toggle", with_args=True)
+    router.add_legacy("club_settings", "settings")
+    router.add_legacy("set_opening", "set_opening")
+    router.add_legacy("set_closing", "set_closing")
+    router.add_legacy("set_duration", "set_duration")
+    router.add_legacy("all_bookings", "ab")
+    router.add_legacy("occupancy", "occ")
+    router.add_legacy("confirm_booking", "adm_confirm", with_args=True)
+    router.add_legacy("cancel_booking", "adm_cancel", with_args=True)
+    router.unknown_callback = unknown_button
+    # Текст вне регистрации и настроек: приглашение зарегистрироваться или главное меню
+    router.add_state("registration", process_registration)
+    router.add_state("settings", handle_settings_input)
+    router.unknown_text = start_command
+    return router
+
+def register_handlers(app: Application):
+    app.add_handler(CommandHandler("start", start_command))
+    app.add_handler(CommandHandler("help", help_command))
+    app.add_handler(CommandHandler("book", book_command))
+    app.add_handler(CommandHandler("my_bookings", my_bookings_command))
+    app.add_handler(CommandHandler("admin", admin_command))
+    # Все кнопки и весь текстовый ввод — через один маршрутизатор
+    router = build_router()
+    app.add_handler(CallbackQueryHandler(router.dispatch))
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, router.dispatch_text))
+
+def build_application(token: str = BOT_TOKEN, mode: str = BOT_MODE, concurrency: int = UPDATE_CONCURRENCY,
+                      request=None) -> Application:
+    """
+    Приложение с зарегистрированными обработчиками.
+    concurrency > 1 — обновления разных пользователей обрабатываются параллельно
+    (PerUserUpdateProcessor), 1 — все по одному.
+    request — свой транспорт Bot API (например, локальная заглушка в bench_webhook.py)
+    """
+    if mode not in BOT_MODES:
+        raise ValueError(f"Неизвестный режим бота: {mode}. Допустимые: {', '.join(BOT_MODES)}")
+    builder = Application.builder().token(token)
+    if concurrency > 1:
+        builder = builder.concurrent_updates(PerUserUpdateProcessor(concurrency))
+    if request is not None:
+        builder = builder.request(request).get_updates_request(request)
+    if mode == 'webhook':
+        # Обновления приходят в WebhookServer, Updater с long polling не нужен
+        builder = builder.updater(None)
+    app = builder.build()
+    register_handlers(app)
+    return app
+
+async def start_receiving(app: Application, mode: str = BOT_MODE, webhook_url: str = WEBHOOK_URL):
+    """Запускает прием обновлений; для webhook возвращает запущенный WebhookServer"""
+    if mode == 'polling':
+        await app.updater.start_polling()
+        return None
+    server = WebhookServer(app)
+    await server.start()
+    if webhook_url:
+        await app.bot.set_webhook(
+            url=webhook_url.rstrip('/') + server.path,
+            secret_token=server.secret_token,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=Update.ALL_TYPES
+        )
+    else:
+        logger.warning("WEBHOOK_URL не задан: webhook в Telegram не зарегистрирован")
+    return server
+
+async def stop_receiving(app: Application, server=None):
+    """Перестает принимать новые обновления; уже полученные дообработает app.stop()"""
+    if server is not None:
+        await server.stop()
+        logger.info(f"Статистика webhook: {server.stats()}")
+    elif app.updater and app.updater.running:
+        await app.updater.stop()
+
+def install_stop_signals(stop_event: asyncio.Event):
+    """SIGINT/SIGTERM завершают бота штатно: с дообработкой очереди и остановкой фоновых задач"""
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows: остается KeyboardInterrupt
+            pass
+
+# Задачи предварительной отрисовки: ссылки хранятся до завершения, иначе задачу может собрать сборщик мусора
+prerender_tasks = set()
+
+def _prerender_done(task: asyncio.Task):
+    prerender_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        logger.error(f"Ошибка при предварительной отрисовке схемы столов: {task.exception()}")
+
+def prerender_table_layout(snapshot):
+    """Подписчик каталога: отрисовывает схему для нового состояния столов в фоне"""
+    task = asyncio.create_task(render_service.render_table_layout(snapshot.table_states()))
+    prerender_tasks.add(task)
+    task.add_done_callback(_prerender_done)
+
 async def main():
     await init_db()
-    app = Application.builder().token(BOT_TOKEN).build()
+    report = await backfill_occupancy_if_empty()
+    if report:
+        logger.info(str(report))
+    await photo_registry.load()
+    # Заранее отрисовываем схему для нового состояния столов после каждого изменения каталога
+    table_catalog.subscribe(prerender_table_layout)
+    await table_catalog.get()
+    checkpoint_task = asyncio.create_task(wal_checkpoint_loop(engine))
+    expiry_task = asyncio.create_task(expiry_loop())
+    archive_task = asyncio.create_task(archive_loop())
+    app = build_application()
     
+    stop_event = asyncio.Event()
+    install_stop_signals(stop_event)
+    
+    await app.initialize()
     # Настраиваем команды меню бота - только самые необходимые
     commands = [
         BotCommand("book", "Забронировать стол"),
@@ -968,45 +1252,34 @@ async def main():
         BotCommand("admin", "Админ панель")
     ]
     await app.bot.set_my_commands(commands)
-    
-    app.add_handler(CommandHandler("start", start_command))
-    app.add_handler(CommandHandler("help", help_command))
-    app.add_handler(CommandHandler("book", book_command))
-    app.add_handler(CommandHandler("my_bookings", my_bookings_command))
-    app.add_handler(CommandHandler("admin", admin_command))
-    app.add_handler(CallbackQueryHandler(register_handler, pattern="register"))
-    app.add_handler(CallbackQueryHandler(book_table, pattern="book"))
-    app.add_handler(CallbackQueryHandler(my_bookings, pattern="my_bookings"))
-    app.add_handler(CallbackQueryHandler(admin_panel, pattern="admin_panel"))
-    app.add_handler(CallbackQueryHandler(manage_tables, pattern="manage_tables"))
-    app.add_handler(CallbackQueryHandler(toggle_table_status, pattern="toggle_table_"))
-    app.add_handler(CallbackQueryHandler(club_settings, pattern="club_settings"))
-    app.add_handler(CallbackQueryHandler(all_bookings, pattern="all_bookings"))
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, process_registration))
-    app.add_handler(CallbackQueryHandler(handle_booking_confirmation, pattern=r"^confirm_booking_\d+$"))
-    app.add_handler(CallbackQueryHandler(handle_booking_cancellation, pattern=r"^cancel_booking_\d+$"))
-    app.add_handler(CallbackQueryHandler(set_opening, pattern="set_opening"))
-    app.add_handler(CallbackQueryHandler(set_closing, pattern="set_closing"))
-    app.add_handler(CallbackQueryHandler(set_duration, pattern="set_duration"))
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_settings_input))
-    app.add_handler(CallbackQueryHandler(select_table, pattern=r"^select_table_\d+$"))
-    app.add_handler(CallbackQueryHandler(select_date, pattern=r"^select_date_\d{4}-\d{2}-\d{2}$"))
-    app.add_handler(CallbackQueryHandler(select_time, pattern=r"^select_time_[\d\.]+_[\d\.]+$"))
-    app.add_handler(CallbackQueryHandler(confirm_booking, pattern="confirm_booking"))
-    app.add_handler(CallbackQueryHandler(back_to_main, pattern="back_to_main"))
-    
-    await app.initialize()
     await app.start()
-    await app.updater.start_polling()
+    # Очередь outbox отправляет через app.bot, поэтому запускается только после initialize()
+    outbox_task = asyncio.create_task(outbox_worker.run(app.bot))
+    server = await start_receiving(app)
+    logger.info(f"Бот запущен в режиме {BOT_MODE}, одновременно обрабатывается обновлений: {UPDATE_CONCURRENCY}")
     
     try:
-        while True:
-            await asyncio.sleep(1)
-    except (KeyboardInterrupt, SystemExit):
+        await stop_event.wait()
+    except (KeyboardInterrupt, SystemExit, asyncio.CancelledError):
         pass
     finally:
-        await app.updater.stop()
+        logger.info("Остановка бота...")
+        await stop_receiving(app, server)
+        # Обновления, уже полученные из Telegram, дообрабатываются здесь
         await app.stop()
+        checkpoint_task.cancel()
+        expiry_task.cancel()
+        archive_task.cancel()
+        logger.info(f"Статистика кэша пользователей: {user_cache.stats()}")
+        # Даем очереди outbox дописать результаты текущего пакета; неотправленное уйдет при следующем запуске
+        outbox_worker.stop()
+        try:
+            await asyncio.wait_for(outbox_task, timeout=15)
+        except asyncio.TimeoutError:
+            logger.warning("Очередь сообщений не успела остановиться, взятый пакет будет отправлен повторно")
+        logger.info(f"Очередь сообщений: {await outbox_worker.stats()}, рассылка: {notification_dispatcher.stats()}")
+        await app.shutdown()
+        render_service.shutdown()
 
 if __name__ == "__main__":
     import asyncio
@@ -1,47 +1,30 @@
+import argparse
 import asyncio
 import logging
-from datetime import datetime, timedelta
-from sqlalchemy import select, update
-from db import async_session, Reservation, init_db
+from db import init_db
+from expiry import expire_finished_bookings
+from config import EXPIRY_BATCH_SIZE
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-async def cleanup_expired_bookings():
+async def cleanup_expired_bookings(batch_size: int = EXPIRY_BATCH_SIZE, full: bool = False):
     logger.info("Начинаем проверку и очистку устаревших бронирований...")
     
     # Инициализируем базу данных
     await init_db()
     
-    # Текущее время
-    now = datetime.now()
-    
-    async with async_session() as session:
-        # Получаем все бронирования, у которых end_time меньше текущего времени
-        # и статус не cancelled
-        stmt = select(Reservation).where(
-            Reservation.end_time < now,
-            Reservation.status != 'cancelled'
-        )
-        result = await session.execute(stmt)
-        expired_bookings = result.scalars().all()
-        
-        if not expired_bookings:
-            logger.info("Устаревших бронирований не найдено.")
-            return
-        
-        logger.info(f"Найдено {len(expired_bookings)} устаревших бронирований:")
-        
-        # Обновляем статус устаревших бронирований на 'expired'
-        for booking in expired_bookings:
-            booking.status = 'expired'
-            logger.info(f"Бронирование #{booking.id} (Стол {booking.table.number}, "
-                       f"{booking.start_time.strftime('%Y-%m-%d %H:%M')} - "
-                       f"{booking.end_time.strftime('%Y-%m-%d %H:%M')}) "
-                       f"помечено как истекшее.")
-        
-        await session.commit()
-        logger.info(f"Всего обновлено {len(expired_bookings)} бронирований.")
+    # Бот делает то же самое в фоне (expiry.expiry_loop); скрипт нужен для запуска по расписанию извне
+    report = await expire_finished_bookings(batch_size=batch_size, full=full)
+    logger.info(str(report))
+    return report
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Пометка закончившихся бронирований как истекших")
+    parser.add_argument('--batch-size', type=int, default=EXPIRY_BATCH_SIZE, help='Строк в одной транзакции')
+    parser.add_argument('--full', action='store_true', help='Проверить все бронирования, а не только закончившиеся после прошлого запуска')
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    asyncio.run(cleanup_expired_bookings())
+    args = parse_args()
+    asyncio.run(cleanup_expired_bookings(args.batch_size, args.full))
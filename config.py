@@ -20,6 +20,128 @@ except ValueError:
 
 DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite+aiosqlite:///billiards.db')
 
+# Режим получения обновлений: polling (long polling) или webhook (встроенный HTTP-сервер aiohttp)
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+# Публичный адрес, по которому Telegram доступен сервер (https://example.com), и путь обработчика
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+# Адрес и порт, на которых слушает сервер (обычно за обратным прокси с TLS)
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+# Секрет заголовка X-Telegram-Bot-Api-Secret-Token; пустой — случайный при каждом запуске
+WEBHOOK_SECRET_TOKEN = os.getenv('WEBHOOK_SECRET_TOKEN', '')
+# Сколько одновременных HTTPS-соединений с сервером открывает Telegram (1-100)
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+# Сколько обновлений обрабатывается одновременно; обновления одного пользователя
+# все равно идут по очереди (update_processor.PerUserUpdateProcessor), 1 — все по одному
+UPDATE_CONCURRENCY = int(os.getenv('UPDATE_CONCURRENCY', '8'))
+# Сколько полученных обновлений может ждать обработки, дальше прием из очереди приостанавливается
+UPDATE_MAX_PENDING = int(os.getenv('UPDATE_MAX_PENDING', '1000'))
+
+# Пул соединений для серверных СУБД (PostgreSQL); к SQLite не применяется
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', '30'))
+# Пересоздавать соединения старше стольких секунд (-1 — никогда)
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+# Проверять соединение перед выдачей из пула (переживает перезапуск сервера БД)
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', '1').lower() in ('1', 'true', 'yes')
+# Кэш подготовленных выражений asyncpg на соединение; 0 — при работе через pgbouncer в режиме транзакций
+DB_STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', '100'))
+
+# Бэкенд хранилища: auto (по DATABASE_URL), async, sync или memory (см. db.BACKENDS)
+DB_BACKEND = os.getenv('DB_BACKEND', 'auto')
+
+# Количество потоков для синхронного бэкенда базы данных (DB_BACKEND=sync)
+DB_EXECUTOR_WORKERS = int(os.getenv('DB_EXECUTOR_WORKERS', '4'))
+
+# Пометка закончившихся бронирований как истекших: период фоновой задачи в секундах (0 — отключить)
+# и размер пакета (строк в одной транзакции)
+EXPIRY_INTERVAL = int(os.getenv('EXPIRY_INTERVAL', '300'))
+EXPIRY_BATCH_SIZE = int(os.getenv('EXPIRY_BATCH_SIZE', '500'))
+
+# Архив: завершенные бронирования старше ARCHIVE_AFTER_DAYS дней переносятся из reservations
+# в reservations_archive пакетами по ARCHIVE_BATCH_SIZE строк раз в ARCHIVE_INTERVAL секунд (0 — отключить).
+# ARCHIVE_DATABASE — путь к отдельному файлу SQLite для архива (подключается через ATTACH)
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '90'))
+ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', '500'))
+ARCHIVE_INTERVAL = int(os.getenv('ARCHIVE_INTERVAL', '86400'))
+ARCHIVE_DATABASE = os.getenv('ARCHIVE_DATABASE', '')
+
+# Количество бронирований на одной странице списков
+BOOKINGS_PAGE_SIZE = int(os.getenv('BOOKINGS_PAGE_SIZE', '8'))
+
+# Рассылка уведомлений: сообщений в секунду всего и в один чат (ограничения Telegram),
+# повторов при ответе 429 и сетевых ошибках
+NOTIFY_GLOBAL_RATE = float(os.getenv('NOTIFY_GLOBAL_RATE', '30'))
+NOTIFY_PER_CHAT_RATE = float(os.getenv('NOTIFY_PER_CHAT_RATE', '1'))
+NOTIFY_MAX_RETRIES = int(os.getenv('NOTIFY_MAX_RETRIES', '3'))
+
+# Очередь исходящих сообщений (таблица outbox): опрос раз в OUTBOX_POLL_INTERVAL секунд, пакет
+# из OUTBOX_BATCH_SIZE сообщений; после неудачи повтор через OUTBOX_RETRY_DELAY секунд (удваивается),
+# после OUTBOX_MAX_ATTEMPTS попыток сообщение откладывается (dead); отправленные хранятся OUTBOX_RETENTION_DAYS дней
+OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', '5'))
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '50'))
+OUTBOX_RETRY_DELAY = int(os.getenv('OUTBOX_RETRY_DELAY', '30'))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '8'))
+OUTBOX_RETENTION_DAYS = int(os.getenv('OUTBOX_RETENTION_DAYS', '7'))
+
+# Кэш пользователей (telegram_id -> пользователь): размер и время жизни записи в секундах
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '1024'))
+USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', '600'))
+
+# Профили настроек SQLite (PRAGMA), применяются к каждому новому соединению
+SQLITE_PROFILES = {
+    # Настройки драйвера по умолчанию (журнал DELETE, читатели блокируют писателей)
+    "default": {},
+    # WAL: читатели не блокируют писателя, fsync только при контрольных точках
+    "wal": {
+        # Действует только для новой базы; существующую переводит python archive.py --enable-incremental-vacuum
+        "auto_vacuum": "INCREMENTAL",
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+        "cache_size": -16000,
+        "temp_store": "MEMORY",
+        "mmap_size": 134217728
+    },
+    # WAL с полной синхронизацией: медленнее, но переживает потерю питания без потери транзакций
+    "durable": {
+        "auto_vacuum": "INCREMENTAL",
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "busy_timeout": 10000,
+        "cache_size": -16000,
+        "temp_store": "MEMORY"
+    }
+}
+SQLITE_PROFILE = os.getenv('SQLITE_PROFILE', 'wal')
+# Интервал фоновой контрольной точки WAL (секунды), 0 — отключить
+WAL_CHECKPOINT_INTERVAL = int(os.getenv('WAL_CHECKPOINT_INTERVAL', '300'))
+
+def get_sqlite_pragmas(profile: str = None) -> dict:
+    """
+    Возвращает PRAGMA выбранного профиля.
+    Отдельные значения можно переопределить переменными окружения SQLITE_<PRAGMA>,
+    например SQLITE_SYNCHRONOUS=FULL или SQLITE_MMAP_SIZE=0.
+    """
+    profile = profile or SQLITE_PROFILE
+    if profile not in SQLITE_PROFILES:
+        print(f"Предупреждение: неизвестный профиль SQLite '{profile}'. Используем 'default'.")
+        profile = "default"
+    pragmas = dict(SQLITE_PROFILES[profile])
+    for name in ("journal_mode", "synchronous", "busy_timeout", "cache_size", "temp_store", "mmap_size"):
+        value = os.getenv(f'SQLITE_{name.upper()}')
+        if value:
+            pragmas[name] = value
+    return pragmas
+
+# Количество потоков для отрисовки схемы столов
+RENDER_WORKERS = int(os.getenv('RENDER_WORKERS', '2'))
+
+# Время жизни записей кэша доступности (секунды) на случай изменений из других процессов
+AVAILABILITY_CACHE_TTL = int(os.getenv('AVAILABILITY_CACHE_TTL', '300'))
+
 DEFAULT_CLUB_SETTINGS = {
     "opening_time": "15:00",
     "closing_time": "21:00",
@@ -0,0 +1,23 @@
+import asyncio
+import pytest
+from db import create_backend
+
+@pytest.fixture
+def memory_db(monkeypatch):
+    """
+    Запуск сценария на пустой базе в памяти: run(scenario, *modules) подменяет
+    async_session в модулях modules, создает схему, выполняет scenario(session_factory)
+    в новом цикле событий и закрывает движок
+    """
+    def run(scenario, *modules):
+        async def wrapper():
+            backend = create_backend('sqlite://', 'memory')
+            for module in modules:
+                monkeypatch.setattr(module, 'async_session', backend.async_session)
+            await backend.create_schema()
+            try:
+                return await scenario(backend.async_session)
+            finally:
+                await backend.dispose()
+        return asyncio.run(wrapper())
+    return run
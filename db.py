@@ -1,71 +1,164 @@
-import asyncio
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import declarative_base, sessionmaker, relationship
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, select, func
-from datetime import datetime
-from config import DATABASE_URL, get_table_layout, get_club_settings
-
-Base = declarative_base()
-engine = create_async_engine(DATABASE_URL, echo=False)
-async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
-
-class User(Base):
-    __tablename__ = 'users'
-    id = Column(Integer, primary_key=True)
-    telegram_id = Column(Integer, unique=True)
-    phone = Column(String)
-    name = Column(String)
-    is_admin = Column(Boolean, default=False)
-
-class Table(Base):
-    __tablename__ = 'tables'
-    id = Column(Integer, primary_key=True)
-    number = Column(Integer, unique=True)
-    is_available = Column(Boolean, default=True)
-
-class Reservation(Base):
-    __tablename__ = 'reservations'
-    id = Column(Integer, primary_key=True)
-    table_id = Column(Integer, ForeignKey('tables.id'))
-    user_id = Column(Integer, ForeignKey('users.id'))
-    start_time = Column(DateTime, nullable=False)
-    end_time = Column(DateTime, nullable=False)
-    status = Column(String, default='pending')
-    created_at = Column(DateTime, default=datetime.utcnow)
-    table = relationship("Table")
-    user = relationship("User")
-
-class ClubSettings(Base):
-    __tablename__ = 'club_settings'
-    id = Column(Integer, primary_key=True)
-    opening_time = Column(String)
-    closing_time = Column(String)
-    slot_duration = Column(Integer)
+import logging
+from sqlalchemy import create_engine, select, func
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from models import (
+    Base, User, Table, Reservation, ArchivedReservation, ClubSettings, PhotoFile, JobState, OccupancyDaily, OutboxMessage,
+    ARCHIVE_SCHEMA, create_missing_indexes, create_schema
+)
+from config import (
+    DATABASE_URL, DB_BACKEND, DB_EXECUTOR_WORKERS, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE, DB_POOL_PRE_PING, DB_STATEMENT_CACHE_SIZE, ARCHIVE_DATABASE, get_table_layout, get_club_settings
+)
+from sqlite_tuning import install_sqlite_pragmas, attach_sqlite_database
+from sync_session import run_sync, sync_session_factory
+
+logger = logging.getLogger(__name__)
+
+# Доступные бэкенды хранилища:
+#   async  — асинхронный драйвер (sqlite+aiosqlite, postgresql+asyncpg)
+#   sync   — синхронный драйвер в пуле потоков (для хостингов, где aiosqlite работает плохо)
+#   memory — база SQLite в памяти (тесты и бенчмарки)
+BACKENDS = ('async', 'sync', 'memory')
+
+def normalize_url(url: str) -> str:
+    """Приводит адреса вида postgres://... (так их выдают хостинги) к схеме SQLAlchemy"""
+    if url.startswith('postgres://'):
+        return 'postgresql://' + url[len('postgres://'):]
+    return url
+
+def resolve_backend(url: str, backend: str = 'auto') -> str:
+    """Выбирает бэкенд: явно заданный или по адресу базы данных"""
+    if backend != 'auto':
+        if backend not in BACKENDS:
+            raise ValueError(f"Неизвестный бэкенд базы данных: {backend}. Доступны: {', '.join(BACKENDS)}")
+        return backend
+    parsed = make_url(normalize_url(url))
+    if parsed.get_backend_name() == 'sqlite' and parsed.database in (None, '', ':memory:'):
+        return 'memory'
+    # Адрес без асинхронного драйвера (sqlite:///...) означает синхронный бэкенд
+    if parsed.drivername == 'sqlite':
+        return 'sync'
+    return 'async'
+
+class DatabaseBackend:
+    """Движок и фабрика сессий выбранного бэкенда; сессии везде используются как AsyncSession"""
+
+    def __init__(self, name: str, engine, async_session):
+        self.name = name
+        self.engine = engine
+        self.async_session = async_session
+
+    async def create_schema(self):
+        if isinstance(self.engine, AsyncEngine):
+            async with self.engine.begin() as conn:
+                await conn.run_sync(create_schema)
+        else:
+            await run_sync(self._create_schema_sync)
+
+    def _create_schema_sync(self):
+        with self.engine.begin() as conn:
+            create_schema(conn)
+
+    async def init_db(self):
+        await self.create_schema()
+
+        # Проверка и инициализация столов
+        async with self.async_session() as session:
+            # Проверяем, есть ли столы в базе
+            tables_count = await session.scalar(select(func.count()).select_from(Table))
+            if tables_count == 0:
+                # Добавляем столы из конфигурации
+                table_layout = get_table_layout()
+                for table_data in table_layout:
+                    table = Table(number=table_data["number"], is_available=True)
+                    session.add(table)
+
+            # Проверяем настройки клуба
+            club_settings = await session.scalar(select(ClubSettings))
+            if not club_settings:
+                default_settings = get_club_settings()
+                club_settings = ClubSettings(
+                    opening_time=default_settings["opening_time"],
+                    closing_time=default_settings["closing_time"],
+                    slot_duration=default_settings["slot_duration"]
+                )
+                session.add(club_settings)
+
+            await session.commit()
+
+    async def dispose(self):
+        if isinstance(self.engine, AsyncEngine):
+            await self.engine.dispose()
+        else:
+            await run_sync(self.engine.dispose)
+
+def create_backend(url: str = DATABASE_URL, backend: str = DB_BACKEND, profile: str = None) -> DatabaseBackend:
+    """Создает движок и фабрику сессий для бэкенда (профиль PRAGMA — см. config.SQLITE_PROFILES)"""
+    name = resolve_backend(url, backend)
+    parsed = make_url(normalize_url(url))
+    is_sqlite = parsed.get_backend_name() == 'sqlite'
+
+    if name == 'memory':
+        # Одно соединение на весь процесс, иначе каждое соединение видело бы свою пустую базу
+        engine = create_async_engine(
+            'sqlite+aiosqlite://',
+            poolclass=StaticPool,
+            connect_args={'check_same_thread': False}
+        )
+        session_factory = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    elif name == 'sync':
+        if is_sqlite:
+            parsed = parsed.set(drivername='sqlite')
+        # Сессия держит соединение между await, а ее запросы могут выполняться разными
+        # потоками пула, поэтому проверка потока отключена. Пул не ограничивает переполнение:
+        # иначе потоки, ждущие соединение, блокировали бы сессии, которые его держат и ждут
+        # свободный поток. Постоянно хранится столько соединений, сколько потоков.
+        engine = create_engine(
+            parsed,
+            echo=False,
+            pool_size=DB_EXECUTOR_WORKERS,
+            max_overflow=-1,
+            connect_args={'check_same_thread': False} if is_sqlite else {}
+        )
+        session_factory = sync_session_factory(engine)
+    elif is_sqlite:
+        engine = create_async_engine(parsed.set(drivername='sqlite+aiosqlite'), echo=False)
+        session_factory = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    else:
+        if parsed.drivername == 'postgresql':
+            parsed = parsed.set(drivername='postgresql+asyncpg')
+        if parsed.drivername == 'postgresql+asyncpg':
+            # Кэш подготовленных выражений SQLAlchemy согласуем с кэшем asyncpg (0 отключает оба)
+            if 'prepared_statement_cache_size' not in parsed.query:
+                parsed = parsed.update_query_dict({'prepared_statement_cache_size': str(DB_STATEMENT_CACHE_SIZE)})
+            connect_args = {'statement_cache_size': DB_STATEMENT_CACHE_SIZE}
+        else:
+            connect_args = {}
+        engine = create_async_engine(
+            parsed,
+            echo=False,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=DB_POOL_PRE_PING,
+            connect_args=connect_args
+        )
+        session_factory = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+
+    sync_engine = engine.sync_engine if isinstance(engine, AsyncEngine) else engine
+    install_sqlite_pragmas(sync_engine, profile)
+    if ARCHIVE_DATABASE:
+        attach_sqlite_database(sync_engine, ARCHIVE_DATABASE, ARCHIVE_SCHEMA)
+    logger.info(f"База данных: бэкенд {name}, драйвер {engine.dialect.name}+{engine.dialect.driver}")
+    return DatabaseBackend(name, engine, session_factory)
+
+backend = create_backend()
+engine = backend.engine
+async_session = backend.async_session
 
 async def init_db():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-    
-    # Проверка и инициализация столов
-    async with async_session() as session:
-        # Проверяем, есть ли столы в базе
-        tables_count = await session.scalar(select(func.count()).select_from(Table))
-        if tables_count == 0:
-            # Добавляем столы из конфигурации
-            table_layout = get_table_layout()
-            for table_data in table_layout:
-                table = Table(number=table_data["number"], is_available=True)
-                session.add(table)
-        
-        # Проверяем настройки клуба
-        club_settings = await session.scalar(select(ClubSettings))
-        if not club_settings:
-            default_settings = get_club_settings()
-            club_settings = ClubSettings(
-                opening_time=default_settings["opening_time"],
-                closing_time=default_settings["closing_time"],
-                slot_duration=default_settings["slot_duration"]
-            )
-            session.add(club_settings)
-        
-        await session.commit()
+    await backend.init_db()
@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import select, update
+from db import async_session, Reservation, JobState
+from config import EXPIRY_INTERVAL, EXPIRY_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+EXPIRY_JOB = 'expiry'
+# Статусы, которые истекают после окончания брони; отмененные и уже истекшие не трогаем
+EXPIRABLE_STATUSES = ('pending', 'confirmed')
+
+@dataclass
+class ExpiryReport:
+    """Итог одного прогона: сколько бронирований истекло, за сколько пакетов и времени"""
+    expired: int
+    batches: int
+    since: Optional[datetime]
+    until: datetime
+    duration: float
+
+    def __str__(self):
+        since = self.since.strftime('%Y-%m-%d %H:%M') if self.since else 'начала'
+        return (f"Истекло бронирований: {self.expired} ({self.batches} пакетов, {self.duration * 1000:.0f} мс), "
+                f"окончание с {since} по {self.until.strftime('%Y-%m-%d %H:%M')}")
+
+def expiry_batch_stmt(since: Optional[datetime], until: datetime, batch_size: int):
+    """
+    Одно UPDATE для пакета: не более batch_size бронирований, закончившихся в [since, until).
+    Пакет выбирается подзапросом по индексу ix_reservations_end_status.
+    """
+    ids = select(Reservation.id).where(
+        Reservation.end_time < until,
+        Reservation.status.in_(EXPIRABLE_STATUSES)
+    )
+    if since is not None:
+        ids = ids.where(Reservation.end_time >= since)
+    ids = ids.order_by(Reservation.end_time).limit(batch_size)
+    return (
+        update(Reservation)
+        .where(Reservation.id.in_(ids))
+        .values(status='expired')
+        .execution_options(synchronize_session=False)
+    )
+
+async def get_high_water(name: str) -> Optional[datetime]:
+    async with async_session() as session:
+        state = await session.get(JobState, name)
+        return state.high_water if state else None
+
+async def set_high_water(name: str, value: datetime):
+    """Сдвигает отметку задачи вперед (назад она не двигается)"""
+    async with async_session() as session:
+        state = await session.get(JobState, name)
+        if state is None:
+            state = JobState(name=name)
+            session.add(state)
+        if state.high_water is None or value > state.high_water:
+            state.high_water = value
+        await session.commit()
+
+async def expire_finished_bookings(now: datetime = None, batch_size: int = EXPIRY_BATCH_SIZE, full: bool = False) -> ExpiryReport:
+    """
+    Помечает закончившиеся бронирования как истекшие пакетами по batch_size строк,
+    каждый пакет в своей короткой транзакции. Просматриваются только бронирования,
+    закончившиеся после прошлого прогона (отметка в job_state); full=True — все.
+
+    Кэш доступности не сбрасывается: истекшие бронирования, как и прежде,
+    считаются занятыми (все, кроме отмененных).
+    """
+    started = time.perf_counter()
+    until = now or datetime.now()
+    since = None if full else await get_high_water(EXPIRY_JOB)
+
+    expired = batches = 0
+    while True:
+        async with async_session() as session:
+            result = await session.execute(expiry_batch_stmt(since, until, batch_size))
+            await session.commit()
+        batches += 1
+        expired += result.rowcount
+        if result.rowcount < batch_size:
+            break
+
+    # Отметку сдвигаем только после всех пакетов: прерванный прогон повторится целиком
+    await set_high_water(EXPIRY_JOB, until)
+    return ExpiryReport(expired, batches, since, until, time.perf_counter() - started)
+
+async def expiry_loop(interval: int = EXPIRY_INTERVAL):
+    """Фоновая задача бота: сразу после запуска и затем каждые interval секунд"""
+    if interval <= 0:
+        return
+    while True:
+        try:
+            report = await expire_finished_bookings()
+            if report.expired:
+                logger.info(str(report))
+            else:
+                logger.debug(str(report))
+        except Exception as e:
+            logger.error(f"Ошибка при пометке истекших бронирований: {e}")
+        await asyncio.sleep(interval)
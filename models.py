@@ -0,0 +1,173 @@
+from sqlalchemy.orm import declarative_base, relationship
+import logging
+from sqlalchemy import Column, Integer, BigInteger, String, Date, DateTime, Boolean, ForeignKey, Index, inspect, text
+from datetime import datetime
+from config import ARCHIVE_DATABASE
+
+logger = logging.getLogger(__name__)
+
+Base = declarative_base()
+
+class User(Base):
+    __tablename__ = 'users'
+    id = Column(Integer, primary_key=True)
+    # ID в Telegram бывают больше 2^31, поэтому BIGINT (в SQLite разницы нет)
+    telegram_id = Column(BigInteger, unique=True)
+    phone = Column(String)
+    name = Column(String)
+    is_admin = Column(Boolean, default=False)
+
+class Table(Base):
+    __tablename__ = 'tables'
+    id = Column(Integer, primary_key=True)
+    number = Column(Integer, unique=True)
+    is_available = Column(Boolean, default=True)
+
+class Reservation(Base):
+    __tablename__ = 'reservations'
+    id = Column(Integer, primary_key=True)
+    table_id = Column(Integer, ForeignKey('tables.id'))
+    user_id = Column(Integer, ForeignKey('users.id'))
+    start_time = Column(DateTime, nullable=False)
+    end_time = Column(DateTime, nullable=False)
+    status = Column(String, default='pending')
+    created_at = Column(DateTime, default=datetime.utcnow)
+    table = relationship("Table")
+    user = relationship("User")
+
+    __table_args__ = (
+        # Проверка пересечений: стол + диапазон времени + статус
+        Index('ix_reservations_table_time', 'table_id', 'start_time', 'end_time', 'status'),
+        # Бронирования пользователя по времени
+        Index('ix_reservations_user_start', 'user_id', 'start_time'),
+        # Поиск закончившихся бронирований и выборки по диапазону без стола
+        Index('ix_reservations_end_status', 'end_time', 'status'),
+        # Общий список бронирований по времени
+        Index('ix_reservations_start', 'start_time', 'id'),
+    )
+
+# Архив в отдельном файле SQLite подключается к соединениям под этим именем (см. db.create_backend)
+ARCHIVE_SCHEMA = 'archive' if ARCHIVE_DATABASE else None
+
+class ArchivedReservation(Base):
+    """Завершенные бронирования, перенесенные из reservations (см. archive.py); id сохраняется"""
+    __tablename__ = 'reservations_archive'
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    # Без внешних ключей: архив может лежать в другом файле
+    table_id = Column(Integer)
+    user_id = Column(Integer)
+    start_time = Column(DateTime, nullable=False)
+    end_time = Column(DateTime, nullable=False)
+    status = Column(String)
+    created_at = Column(DateTime)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index('ix_reservations_archive_user_start', 'user_id', 'start_time'),
+        Index('ix_reservations_archive_start', 'start_time', 'id'),
+        {'schema': ARCHIVE_SCHEMA},
+    )
+
+class ClubSettings(Base):
+    __tablename__ = 'club_settings'
+    id = Column(Integer, primary_key=True)
+    opening_time = Column(String)
+    closing_time = Column(String)
+    slot_duration = Column(Integer)
+
+class PhotoFile(Base):
+    __tablename__ = 'photo_files'
+    key = Column(String, primary_key=True)
+    file_id = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class JobState(Base):
+    """Состояние фоновых задач: отметка, до которой задача уже обработала данные"""
+    __tablename__ = 'job_state'
+    name = Column(String, primary_key=True)
+    high_water = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class OutboxMessage(Base):
+    """
+    Исходящие сообщения Telegram (см. outbox.py): записываются в одной транзакции
+    с изменением бронирования и отправляются фоновой задачей
+    """
+    __tablename__ = 'outbox'
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(BigInteger, nullable=False)
+    text = Column(String, nullable=False)
+    # pending — ждет отправки, sent — отправлено, dead — отправка прекращена
+    status = Column(String, nullable=False, default='pending')
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime)
+    last_error = Column(String)
+
+    __table_args__ = (
+        # Выборка очередного пакета к отправке
+        Index('ix_outbox_status_due', 'status', 'next_attempt_at'),
+        # Удаление старых отправленных
+        Index('ix_outbox_status_sent', 'status', 'sent_at'),
+    )
+
+class OccupancyDaily(Base):
+    """
+    Загрузка столов по дням и часам (см. occupancy.py): сколько минут часа занято
+    неотмененными бронированиями и сколько из них начинается в этом часе.
+    Обновляется при каждой смене статуса; пересобирается python occupancy.py --rebuild
+    """
+    __tablename__ = 'occupancy_daily'
+    day = Column(Date, primary_key=True)
+    # Без внешнего ключа: в агрегате остаются и бронирования, перенесенные в архив
+    table_id = Column(Integer, primary_key=True)
+    hour = Column(Integer, primary_key=True)
+    booked_minutes = Column(Integer, nullable=False, default=0)
+    bookings = Column(Integer, nullable=False, default=0)
+
+def create_missing_indexes(connection):
+    """Создает индексы, которых нет в уже существующих таблицах (идемпотентно)"""
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name, schema=table.schema):
+            continue
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+# Исключающее ограничение PostgreSQL: у одного стола не может быть двух неотмененных
+# бронирований с пересекающимися полуоткрытыми интервалами [start_time, end_time) —
+# та же проверка, что active_reservations_stmt, но на уровне базы.
+# Стол сравнивается как вырожденный диапазон [table_id, table_id]: для диапазонов
+# GiST работает без расширения btree_gist, которого нет на части хостингов.
+RESERVATION_EXCLUSION = 'reservations_no_overlap'
+RESERVATION_EXCLUSION_DDL = (
+    f"ALTER TABLE reservations ADD CONSTRAINT {RESERVATION_EXCLUSION} EXCLUDE USING gist ("
+    "int4range(table_id, table_id, '[]') WITH &&, "
+    "tsrange(start_time, end_time, '[)') WITH &&"
+    ") WHERE (status <> 'cancelled')"
+)
+
+def create_booking_constraints(connection):
+    """Создает исключающее ограничение бронирований (только PostgreSQL, идемпотентно)"""
+    if connection.dialect.name != 'postgresql':
+        return
+    exists = connection.scalar(
+        text("SELECT 1 FROM pg_constraint WHERE conname = :name"),
+        {'name': RESERVATION_EXCLUSION}
+    )
+    if exists:
+        return
+    try:
+        # Точка сохранения: ошибка (например, уже пересекающиеся данные) не прерывает инициализацию
+        with connection.begin_nested():
+            connection.execute(text(RESERVATION_EXCLUSION_DDL))
+    except Exception as e:
+        logger.error(f"Не удалось создать ограничение {RESERVATION_EXCLUSION}, пересечения проверяет только бот: {e}")
+
+def create_schema(connection):
+    """Создает таблицы, недостающие индексы и ограничения"""
+    Base.metadata.create_all(connection)
+    # create_all не добавляет индексы в существующие таблицы, поэтому обновляем их отдельно
+    create_missing_indexes(connection)
+    create_booking_constraints(connection)
@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import time
+from typing import Iterable, Optional
+from telegram.error import BadRequest, RetryAfter, TimedOut, NetworkError
+from config import NOTIFY_GLOBAL_RATE, NOTIFY_PER_CHAT_RATE, NOTIFY_MAX_RETRIES
+
+logger = logging.getLogger(__name__)
+
+# Пауза перед повтором после сетевой ошибки (секунды, удваивается с каждой попыткой)
+NETWORK_RETRY_DELAY = 1.0
+# Сколько очередей чатов держать, прежде чем удалять простаивающие
+MAX_IDLE_LANES = 1024
+
+class TokenBucket:
+    """
+    Ограничитель частоты: rate токенов в секунду, не больше capacity подряд.
+    Внутри одного цикла событий блокировка не нужна: между проверкой
+    и списанием токена нет точек переключения.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def pause(self, seconds: float):
+        """Не выдавать токены seconds секунд (ответ 429 от Telegram)"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+def is_retryable(error: Exception) -> bool:
+    """Имеет ли смысл повторить отправку позже (429, таймаут, сеть), а не откладывать сообщение"""
+    return isinstance(error, (RetryAfter, TimedOut, NetworkError)) and not isinstance(error, BadRequest)
+
+def _retry_after_seconds(error: RetryAfter) -> float:
+    # В новых версиях python-telegram-bot retry_after — timedelta
+    value = error.retry_after
+    return value.total_seconds() if hasattr(value, 'total_seconds') else float(value)
+
+class _ChatLane:
+    """Очередь одного чата: сообщения уходят по порядку и не чаще per_chat_rate в секунду"""
+
+    def __init__(self, rate: float):
+        self.lock = asyncio.Lock()
+        self.interval = 1 / rate
+        self.last_sent = 0.0
+        self.pending = 0
+
+    async def wait_turn(self):
+        # Интервал отсчитывается от начала прошлой отправки, а не от выдачи токена:
+        # ожидание общего ограничения не сближает сообщения одного чата
+        delay = self.last_sent + self.interval - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+class NotificationDispatcher:
+    """
+    Рассылка уведомлений вне обработчиков: send() ставит сообщение в очередь
+    и сразу возвращает управление. Сообщения разных чатов отправляются параллельно
+    под общим ограничением Telegram (NOTIFY_GLOBAL_RATE в секунду), сообщения
+    одного чата — по порядку и не чаще NOTIFY_PER_CHAT_RATE. На 429 рассылка
+    ждет retry_after и повторяет отправку, сетевые ошибки повторяются с паузой.
+    """
+
+    def __init__(self, global_rate: float = NOTIFY_GLOBAL_RATE, per_chat_rate: float = NOTIFY_PER_CHAT_RATE,
+                 max_retries: int = NOTIFY_MAX_RETRIES):
+        self.per_chat_rate = per_chat_rate
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate)
+        self._lanes = {}
+        self._tasks = set()
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.total_delay = 0.0
+        self.max_delay = 0.0
+
+    def send(self, bot, chat_id: int, text: str, **kwargs) -> asyncio.Task:
+        """
+        Ставит сообщение в очередь; возвращает задачу доставки (ждать ее не обязательно),
+        ее результат — None при успехе или последняя ошибка
+        """
+        lane = self._lanes.get(chat_id)
+        if lane is None:
+            if len(self._lanes) >= MAX_IDLE_LANES:
+                self._prune()
+            lane = self._lanes[chat_id] = _ChatLane(self.per_chat_rate)
+        lane.pending += 1
+        task = asyncio.create_task(self._deliver(bot, chat_id, lane, text, kwargs, time.perf_counter()))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def send_many(self, bot, chat_ids: Iterable[int], text: str, **kwargs):
+        """Одно сообщение нескольким чатам (например, всем администраторам)"""
+        return [self.send(bot, chat_id, text, **kwargs) for chat_id in chat_ids]
+
+    def _prune(self):
+        # Очередь без сообщений, чей интервал уже прошел, ничем не отличается от новой
+        now = time.monotonic()
+        for chat_id, lane in list(self._lanes.items()):
+            if not lane.pending and now - lane.last_sent >= lane.interval:
+                del self._lanes[chat_id]
+
+    async def _deliver(self, bot, chat_id: int, lane: _ChatLane, text: str, kwargs: dict, queued_at: float) -> Optional[Exception]:
+        try:
+            async with lane.lock:
+                for attempt in range(self.max_retries + 1):
+                    await lane.wait_turn()
+                    await self._global.acquire()
+                    lane.last_sent = time.monotonic()
+                    try:
+                        await bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                    except RetryAfter as e:
+                        # Ограничение действует на бота целиком: останавливаем всю рассылку
+                        delay = _retry_after_seconds(e)
+                        self._global.pause(delay)
+                        error = e
+                    except BadRequest as e:
+                        # Наследник NetworkError, но повтор не поможет (чат не найден и т. п.)
+                        self.failed += 1
+                        logger.error(f"Уведомление в чат {chat_id} отклонено: {e}")
+                        return e
+                    except (TimedOut, NetworkError) as e:
+                        delay = NETWORK_RETRY_DELAY * 2 ** attempt
+                        error = e
+                    except Exception as e:
+                        self.failed += 1
+                        logger.error(f"Ошибка при отправке уведомления в чат {chat_id}: {e}")
+                        return e
+                    else:
+                        self.sent += 1
+                        waited = time.perf_counter() - queued_at
+                        self.total_delay += waited
+                        self.max_delay = max(self.max_delay, waited)
+                        return None
+                    if attempt < self.max_retries:
+                        self.retried += 1
+                        logger.warning(f"Повтор уведомления в чат {chat_id} через {delay:.1f} с: {error}")
+                        await asyncio.sleep(delay)
+                self.failed += 1
+                logger.error(f"Уведомление в чат {chat_id} не доставлено после {self.max_retries + 1} попыток: {error}")
+                return error
+        finally:
+            lane.pending -= 1
+
+    async def drain(self, timeout: float = None) -> int:
+        """Ждет доставки поставленных сообщений (при остановке бота); возвращает число недоставленных"""
+        tasks = list(self._tasks)
+        if not tasks:
+            return 0
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        return len(pending)
+
+    def stats(self) -> dict:
+        """Метрики рассылки"""
+        return {
+            'sent': self.sent,
+            'retried': self.retried,
+            'failed': self.failed,
+            'queued': len(self._tasks),
+            'avg_delay_ms': round(self.total_delay / self.sent * 1000, 1) if self.sent else 0.0,
+            'max_delay_ms': round(self.max_delay * 1000, 1),
+        }
+
+notification_dispatcher = NotificationDispatcher()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+"""
+Статистика загрузки столов: агрегат occupancy_daily по (день, стол, час).
+Бот обновляет его в той же транзакции, что и статус бронирования;
+пересборка из reservations и архива — для заполнения и исправления расхождений.
+
+Пример:
+    python occupancy.py --rebuild
+    python occupancy.py --rebuild --since 2025-01-01
+"""
+import argparse
+import asyncio
+import logging
+import time
+from collections import Counter
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import select, delete, insert, func, tuple_
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from db import async_session, engine, init_db, OccupancyDaily
+from archive import history_stmt
+
+logger = logging.getLogger(__name__)
+
+# Строк истории, читаемых за один запрос при пересборке
+REBUILD_BATCH_SIZE = 5000
+
+def is_counted(status: Optional[str]) -> bool:
+    """Занимает ли стол бронирование в этом статусе (None — бронирования еще/уже нет)"""
+    return status is not None and status != 'cancelled'
+
+def occupancy_buckets(start: datetime, end: datetime) -> Dict[Tuple[date, int], int]:
+    """Минуты интервала [start, end) по часам: {(день, час): минуты}"""
+    buckets = {}
+    current = start
+    while current < end:
+        hour_end = current.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+        chunk_end = min(hour_end, end)
+        minutes = int((chunk_end - current).total_seconds() // 60)
+        if minutes:
+            buckets[(current.date(), current.hour)] = minutes
+        current = chunk_end
+    return buckets
+
+def booking_rows(table_id: int, start: datetime, end: datetime, sign: int = 1) -> List[dict]:
+    """Строки агрегата для одного бронирования: минуты по часам, само бронирование — в часе начала"""
+    buckets = occupancy_buckets(start, end)
+    buckets.setdefault((start.date(), start.hour), 0)
+    return [
+        {'day': day, 'table_id': table_id, 'hour': hour, 'booked_minutes': sign * minutes,
+         'bookings': sign if (day, hour) == (start.date(), start.hour) else 0}
+        for (day, hour), minutes in buckets.items()
+    ]
+
+def _upsert_stmt(rows: List[dict]):
+    """INSERT ... ON CONFLICT DO UPDATE, прибавляющий значения к уже накопленным"""
+    insert_fn = postgresql_insert if engine.dialect.name == 'postgresql' else sqlite_insert
+    stmt = insert_fn(OccupancyDaily).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=['day', 'table_id', 'hour'],
+        set_={
+            'booked_minutes': OccupancyDaily.booked_minutes + stmt.excluded.booked_minutes,
+            'bookings': OccupancyDaily.bookings + stmt.excluded.bookings,
+        }
+    )
+
+async def record_transition(session, table_id: int, start: datetime, end: datetime,
+                            old_status: Optional[str], new_status: str):
+    """
+    Учитывает смену статуса бронирования в агрегате (в транзакции вызывающего, до commit).
+    Меняется только переход между занимающими стол и отмененными статусами:
+    создание и отмена сдвигают счетчики, подтверждение и истечение их не меняют.
+    """
+    sign = int(is_counted(new_status)) - int(is_counted(old_status))
+    if not sign:
+        return
+    await session.execute(_upsert_stmt(booking_rows(table_id, start, end, sign)))
+
+@dataclass
+class RebuildReport:
+    """Итог пересборки агрегата"""
+    bookings: int
+    rows: int
+    since: Optional[date]
+    duration: float
+
+    def __str__(self):
+        since = self.since.strftime('%Y-%m-%d') if self.since else 'начала'
+        return (f"Агрегат загрузки пересобран с {since}: бронирований {self.bookings}, "
+                f"строк {self.rows} ({self.duration * 1000:.0f} мс)")
+
+async def rebuild_occupancy(since: date = None, batch_size: int = REBUILD_BATCH_SIZE) -> RebuildReport:
+    """
+    Пересчитывает агрегат с дня since (None — целиком) по reservations и архиву.
+    История читается пакетами по ключу (start_time, id) и суммируется в памяти
+    (строк агрегата не больше дней * столов * часов), затем старые строки
+    заменяются новыми в одной короткой транзакции.
+    """
+    started = time.perf_counter()
+    since_time = datetime.combine(since, datetime.min.time()) if since else None
+    # Бронирования, начавшиеся до since, попадают в выборку ради минут после since
+    history = history_stmt(start=since_time)
+    minutes = Counter()
+    bookings = Counter()
+    total = 0
+    position = None
+    async with async_session() as session:
+        while True:
+            stmt = select(history.c.id, history.c.table_id, history.c.start_time, history.c.end_time, history.c.status)
+            if position:
+                stmt = stmt.where(tuple_(history.c.start_time, history.c.id) > tuple_(*position))
+            batch = (await session.execute(
+                stmt.order_by(history.c.start_time, history.c.id).limit(batch_size)
+            )).all()
+            for row in batch:
+                if not is_counted(row.status):
+                    continue
+                total += 1
+                for item in booking_rows(row.table_id, row.start_time, row.end_time):
+                    if since and item['day'] < since:
+                        continue
+                    key = (item['day'], row.table_id, item['hour'])
+                    minutes[key] += item['booked_minutes']
+                    bookings[key] += item['bookings']
+            if len(batch) < batch_size:
+                break
+            position = (batch[-1].start_time, batch[-1].id)
+
+    rows = [
+        {'day': day, 'table_id': table_id, 'hour': hour, 'booked_minutes': value,
+         'bookings': bookings[(day, table_id, hour)]}
+        for (day, table_id, hour), value in minutes.items()
+    ]
+    async with async_session() as session:
+        stmt = delete(OccupancyDaily)
+        if since:
+            stmt = stmt.where(OccupancyDaily.day >= since)
+        await session.execute(stmt)
+        for i in range(0, len(rows), batch_size):
+            await session.execute(insert(OccupancyDaily), rows[i:i + batch_size])
+        await session.commit()
+    return RebuildReport(total, len(rows), since, time.perf_counter() - started)
+
+async def backfill_occupancy_if_empty() -> Optional[RebuildReport]:
+    """При первом запуске с новой таблицей заполняет агрегат по уже существующим бронированиям"""
+    async with async_session() as session:
+        if await session.scalar(select(OccupancyDaily.day).limit(1)) is not None:
+            return None
+    report = await rebuild_occupancy()
+    return report if report.rows else None
+
+@dataclass
+class OccupancySummary:
+    """Загрузка за период [start, end]: по столам {table_id: (минуты, бронирования)} и по часам {час: минуты}"""
+    start: date
+    end: date
+    by_table: Dict[int, Tuple[int, int]]
+    by_hour: Dict[int, int]
+
+    @property
+    def days(self) -> int:
+        return (self.end - self.start).days + 1
+
+async def fetch_occupancy(session, start: date, end: date) -> OccupancySummary:
+    """Сводка только из агрегата: диапазон по первичному ключу (day, table_id, hour)"""
+    period = (OccupancyDaily.day >= start, OccupancyDaily.day <= end)
+    by_table = (await session.execute(
+        select(OccupancyDaily.table_id, func.sum(OccupancyDaily.booked_minutes), func.sum(OccupancyDaily.bookings))
+        .where(*period).group_by(OccupancyDaily.table_id)
+    )).all()
+    by_hour = (await session.execute(
+        select(OccupancyDaily.hour, func.sum(OccupancyDaily.booked_minutes))
+        .where(*period).group_by(OccupancyDaily.hour)
+    )).all()
+    return OccupancySummary(
+        start, end,
+        {table_id: (int(minutes or 0), int(count or 0)) for table_id, minutes, count in by_table},
+        {hour: int(minutes or 0) for hour, minutes in by_hour}
+    )
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rebuild', action='store_true', help='Пересобрать агрегат по бронированиям и архиву')
+    parser.add_argument('--since', type=date.fromisoformat, default=None, help='Пересобрать начиная с дня (YYYY-MM-DD)')
+    parser.add_argument('--batch-size', type=int, default=REBUILD_BATCH_SIZE, help='Строк истории за один запрос')
+    return parser.parse_args()
+
+async def main():
+    args = parse_args()
+    await init_db()
+    if args.rebuild:
+        logger.info(str(await rebuild_occupancy(args.since, args.batch_size)))
+    else:
+        today = date.today()
+        async with async_session() as session:
+            summary = await fetch_occupancy(session, today - timedelta(days=6), today)
+        for table_id, (minutes, count) in sorted(summary.by_table.items()):
+            logger.info(f"Стол {table_id}: {minutes / 60:.1f} ч, бронирований {count}")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    asyncio.run(main())
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+"""
+Очередь исходящих сообщений: обработчики записывают сообщения в таблицу outbox
+в той же транзакции, что и изменение бронирования, фоновая задача бота отправляет их.
+Доставка «хотя бы один раз»: сообщение помечается отправленным только после ответа Telegram.
+
+Пример:
+    python outbox.py               # состояние очереди
+    python outbox.py --retry-dead
+"""
+import argparse
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Iterable
+from sqlalchemy import select, update, delete, func
+from db import async_session, init_db, OutboxMessage
+from notifications import notification_dispatcher, is_retryable
+from config import (
+    OUTBOX_POLL_INTERVAL, OUTBOX_BATCH_SIZE, OUTBOX_RETRY_DELAY, OUTBOX_MAX_ATTEMPTS, OUTBOX_RETENTION_DAYS
+)
+
+logger = logging.getLogger(__name__)
+
+# На столько секунд взятый в работу пакет скрыт от повторной выборки
+# (если процесс упадет во время отправки, сообщения уйдут после этой паузы)
+LEASE_SECONDS = 300
+# Наибольшая пауза между повторами
+MAX_RETRY_DELAY = 3600
+
+def enqueue(session, chat_id: int, text: str):
+    """Добавляет сообщение в очередь в транзакции сессии (отправится после commit)"""
+    session.add(OutboxMessage(chat_id=chat_id, text=text, next_attempt_at=datetime.utcnow()))
+
+def enqueue_many(session, chat_ids: Iterable[int], text: str):
+    for chat_id in chat_ids:
+        enqueue(session, chat_id, text)
+
+def due_batch_stmt(now: datetime, batch_size: int):
+    """Очередной пакет к отправке по индексу ix_outbox_status_due"""
+    return (
+        select(OutboxMessage.id)
+        .where(OutboxMessage.status == 'pending', OutboxMessage.next_attempt_at <= now)
+        .order_by(OutboxMessage.next_attempt_at, OutboxMessage.id)
+        .limit(batch_size)
+    )
+
+def retry_delay(attempts: int, base: int = OUTBOX_RETRY_DELAY) -> int:
+    return min(base * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+
+class OutboxWorker:
+    """
+    Фоновая отправка очереди outbox: пакет берется в работу (аренда на LEASE_SECONDS),
+    отправляется через notification_dispatcher с его ограничениями частоты, затем
+    результаты записываются одной транзакцией. Неудачные попытки повторяются
+    с растущей паузой, после max_attempts или при неустранимой ошибке (бот
+    заблокирован, чат не найден) сообщение получает статус dead.
+    """
+
+    def __init__(self, batch_size: int = OUTBOX_BATCH_SIZE, max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+                 poll_interval: float = OUTBOX_POLL_INTERVAL):
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self.sent = 0
+        self.retried = 0
+        self.dead = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def wake(self):
+        """Отправить очередь сразу, не дожидаясь опроса (вызывается после commit)"""
+        self._wakeup.set()
+
+    def stop(self):
+        """Завершить run() после текущего пакета (результаты отправки успеют записаться)"""
+        self._stopping = True
+        self._wakeup.set()
+
+    async def _claim(self, now: datetime):
+        async with async_session() as session:
+            ids = (await session.execute(due_batch_stmt(now, self.batch_size))).scalars().all()
+            if not ids:
+                return []
+            await session.execute(
+                update(OutboxMessage)
+                .where(OutboxMessage.id.in_(ids))
+                .values(next_attempt_at=now + timedelta(seconds=LEASE_SECONDS))
+                .execution_options(synchronize_session=False)
+            )
+            rows = (await session.execute(
+                select(OutboxMessage.id, OutboxMessage.chat_id, OutboxMessage.text,
+                       OutboxMessage.attempts, OutboxMessage.created_at)
+                .where(OutboxMessage.id.in_(ids))
+                .order_by(OutboxMessage.id)
+            )).all()
+            await session.commit()
+        return rows
+
+    async def process_batch(self, bot) -> int:
+        """Отправляет один пакет; возвращает число взятых в работу сообщений"""
+        rows = await self._claim(datetime.utcnow())
+        if not rows:
+            return 0
+        # Сообщения одного чата диспетчер отправляет по порядку постановки
+        errors = await asyncio.gather(*(notification_dispatcher.send(bot, row.chat_id, row.text) for row in rows))
+
+        now = datetime.utcnow()
+        sent_ids = []
+        async with async_session() as session:
+            for row, error in zip(rows, errors):
+                if error is None:
+                    sent_ids.append(row.id)
+                    latency = (now - row.created_at).total_seconds() if row.created_at else 0.0
+                    self.total_latency += latency
+                    self.max_latency = max(self.max_latency, latency)
+                    continue
+                attempts = row.attempts + 1
+                values = {'attempts': attempts, 'last_error': str(error)[:500]}
+                if is_retryable(error) and attempts < self.max_attempts:
+                    values['next_attempt_at'] = now + timedelta(seconds=retry_delay(attempts))
+                    self.retried += 1
+                else:
+                    values['status'] = 'dead'
+                    self.dead += 1
+                    logger.error(f"Сообщение #{row.id} в чат {row.chat_id} отложено после {attempts} попыток: {error}")
+                await session.execute(update(OutboxMessage).where(OutboxMessage.id == row.id).values(**values))
+            if sent_ids:
+                await session.execute(
+                    update(OutboxMessage)
+                    .where(OutboxMessage.id.in_(sent_ids))
+                    .values(status='sent', sent_at=now, attempts=OutboxMessage.attempts + 1)
+                    .execution_options(synchronize_session=False)
+                )
+            await session.commit()
+        self.sent += len(sent_ids)
+        return len(rows)
+
+    async def drain(self, bot) -> int:
+        """Отправляет все сообщения, срок которых наступил; возвращает их число"""
+        total = 0
+        while True:
+            count = await self.process_batch(bot)
+            total += count
+            if count < self.batch_size:
+                return total
+
+    async def purge_sent(self, retention_days: int = OUTBOX_RETENTION_DAYS) -> int:
+        """Удаляет отправленные сообщения старше retention_days дней"""
+        cutoff = datetime.utcnow() - timedelta(days=retention_days)
+        async with async_session() as session:
+            result = await session.execute(
+                delete(OutboxMessage)
+                .where(OutboxMessage.status == 'sent', OutboxMessage.sent_at < cutoff)
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+        return result.rowcount
+
+    async def run(self, bot):
+        """Фоновая задача бота: сразу после запуска, по wake() и не реже раза в poll_interval секунд"""
+        last_purge = 0.0
+        self._stopping = False
+        while not self._stopping:
+            self._wakeup.clear()
+            try:
+                await self.drain(bot)
+                if time.monotonic() - last_purge > 3600:
+                    last_purge = time.monotonic()
+                    purged = await self.purge_sent()
+                    if purged:
+                        logger.info(f"Удалено отправленных сообщений из очереди: {purged}")
+            except Exception as e:
+                logger.error(f"Ошибка при отправке очереди сообщений: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def stats(self) -> dict:
+        """Глубина очереди по статусам и задержка от записи до отправки"""
+        async with async_session() as session:
+            counts = dict((await session.execute(
+                select(OutboxMessage.status, func.count()).group_by(OutboxMessage.status)
+            )).all())
+            oldest = await session.scalar(
+                select(func.min(OutboxMessage.created_at)).where(OutboxMessage.status == 'pending')
+            )
+        return {
+            'pending': counts.get('pending', 0),
+            'dead': counts.get('dead', 0),
+            'oldest_pending_s': round((datetime.utcnow() - oldest).total_seconds(), 1) if oldest else 0.0,
+            # Счетчики с запуска процесса
+            'sent': self.sent,
+            'retried': self.retried,
+            'dead_since_start': self.dead,
+            'avg_latency_ms': round(self.total_latency / self.sent * 1000, 1) if self.sent else 0.0,
+            'max_latency_ms': round(self.max_latency * 1000, 1),
+        }
+
+outbox_worker = OutboxWorker()
+
+async def retry_dead() -> int:
+    """Возвращает отложенные сообщения в очередь"""
+    async with async_session() as session:
+        result = await session.execute(
+            update(OutboxMessage)
+            .where(OutboxMessage.status == 'dead')
+            .values(status='pending', attempts=0, next_attempt_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+    return result.rowcount
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--retry-dead', action='store_true', help='Вернуть отложенные сообщения в очередь')
+    return parser.parse_args()
+
+async def main():
+    args = parse_args()
+    await init_db()
+    if args.retry_dead:
+        logger.info(f"Возвращено в очередь сообщений: {await retry_dead()}")
+    logger.info(f"Очередь сообщений: {await outbox_worker.stats()}")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    asyncio.run(main())
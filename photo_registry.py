@@ -0,0 +1,53 @@
+import logging
+from sqlalchemy import select, delete
+from db import async_session, PhotoFile
+
+logger = logging.getLogger(__name__)
+
+class PhotoFileRegistry:
+    """
+    Реестр file_id фотографий, уже загруженных в Telegram.
+    Хранит соответствие "ключ состояния изображения -> file_id" в памяти
+    и дублирует его в таблицу photo_files, чтобы переживать перезапуски бота.
+    """
+
+    def __init__(self):
+        self._file_ids = {}
+
+    async def load(self):
+        """Загружает сохраненные file_id из базы данных"""
+        async with async_session() as session:
+            result = await session.execute(select(PhotoFile))
+            self._file_ids = {row.key: row.file_id for row in result.scalars().all()}
+        logger.info(f"Загружено {len(self._file_ids)} сохраненных file_id изображений")
+
+    def get(self, key: str):
+        return self._file_ids.get(key)
+
+    async def remember(self, key: str, file_id: str):
+        """Запоминает file_id для ключа и сохраняет его в базе данных"""
+        if self._file_ids.get(key) == file_id:
+            return
+        self._file_ids[key] = file_id
+        try:
+            async with async_session() as session:
+                photo = await session.scalar(select(PhotoFile).where(PhotoFile.key == key))
+                if photo:
+                    photo.file_id = file_id
+                else:
+                    session.add(PhotoFile(key=key, file_id=file_id))
+                await session.commit()
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении file_id для {key}: {e}")
+
+    async def forget(self, key: str):
+        """Удаляет file_id, который Telegram больше не принимает"""
+        self._file_ids.pop(key, None)
+        try:
+            async with async_session() as session:
+                await session.execute(delete(PhotoFile).where(PhotoFile.key == key))
+                await session.commit()
+        except Exception as e:
+            logger.error(f"Ошибка при удалении file_id для {key}: {e}")
+
+photo_registry = PhotoFileRegistry()
@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta, date
+from typing import List, Tuple
+from sqlalchemy import select
+from db import Reservation
+from availability import AvailabilityIndex
+from availability_grid import AvailabilityGrid
+
+def active_reservations_stmt(table_id: int, start: datetime, end: datetime):
+    """Запрос неотмененных бронирований стола, пересекающихся с [start, end)"""
+    return (
+        select(Reservation.start_time, Reservation.end_time)
+        .where(
+            Reservation.table_id == table_id,
+            Reservation.start_time < end,
+            Reservation.end_time > start,
+            Reservation.status != 'cancelled'
+        )
+        .order_by(Reservation.start_time)
+    )
+
+def day_bounds(day: date) -> Tuple[datetime, datetime]:
+    start = datetime.combine(day, datetime.min.time())
+    return start, start + timedelta(days=1)
+
+async def fetch_busy_intervals(session, table_id: int, start: datetime, end: datetime) -> List[Tuple[datetime, datetime]]:
+    """Одним запросом получает занятые интервалы стола в диапазоне [start, end)"""
+    result = await session.execute(active_reservations_stmt(table_id, start, end))
+    return [(row.start_time, row.end_time) for row in result.all()]
+
+def reservations_by_status_stmt(start: datetime, end: datetime, statuses):
+    """Запрос бронирований всех столов с указанными статусами, пересекающихся с [start, end)"""
+    return (
+        select(Reservation.id, Reservation.table_id, Reservation.start_time, Reservation.end_time, Reservation.status)
+        .where(
+            Reservation.start_time < end,
+            Reservation.end_time > start,
+            Reservation.status.in_(statuses)
+        )
+    )
+
+async def load_availability_index(session, start: datetime, end: datetime, statuses=None, table_ids=None) -> AvailabilityIndex:
+    """
+    Строит индекс занятости всех (или указанных) столов по бронированиям, пересекающимся с [start, end).
+    По умолчанию (statuses=None) стол занимают бронирования в любом статусе, кроме отмененного
+    """
+    index = AvailabilityIndex(statuses)
+    if statuses is None:
+        for reservation_id, table_id, start_time, end_time in await fetch_active_reservations(session, start, end, table_ids, with_ids=True):
+            index.add(table_id, start_time, end_time, reservation_id)
+        return index
+    result = await session.execute(reservations_by_status_stmt(start, end, statuses))
+    for row in result.all():
+        if table_ids is None or row.table_id in table_ids:
+            index.upsert(row._asdict())
+    return index
+
+def active_reservations_range_stmt(start: datetime, end: datetime, table_ids=None, with_ids: bool = False):
+    """Запрос неотмененных бронирований всех (или указанных) столов, пересекающихся с [start, end)"""
+    columns = [Reservation.table_id, Reservation.start_time, Reservation.end_time]
+    if with_ids:
+        columns.insert(0, Reservation.id)
+    stmt = select(*columns).where(
+        Reservation.start_time < end,
+        Reservation.end_time > start,
+        Reservation.status != 'cancelled'
+    )
+    if table_ids is not None:
+        stmt = stmt.where(Reservation.table_id.in_(list(table_ids)))
+    return stmt
+
+async def fetch_active_reservations(session, start: datetime, end: datetime, table_ids=None, with_ids: bool = False) -> List[tuple]:
+    """
+    Одной выгрузкой получает неотмененные бронирования всех (или указанных) столов в диапазоне.
+    Возвращает кортежи (table_id, start_time, end_time), а с with_ids=True — (id, table_id, start_time, end_time)
+    """
+    result = await session.execute(active_reservations_range_stmt(start, end, table_ids, with_ids))
+    return [tuple(row) for row in result.all()]
+
+async def load_availability_grid(session, days: List[date], tables, slot_times, now: datetime = None) -> AvailabilityGrid:
+    """
+    Строит сетку доступности (дни × столы × слоты) по одной выгрузке бронирований
+    
+    Args:
+        session: Сессия базы данных
+        days: Дни сетки (по возрастанию)
+        tables: Объекты столов с полями id и is_available
+        slot_times: Сетка слотов клуба [(начало, конец), ...]
+        now: Слоты, начавшиеся раньше этого времени, считаются занятыми (опционально)
+    """
+    table_ids = [t.id for t in tables]
+    range_start, _ = day_bounds(days[0])
+    _, range_end = day_bounds(days[-1])
+    reservations = await fetch_active_reservations(session, range_start, range_end, table_ids)
+    unavailable = [t.id for t in tables if not t.is_available]
+    return AvailabilityGrid.build(days, table_ids, slot_times, reservations, unavailable, now)
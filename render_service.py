@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config import RENDER_WORKERS
+from utils import create_table_layout_image, get_table_layout_key, get_cached_table_layout_image
+
+logger = logging.getLogger(__name__)
+
+class _RenderJob:
+    """Отрисовка, поставленная в пул: момент постановки и признак начала"""
+    __slots__ = ('submitted_at', 'started')
+
+    def __init__(self):
+        self.submitted_at = time.perf_counter()
+        self.started = False
+
+class RenderService:
+    """
+    Сервис отрисовки схемы столов вне цикла событий asyncio.
+    Отрисовка и кодирование PNG выполняются в ограниченном пуле потоков,
+    одинаковые одновременные запросы объединяются в одну отрисовку.
+    """
+
+    def __init__(self, max_workers: int = RENDER_WORKERS):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='render')
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._queued = 0
+        self.renders = 0
+        self.coalesced = 0
+        self.cache_hits = 0
+        self.total_render_time = 0.0
+        self.max_render_time = 0.0
+        self.total_queue_wait = 0.0
+
+    def _render(self, table_states, job: _RenderJob) -> bytes:
+        started_at = time.perf_counter()
+        with self._lock:
+            job.started = True
+            self._queued -= 1
+            self.total_queue_wait += started_at - job.submitted_at
+        img_bytes = create_table_layout_image(table_states)
+        render_time = time.perf_counter() - started_at
+        with self._lock:
+            self.renders += 1
+            self.total_render_time += render_time
+            self.max_render_time = max(self.max_render_time, render_time)
+        logger.debug(f"Схема столов отрисована за {render_time * 1000:.1f} мс")
+        return img_bytes
+
+    async def render_table_layout(self, table_states) -> bytes:
+        """
+        Асинхронно возвращает PNG со схемой столов
+        
+        Args:
+            table_states: Список словарей с номерами и доступностью столов
+            
+        Returns:
+            bytes: Изображение в формате PNG
+        """
+        key = get_table_layout_key(table_states)
+        img_bytes = get_cached_table_layout_image(key)
+        if img_bytes is not None:
+            self.cache_hits += 1
+            return img_bytes
+
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        with self._lock:
+            self._queued += 1
+            queued = self._queued
+        if queued > self.max_workers:
+            logger.warning(f"Очередь отрисовки: {queued} запросов на {self.max_workers} потоков")
+
+        job = _RenderJob()
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, self._render, list(table_states), job)
+        self._inflight[key] = future
+        future.add_done_callback(lambda _: self._finish(key, job))
+        return await asyncio.shield(future)
+
+    def _finish(self, key, job: _RenderJob):
+        self._inflight.pop(key, None)
+        with self._lock:
+            # Отрисовка отменена до начала (shutdown с cancel_futures): из очереди ее никто не вычел
+            if not job.started:
+                self._queued -= 1
+
+    def stats(self) -> dict:
+        """Возвращает метрики для подбора размера пула"""
+        with self._lock:
+            renders = self.renders
+            return {
+                'workers': self.max_workers,
+                'queue_depth': self._queued,
+                'in_flight': len(self._inflight),
+                'renders': renders,
+                'coalesced': self.coalesced,
+                'cache_hits': self.cache_hits,
+                'avg_render_ms': self.total_render_time / renders * 1000 if renders else 0.0,
+                'max_render_ms': self.max_render_time * 1000,
+                'avg_queue_wait_ms': self.total_queue_wait / renders * 1000 if renders else 0.0,
+            }
+
+    def shutdown(self):
+        logger.info(f"Статистика отрисовки: {self.stats()}")
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+render_service = RenderService()
@@ -0,0 +1,149 @@
+import logging
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Версия формата данных кнопок: v1:<действие>[:<аргумент>...]
+CALLBACK_VERSION = 'v1'
+SEPARATOR = ':'
+# Ограничение Telegram на callback_data
+MAX_CALLBACK_DATA = 64
+# Ключ context.user_data с текущим шагом ввода текста (регистрация, настройки клуба)
+INPUT_STATE_KEY = 'input_state'
+
+def cb(action: str, *args) -> str:
+    """Данные кнопки для действия action: v1:<действие>:<аргументы>"""
+    data = SEPARATOR.join((CALLBACK_VERSION, action, *(str(arg) for arg in args)))
+    if len(data.encode()) > MAX_CALLBACK_DATA:
+        raise ValueError(f"Данные кнопки длиннее {MAX_CALLBACK_DATA} байт: {data}")
+    return data
+
+def callback_payload(data: str) -> str:
+    """Данные кнопки без версии: <действие>:<аргументы> (старые данные — как есть)"""
+    prefix = CALLBACK_VERSION + SEPARATOR
+    return data[len(prefix):] if data.startswith(prefix) else data
+
+def set_input_state(context, state: str):
+    """Следующее текстовое сообщение пользователя обработает обработчик состояния state"""
+    context.user_data[INPUT_STATE_KEY] = state
+
+def clear_input_state(context):
+    context.user_data.pop(INPUT_STATE_KEY, None)
+
+@dataclass(frozen=True)
+class Route:
+    action: str
+    handler: Callable
+    admin_only: bool = False
+
+class _TrieNode:
+    __slots__ = ('children', 'bare', 'with_args')
+
+    def __init__(self):
+        self.children = {}
+        # Действие для данных без аргументов и с аргументами после имени
+        self.bare = None
+        self.with_args = None
+
+class Router:
+    """
+    Единая точка входа для нажатий кнопок и текстовых сообщений вместо цепочки
+    CallbackQueryHandler с регулярными выражениями, которые PTB проверяет по очереди.
+
+    Данные кнопок v1:<действие>:<аргументы> разбираются одним split и находятся
+    в словаре действий. Старые данные (кнопки в сообщениях, отправленных до перехода
+    на v1) разбираются деревом по словам имени ("select_table_5" → select → table,
+    аргумент "5"): самое длинное совпадение, с учетом того, есть ли аргументы,
+    поэтому "confirm_booking" и "confirm_booking_12" ведут к разным действиям.
+    Данные вида mb:..., ab:..., occ:... без версии ищутся в словаре по первому слову.
+
+    Аргументы передаются обработчику в context.args (строки).
+    Текст маршрутизируется по состоянию context.user_data[INPUT_STATE_KEY].
+    """
+
+    def __init__(self, is_admin: Callable = None):
+        self._routes: Dict[str, Route] = {}
+        self._legacy = _TrieNode()
+        self._states: Dict[str, Callable] = {}
+        self._is_admin = is_admin
+        self.unknown_callback = None
+        self.unknown_text = None
+        self.unmatched = 0
+
+    def add(self, action: str, handler: Callable, admin_only: bool = False):
+        if SEPARATOR in action:
+            raise ValueError(f"Недопустимое имя действия: {action}")
+        self._routes[action] = Route(action, handler, admin_only)
+
+    def add_legacy(self, name: str, action: str, with_args: bool = False):
+        """Старые данные name (или name_<аргументы> при with_args) ведут к действию action"""
+        node = self._legacy
+        for token in name.split('_'):
+            node = node.children.setdefault(token, _TrieNode())
+        if with_args:
+            node.with_args = action
+        else:
+            node.bare = action
+
+    def add_state(self, state: str, handler: Callable):
+        self._states[state] = handler
+
+    def _resolve_legacy(self, data: str) -> Optional[Tuple[str, List[str]]]:
+        tokens = data.split('_')
+        node = self._legacy
+        found = None
+        for depth, token in enumerate(tokens):
+            node = node.children.get(token)
+            if node is None:
+                break
+            rest = tokens[depth + 1:]
+            action = node.with_args if rest else node.bare
+            if action:
+                found = (action, rest)
+        return found
+
+    def resolve(self, data: str) -> Optional[Tuple[Route, List[str]]]:
+        """Маршрут и аргументы для данных кнопки; None — данные не распознаны"""
+        if not data:
+            return None
+        parts = data.split(SEPARATOR)
+        if parts[0] == CALLBACK_VERSION and len(parts) > 1:
+            action, args = parts[1], parts[2:]
+        elif len(parts) > 1:
+            action, args = parts[0], parts[1:]
+        else:
+            found = self._resolve_legacy(data)
+            if not found:
+                return None
+            action, args = found
+        route = self._routes.get(action)
+        return (route, args) if route else None
+
+    async def dispatch(self, update, context):
+        """Обработчик всех CallbackQuery"""
+        query = update.callback_query
+        resolved = self.resolve(query.data)
+        if resolved is None:
+            self.unmatched += 1
+            logger.warning(f"Неизвестные данные кнопки: {query.data!r}")
+            if self.unknown_callback:
+                await self.unknown_callback(update, context)
+            else:
+                await query.answer()
+            return
+        route, args = resolved
+        if route.admin_only and self._is_admin and not await self._is_admin(update.effective_user.id):
+            logger.warning(f"Пользователь {update.effective_user.id} без прав нажал кнопку {route.action}")
+            await query.answer()
+            return
+        context.args = args
+        await route.handler(update, context)
+
+    async def dispatch_text(self, update, context):
+        """Обработчик текстовых сообщений (не команд): по текущему шагу ввода"""
+        handler = self._states.get(context.user_data.get(INPUT_STATE_KEY))
+        if handler is None:
+            handler = self.unknown_text
+        if handler:
+            await handler(update, context)
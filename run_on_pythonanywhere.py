@@ -1,33 +1,11 @@
 #!/usr/bin/env python
 """
 Скрипт для запуска бота на PythonAnywhere
-Этот скрипт заменяет импорт db.py на db_pythonanywhere.py для решения проблемы с асинхронным SQLite
+Бот запускается с синхронным бэкендом SQLite (DB_BACKEND=sync) для решения проблемы с асинхронным SQLite
 """
 import os
 import sys
 import subprocess
-import shutil
-
-def modify_bot_file():
-    """Модифицирует bot.py для работы на PythonAnywhere"""
-    print("Модификация bot.py для PythonAnywhere...")
-    
-    # Создаем резервную копию оригинального файла
-    shutil.copy("bot.py", "bot.py.backup")
-    
-    with open("bot.py", "r", encoding="utf-8") as f:
-        content = f.read()
-    
-    # Заменяем импорт db на db_pythonanywhere
-    modified_content = content.replace(
-        "from db import async_session, User, Table, Reservation, ClubSettings, init_db",
-        "from db_pythonanywhere import async_session, User, Table, Reservation, ClubSettings, init_db"
-    )
-    
-    with open("bot.py", "w", encoding="utf-8") as f:
-        f.write(modified_content)
-    
-    print("Файл bot.py успешно модифицирован.")
 
 def setup_environment():
     """Настраивает окружение для запуска бота на PythonAnywhere"""
@@ -36,6 +14,9 @@ def setup_environment():
     # Устанавливаем переменную окружения для определения PythonAnywhere
     os.environ["PYTHONANYWHERE_DOMAIN"] = "pythonanywhere.com"
     
+    # Синхронный драйвер SQLite в пуле потоков вместо aiosqlite (см. db.create_backend)
+    os.environ.setdefault("DB_BACKEND", "sync")
+    
     # Проверяем наличие .env файла
     if not os.path.exists(".env"):
         print("Создание .env файла...")
@@ -62,7 +43,6 @@ def run_bot():
 if __name__ == "__main__":
     print("=== Настройка и запуск бота на PythonAnywhere ===")
     setup_environment()
-    modify_bot_file()
     
     # Запускаем бота
     process = run_bot()
@@ -0,0 +1,99 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import time
+from typing import Callable, List, Tuple
+from sqlalchemy import select
+from db import async_session, ClubSettings
+from config import get_club_settings
+from utils import get_time_slots
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class ClubSettingsSnapshot:
+    """Неизменяемый снимок настроек клуба"""
+    opening_time: str
+    closing_time: str
+    slot_duration: int
+
+    @classmethod
+    def from_model(cls, settings: ClubSettings) -> 'ClubSettingsSnapshot':
+        return cls(settings.opening_time, settings.closing_time, int(settings.slot_duration))
+
+    @classmethod
+    def defaults(cls) -> 'ClubSettingsSnapshot':
+        defaults = get_club_settings()
+        return cls(defaults["opening_time"], defaults["closing_time"], defaults["slot_duration"])
+
+def build_slot_times(settings: ClubSettingsSnapshot) -> List[Tuple[time, time]]:
+    """Сетка слотов клуба без привязки к дате: [(начало, конец), ...]"""
+    return [
+        (start.time(), end.time())
+        for start, end in get_time_slots(settings.opening_time, settings.closing_time, settings.slot_duration)
+    ]
+
+class ClubSettingsCache:
+    """
+    Кэш строки club_settings в памяти.
+    Строка загружается из базы один раз; изменения из админ-панели
+    заменяют снимок целиком через set() и оповещают подписчиков.
+    """
+
+    def __init__(self):
+        self._snapshot = None
+        self._slot_times = None
+        self._lock = asyncio.Lock()
+        self._listeners: List[Callable[[ClubSettingsSnapshot], None]] = []
+        # Сетка слотов пересобирается при каждом изменении настроек
+        self.add_listener(self._rebuild_slot_times)
+
+    def add_listener(self, listener: Callable[[ClubSettingsSnapshot], None]):
+        """Подписывает функцию на изменения настроек; она получает новый снимок"""
+        self._listeners.append(listener)
+
+    def _rebuild_slot_times(self, settings: ClubSettingsSnapshot):
+        self._slot_times = build_slot_times(settings)
+
+    async def get(self) -> ClubSettingsSnapshot:
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot
+        async with self._lock:
+            if self._snapshot is None:
+                self.set(await self._load())
+            return self._snapshot
+
+    async def get_slot_times(self) -> List[Tuple[time, time]]:
+        await self.get()
+        return self._slot_times
+
+    async def _load(self) -> ClubSettingsSnapshot:
+        async with async_session() as session:
+            settings = await session.scalar(select(ClubSettings))
+            if not settings:
+                # Создаем строку с настройками по умолчанию, как в init_db
+                defaults = ClubSettingsSnapshot.defaults()
+                settings = ClubSettings(
+                    opening_time=defaults.opening_time,
+                    closing_time=defaults.closing_time,
+                    slot_duration=defaults.slot_duration
+                )
+                session.add(settings)
+                await session.commit()
+            return ClubSettingsSnapshot.from_model(settings)
+
+    def set(self, snapshot: ClubSettingsSnapshot):
+        """Атомарно заменяет снимок настроек (после записи в базу) и оповещает подписчиков"""
+        self._snapshot = snapshot
+        for listener in self._listeners:
+            try:
+                listener(snapshot)
+            except Exception as e:
+                logger.error(f"Ошибка в подписчике на изменение настроек клуба: {e}")
+
+    def invalidate(self):
+        """Сбрасывает снимок: следующее чтение загрузит настройки из базы"""
+        self._snapshot = None
+
+settings_cache = ClubSettingsCache()
@@ -0,0 +1,106 @@
+import asyncio
+import inspect
+import logging
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.util import await_only
+from config import get_sqlite_pragmas, WAL_CHECKPOINT_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+def install_sqlite_pragmas(sync_engine, profile: str = None):
+    """
+    Подключает к движку обработчик, который применяет PRAGMA профиля
+    к каждому новому соединению SQLite. Для других СУБД ничего не делает.
+    """
+    if sync_engine.dialect.name != 'sqlite':
+        return
+    pragmas = get_sqlite_pragmas(profile)
+    if not pragmas:
+        return
+
+    @event.listens_for(sync_engine, 'connect')
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            # auto_vacuum до создания таблиц, затем journal_mode: остальные настройки от него не зависят
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+    logger.info(f"Настройки SQLite: {pragmas}")
+
+def attach_sqlite_database(sync_engine, path: str, alias: str):
+    """Подключает к каждому новому соединению SQLite еще один файл базы под именем alias (ATTACH)"""
+    if sync_engine.dialect.name != 'sqlite':
+        raise ValueError(f"Подключение отдельного файла {path} поддерживается только для SQLite")
+
+    @event.listens_for(sync_engine, 'connect')
+    def attach(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f"ATTACH DATABASE ? AS {alias}", (path,))
+        finally:
+            cursor.close()
+
+async def _run_on_connection(engine, fn):
+    """Выполняет fn(sync_connection) на соединении движка: асинхронного или синхронного (в потоке)"""
+    if isinstance(engine, AsyncEngine):
+        async with engine.connect() as conn:
+            return await conn.run_sync(fn)
+    def run():
+        with engine.connect() as conn:
+            return fn(conn)
+    return await asyncio.to_thread(run)
+
+def _executescript(conn, script: str):
+    """
+    Выполняет скрипт напрямую драйвером. Нужно для incremental_vacuum: при обычном
+    execute модуль sqlite3 делает один шаг прагмы и освобождает только одну страницу.
+    """
+    result = conn.connection.driver_connection.executescript(script)
+    if inspect.isawaitable(result):
+        # aiosqlite: внутри run_sync корутина драйвера ожидается через greenlet SQLAlchemy
+        await_only(result)
+
+async def incremental_vacuum(engine, pages: int = 0) -> int:
+    """
+    Возвращает ОС свободные страницы основного файла (все при pages=0), если база
+    в режиме auto_vacuum=INCREMENTAL; возвращает число освобожденных страниц
+    """
+    if engine.dialect.name != 'sqlite':
+        return 0
+
+    def vacuum(conn):
+        if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() != 2:
+            return 0
+        before = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+        _executescript(conn, f"PRAGMA incremental_vacuum({pages});")
+        return before - conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+
+    return await _run_on_connection(engine, vacuum)
+
+async def enable_incremental_vacuum(engine):
+    """Переводит существующую базу в auto_vacuum=INCREMENTAL; требует полного VACUUM (разово, долго)"""
+    def enable(conn):
+        conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.exec_driver_sql("VACUUM")
+    await _run_on_connection(engine, lambda conn: enable(conn.execution_options(isolation_level='AUTOCOMMIT')))
+
+async def wal_checkpoint(engine, mode: str = 'PASSIVE'):
+    """Выполняет контрольную точку WAL; возвращает (busy, log, checkpointed)"""
+    statement = text(f"PRAGMA wal_checkpoint({mode})")
+    return await _run_on_connection(engine, lambda conn: tuple(conn.execute(statement).one()))
+
+async def wal_checkpoint_loop(engine, interval: int = WAL_CHECKPOINT_INTERVAL):
+    """Фоновая задача: периодически переносит WAL в основной файл базы, не давая журналу расти"""
+    if engine.dialect.name != 'sqlite' or interval <= 0:
+        return
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            busy, log_frames, checkpointed = await wal_checkpoint(engine)
+            logger.debug(f"Контрольная точка WAL: {checkpointed}/{log_frames} страниц, busy={busy}")
+        except Exception as e:
+            logger.error(f"Ошибка при выполнении контрольной точки WAL: {e}")
@@ -0,0 +1,82 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy.orm import Session
+from config import DB_EXECUTOR_WORKERS
+
+# Синхронный SQLAlchemy выполняется в отдельном ограниченном пуле потоков,
+# чтобы запросы к базе не блокировали цикл событий бота
+_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix='db')
+
+async def run_sync(fn, *args, **kwargs):
+    """Выполняет синхронную функцию в пуле потоков базы данных"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
+
+def _buffered(result):
+    # Строки выбираются целиком в потоке базы, чтобы обработчик не читал курсор из цикла событий
+    if not getattr(result, 'returns_rows', True):
+        return result
+    return result.freeze()()
+
+# Асинхронная обертка для синхронного движка
+class AsyncSessionWrapper:
+    """
+    Асинхронный интерфейс поверх синхронной Session, совместимый с тем,
+    как bot.py использует AsyncSession: async with async_session() as session.
+    Все обращения к базе выполняются в пуле потоков; соединения берутся из пула движка.
+    """
+
+    def __init__(self, engine):
+        self.session = Session(engine, expire_on_commit=False)
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await run_sync(self._finish, exc_type is not None)
+    
+    def _finish(self, failed: bool):
+        if failed:
+            self.session.rollback()
+        self.session.close()
+    
+    async def execute(self, *args, **kwargs):
+        return await run_sync(lambda: _buffered(self.session.execute(*args, **kwargs)))
+    
+    async def scalar(self, *args, **kwargs):
+        return await run_sync(self.session.scalar, *args, **kwargs)
+    
+    async def scalars(self, *args, **kwargs):
+        return await run_sync(lambda: _buffered(self.session.execute(*args, **kwargs)).scalars())
+    
+    async def get(self, *args, **kwargs):
+        return await run_sync(self.session.get, *args, **kwargs)
+    
+    async def commit(self):
+        await run_sync(self.session.commit)
+    
+    async def rollback(self):
+        await run_sync(self.session.rollback)
+    
+    async def flush(self):
+        await run_sync(self.session.flush)
+    
+    async def refresh(self, obj):
+        await run_sync(self.session.refresh, obj)
+    
+    async def delete(self, obj):
+        await run_sync(self.session.delete, obj)
+    
+    async def close(self):
+        await run_sync(self.session.close)
+    
+    def add(self, obj):
+        self.session.add(obj)
+    
+    def add_all(self, objs):
+        self.session.add_all(objs)
+
+def sync_session_factory(engine):
+    """Фабрика сессий: как и sessionmaker, вызывается без await"""
+    return functools.partial(AsyncSessionWrapper, engine)
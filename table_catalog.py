@@ -0,0 +1,130 @@
+import asyncio
+import logging
+from dataclasses import dataclass, replace
+from types import MappingProxyType
+from typing import Callable, List, Optional, Tuple
+from sqlalchemy import select
+from db import async_session, Table
+from config import get_table_layout
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class TableInfo:
+    """Стол с геометрией из config.TABLE_LAYOUT (если стол есть в макете)"""
+    id: int
+    number: int
+    is_available: bool
+    x: Optional[int] = None
+    y: Optional[int] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+
+class TableSnapshot:
+    """Неизменяемый снимок каталога столов"""
+
+    def __init__(self, tables: Tuple[TableInfo, ...], version: int):
+        self.tables = tables
+        self.version = version
+        self.by_number = MappingProxyType({t.number: t for t in tables})
+        self.by_id = MappingProxyType({t.id: t for t in tables})
+
+    def table_states(self) -> List[dict]:
+        """Состояния столов для отрисовки схемы"""
+        return [{'number': t.number, 'is_available': t.is_available} for t in self.tables]
+
+    def replace_table(self, table: TableInfo) -> 'TableSnapshot':
+        tables = tuple(table if t.id == table.id else t for t in self.tables)
+        return TableSnapshot(tables, self.version + 1)
+
+class TableCatalog:
+    """
+    Каталог столов в памяти: номера, ID, доступность и геометрия макета.
+    Читатели получают неизменяемый снимок; изменения (переключение стола
+    администратором) записываются в базу, после чего снимок подменяется
+    целиком и подписчики получают новую версию.
+    """
+
+    def __init__(self):
+        self._snapshot = None
+        self._lock = asyncio.Lock()
+        self._subscribers: List[Callable[[TableSnapshot], None]] = []
+
+    def subscribe(self, callback: Callable[[TableSnapshot], None]):
+        """Подписывает функцию на изменения каталога; она получает новый снимок"""
+        self._subscribers.append(callback)
+
+    async def get(self) -> TableSnapshot:
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot
+        async with self._lock:
+            if self._snapshot is None:
+                self._publish(await self._load(0))
+            return self._snapshot
+
+    async def reload(self) -> TableSnapshot:
+        """Перечитывает столы из базы"""
+        async with self._lock:
+            version = self._snapshot.version + 1 if self._snapshot else 0
+            self._publish(await self._load(version))
+            return self._snapshot
+
+    async def _load(self, version: int) -> TableSnapshot:
+        geometry = {t['number']: t for t in get_table_layout()}
+        async with async_session() as session:
+            rows = (await session.execute(select(Table).order_by(Table.number))).scalars().all()
+        tables = []
+        for row in rows:
+            layout = geometry.get(row.number, {})
+            tables.append(TableInfo(
+                id=row.id,
+                number=row.number,
+                is_available=bool(row.is_available),
+                x=layout.get('x'),
+                y=layout.get('y'),
+                width=layout.get('width'),
+                height=layout.get('height')
+            ))
+        return TableSnapshot(tuple(tables), version)
+
+    def _publish(self, snapshot: TableSnapshot):
+        self._snapshot = snapshot
+        for callback in self._subscribers:
+            try:
+                callback(snapshot)
+            except Exception as e:
+                logger.error(f"Ошибка в подписчике каталога столов: {e}")
+
+    async def toggle(self, number: int) -> Optional[TableInfo]:
+        """Переключает доступность стола в базе и подменяет снимок; возвращает новое состояние стола"""
+        await self.get()
+        async with self._lock:
+            async with async_session() as session:
+                table = await session.scalar(select(Table).where(Table.number == number))
+                if not table:
+                    return None
+                table.is_available = not table.is_available
+                await session.commit()
+            if table.id not in self._snapshot.by_id:
+                # Стол добавлен в базу в обход каталога: перечитываем все столы
+                self._publish(await self._load(self._snapshot.version + 1))
+                return self._snapshot.by_id.get(table.id)
+            return self._apply(table.id, bool(table.is_available))
+
+    def set_available(self, table_id: int, is_available: bool) -> Optional[TableInfo]:
+        """Отражает в снимке доступность стола, уже записанную в базу другим кодом"""
+        if self._snapshot is None:
+            return None
+        return self._apply(table_id, is_available)
+
+    def _apply(self, table_id: int, is_available: bool) -> Optional[TableInfo]:
+        current = self._snapshot.by_id.get(table_id)
+        if current is None:
+            return None
+        if current.is_available != is_available:
+            current = replace(current, is_available=is_available)
+            self._publish(self._snapshot.replace_table(current))
+        return current
+
+table_catalog = TableCatalog()
@@ -0,0 +1,79 @@
+import random
+from datetime import datetime, date, timedelta
+from sqlalchemy import select
+from db import Reservation, User
+from admin_bookings import BookingListState, fetch_bookings_page
+
+NOW = datetime(2030, 3, 10, 9, 0)
+
+def test_state_roundtrip_fits_callback_data():
+    states = [
+        BookingListState(),
+        BookingListState(day=date(2030, 12, 31), status='cancelled', table=12, direction='n',
+                         cursor=(datetime(2030, 12, 31, 23, 30), 12345678)),
+        BookingListState(status='pending', direction='p', cursor=(datetime(2030, 1, 1, 10, 0), 7)),
+    ]
+    for state in states:
+        data = state.encode()
+        assert len(data.encode()) <= 64
+        assert BookingListState.decode(data) == state
+    assert BookingListState.decode('all_bookings') == BookingListState()
+    # Курсор без времени не дает листать: первая страница
+    assert BookingListState.decode('ab:-:-:-:n:-:-').direction == 'f'
+
+def walk(memory_db, state_data, pages):
+    async def scenario(session_factory):
+        rng = random.Random(5)
+        async with session_factory() as session:
+            session.add(User(telegram_id=1, name='Тест', phone='-'))
+            # Много бронирований с одинаковым временем начала: порядок задает id
+            session.add_all([
+                Reservation(table_id=rng.randrange(1, 4), user_id=1,
+                            start_time=NOW + timedelta(hours=rng.randrange(-48, 48)),
+                            end_time=NOW + timedelta(hours=50),
+                            status=rng.choice(['pending', 'confirmed', 'cancelled']))
+                for _ in range(60)
+            ])
+            await session.commit()
+            expected = (await session.execute(
+                select(Reservation.id, Reservation.table_id, Reservation.start_time, Reservation.status)
+                .order_by(Reservation.start_time, Reservation.id)
+            )).all()
+            return expected, await pages(session, BookingListState.decode(state_data))
+    return memory_db(scenario)
+
+def test_pages_forward_and_back_cover_list_without_gaps(memory_db):
+    async def pages(session, state):
+        forward = []
+        page = await fetch_bookings_page(session, state, now=NOW, limit=7)
+        first_has_prev = page.has_prev
+        while True:
+            forward.append(page)
+            if not page.has_next:
+                break
+            page = await fetch_bookings_page(session, state.after(page.rows[-1]), now=NOW, limit=7)
+        backward = [page]
+        while page.has_prev:
+            page = await fetch_bookings_page(session, state.before(page.rows[0]), now=NOW, limit=7)
+            backward.append(page)
+        return first_has_prev, forward, backward
+
+    expected, (first_has_prev, forward, backward) = walk(memory_db, 'all_bookings', pages)
+    upcoming = [row.id for row in expected if row.start_time >= datetime.combine(NOW.date(), datetime.min.time())]
+    assert first_has_prev
+    assert [row.id for page in forward for row in page.rows] == upcoming
+    assert all(len(page.rows) <= 7 for page in forward)
+    # Назад от последней страницы — до самого раннего бронирования
+    assert [row.id for page in reversed(backward) for row in page.rows] == [row.id for row in expected]
+
+def test_filters_by_day_status_and_table(memory_db):
+    async def pages(session, state):
+        return await fetch_bookings_page(session, state, table_id=2, now=NOW, limit=100)
+
+    day = NOW.date() + timedelta(days=1)
+    expected, page = walk(memory_db, BookingListState(day=day, status='pending', table=2).encode(), pages)
+    assert [row.id for row in page.rows] == [
+        row.id for row in expected
+        if row.start_time.date() == day and row.status == 'pending' and row.table_id == 2
+    ]
+    assert not page.has_prev and not page.has_next
@@ -0,0 +1,62 @@
+import asyncio
+from datetime import datetime, timedelta
+from sqlalchemy import select, func
+import archive
+from db import create_backend, Reservation, ArchivedReservation
+
+NOW = datetime(2030, 6, 1, 12, 0)
+
+def booking(days_ago, status='expired', user_id=1, table_id=1):
+    start = NOW - timedelta(days=days_ago)
+    return Reservation(table_id=table_id, user_id=user_id, start_time=start, end_time=start + timedelta(hours=2), status=status)
+
+def run(monkeypatch, scenario, url='sqlite://', name='memory'):
+    async def wrapper():
+        backend = create_backend(url, name, 'wal')
+        monkeypatch.setattr(archive, 'async_session', backend.async_session)
+        monkeypatch.setattr(archive, 'engine', backend.engine)
+        await backend.create_schema()
+        try:
+            return await scenario(backend.async_session)
+        finally:
+            await backend.dispose()
+    return asyncio.run(wrapper())
+
+async def count(session_factory, model):
+    async with session_factory() as session:
+        return await session.scalar(select(func.count()).select_from(model))
+
+def test_archive_moves_old_bookings_and_history_reads_both(monkeypatch):
+    async def scenario(session_factory):
+        async with session_factory() as session:
+            session.add_all([
+                booking(200), booking(150, 'cancelled'), booking(120, user_id=2), booking(100),
+                # Моложе горизонта и будущая бронь остаются
+                booking(10), booking(-3, 'pending'),
+            ])
+            await session.commit()
+        report = await archive.archive_finished_bookings(now=NOW, after_days=90, batch_size=3)
+        async with session_factory() as session:
+            history = await archive.fetch_history(session, user_id=1)
+            recent = await archive.fetch_history(session, user_id=1, start=NOW - timedelta(days=30), newest_first=True)
+        return report, await count(session_factory, Reservation), await count(session_factory, ArchivedReservation), history, recent
+
+    report, hot, cold, history, recent = run(monkeypatch, scenario)
+    assert (report.moved, report.batches) == (4, 2)
+    assert (hot, cold) == (2, 4)
+    assert [(row.id, bool(row.archived)) for row in history] == [(1, True), (2, True), (4, True), (5, False), (6, False)]
+    assert [row.id for row in recent] == [6, 5]
+
+def test_archive_keeps_newest_row_and_reclaims_space(monkeypatch, tmp_path):
+    async def scenario(session_factory):
+        async with session_factory() as session:
+            # Все строки старые: последняя по id остается, чтобы SQLite не выдал ее id повторно
+            session.add_all([booking(365 - i % 200) for i in range(3000)])
+            await session.commit()
+        report = await archive.archive_finished_bookings(now=NOW, after_days=90, batch_size=1000)
+        return report, await count(session_factory, Reservation)
+
+    report, hot = run(monkeypatch, scenario, f"sqlite:///{tmp_path / 'archive.db'}", 'async')
+    assert (report.moved, report.batches, hot) == (2999, 3, 1)
+    # Профиль wal создает новую базу с auto_vacuum=INCREMENTAL
+    assert report.freed_pages > 0
@@ -0,0 +1,109 @@
+from datetime import datetime, timedelta
+from availability import merge_intervals, free_slots, find_conflict, AvailabilityIndex
+
+def _at(hour, minute=0):
+    return datetime(2025, 4, 17, hour, minute)
+
+def test_merge_intervals():
+    intervals = [(_at(12), _at(13)), (_at(10), _at(11)), (_at(10, 30), _at(11, 30)), (_at(13), _at(14))]
+    assert merge_intervals(intervals) == [(_at(10), _at(11, 30)), (_at(12), _at(13)), (_at(13), _at(14))]
+
+def test_free_slots():
+    slots = [(_at(h), _at(h + 2)) for h in (15, 17, 19)]
+    busy = [(_at(15), _at(17))]
+    # Бронирование 15:00-17:00 не блокирует соседний слот 17:00-19:00
+    assert free_slots(slots, busy) == slots[1:]
+    assert free_slots(slots, [(_at(16), _at(18))]) == slots[2:]
+    assert free_slots(slots, []) == slots
+    # Начавшийся слот не предлагается, как и в AvailabilityGrid.build(now=...)
+    assert free_slots(slots, [], now=_at(16)) == slots[1:]
+    assert free_slots(slots, [], now=_at(17)) == slots[1:]
+
+def test_find_conflict():
+    busy = [(_at(18), _at(19)), (_at(15), _at(17))]
+    assert find_conflict(_at(17), _at(18), busy) is None
+    assert find_conflict(_at(16), _at(18), busy) == (_at(15), _at(17))
+
+def _random_reservations(rng, count):
+    base = datetime(2025, 4, 17, 10, 0)
+    reservations = []
+    for i in range(count):
+        start = base + timedelta(minutes=30 * rng.randrange(0, 24))
+        reservations.append({
+            'id': i + 1,
+            'table_id': rng.randrange(1, 4),
+            'start_time': start,
+            'end_time': start + timedelta(minutes=30 * rng.randrange(1, 6)),
+            'status': rng.choice(['pending', 'confirmed', 'cancelled']),
+        })
+    return reservations
+
+def _scan_is_available(table_id, start, end, reservations):
+    """Полный перебор: стол занимают все статусы, кроме cancelled"""
+    return not any(
+        r['table_id'] == table_id and r['status'] != 'cancelled' and r['start_time'] < end and r['end_time'] > start
+        for r in reservations
+    )
+
+def test_index_matches_linear_scan():
+    import random
+    from utils import is_slot_available
+    rng = random.Random(42)
+    base = datetime(2025, 4, 17, 9, 0)
+    for _ in range(20):
+        reservations = _random_reservations(rng, 30)
+        index = AvailabilityIndex.from_reservations(reservations)
+        for table_id in (1, 2, 3):
+            for offset in range(0, 30):
+                start = base + timedelta(minutes=15 * offset)
+                for length in (15, 30, 120):
+                    end = start + timedelta(minutes=length)
+                    expected = _scan_is_available(table_id, start, end, reservations)
+                    assert index.is_available(table_id, start, end) == expected
+                    assert is_slot_available(table_id, start, end, index) == expected
+                    assert is_slot_available(table_id, start, end, reservations) == expected
+
+def test_index_incremental_updates():
+    reservation = {'id': 7, 'table_id': 1, 'start_time': _at(15), 'end_time': _at(17), 'status': 'pending'}
+    index = AvailabilityIndex()
+    index.upsert(reservation)
+    assert not index.is_available(1, _at(16), _at(18))
+    assert index.is_available(1, _at(17), _at(19))
+    reservation['status'] = 'confirmed'
+    index.upsert(reservation)
+    assert len(index) == 1
+    reservation['status'] = 'cancelled'
+    index.upsert(reservation)
+    assert len(index) == 0
+    assert index.is_available(1, _at(16), _at(18))
+    # Истекшее бронирование тоже занимает стол; явный набор статусов сужает индекс
+    reservation['status'] = 'expired'
+    index.upsert(reservation)
+    assert not index.is_available(1, _at(16), _at(18))
+    assert AvailabilityIndex.from_reservations([reservation], statuses=('confirmed',)).is_available(1, _at(16), _at(18))
+
+def test_index_earliest_gap():
+    index = AvailabilityIndex()
+    index.add(1, _at(15), _at(17))
+    index.add(1, _at(17, 30), _at(19))
+    hour = timedelta(hours=1)
+    assert index.earliest_gap(1, hour, _at(14)) == _at(14)
+    assert index.earliest_gap(1, hour, _at(15)) == _at(19)
+    assert index.earliest_gap(1, timedelta(minutes=30), _at(15)) == _at(17)
+    assert index.earliest_gap(1, hour, _at(15), not_after=_at(19, 30)) is None
+    assert index.earliest_gap(2, hour, _at(15)) == _at(15)
+
+def test_availability_grid_reductions():
+    from datetime import date, time
+    from availability_grid import AvailabilityGrid
+    days = [date(2025, 4, 17), date(2025, 4, 18)]
+    slot_times = [(time(15), time(17)), (time(17), time(19)), (time(19), time(21))]
+    reservations = [(1, _at(15), _at(17)), (2, _at(16), _at(18))]
+    grid = AvailabilityGrid.build(days, [1, 2, 3], slot_times, reservations, unavailable_tables=[3])
+    assert grid.free.shape == (2, 3, 3)
+    assert grid.free_slots_per_day(1).tolist() == [2, 3]
+    assert grid.free_slots_per_table(days[0]).tolist() == [2, 1, 0]
+    assert grid.free_tables_per_slot(days[0]).tolist() == [0, 1, 2]
+    assert grid.first_free_cell() == (days[0], 1, slot_times[1])
+    assert grid.first_free_cell(2) == (days[0], 2, slot_times[2])
+    assert grid.is_free(days[1], 2, 0)
@@ -0,0 +1,140 @@
+import asyncio
+import random
+from datetime import datetime, date, timedelta
+import availability_cache as availability_cache_module
+from availability_cache import AvailabilityCache
+from db import Reservation
+from queries import day_bounds, fetch_busy_intervals
+
+DAY = date(2030, 5, 20)
+
+def _at(hour, minute=0, day=DAY):
+    return datetime.combine(day, datetime.min.time()) + timedelta(hours=hour, minutes=minute)
+
+def run(memory_db, scenario):
+    async def in_session(session_factory):
+        async with session_factory() as session:
+            return await scenario(session)
+    return memory_db(in_session)
+
+async def add(session, table_id, start, end, status='pending'):
+    reservation = Reservation(table_id=table_id, user_id=1, start_time=start, end_time=end, status=status)
+    session.add(reservation)
+    await session.commit()
+    return reservation
+
+def test_write_through_and_cancelled_dropped(memory_db):
+    async def scenario(session):
+        cache = AvailabilityCache(ttl=60)
+        first = await add(session, 1, _at(15), _at(17))
+        loaded = await cache.get_busy(session, 1, DAY)
+        version = cache.version
+        created = await add(session, 1, _at(19), _at(21))
+        cache.upsert_reservation(created)
+        after_create = await cache.get_busy(session, 1, DAY)
+        first.status = 'cancelled'
+        await session.commit()
+        cache.upsert_reservation(first)
+        after_cancel = await cache.get_busy(session, 1, DAY)
+        # Записи в незакэшированные дни пропускаются: день загрузится из базы при чтении
+        cache.upsert(99, 1, _at(10, day=DAY + timedelta(days=3)), _at(11, day=DAY + timedelta(days=3)), 'pending')
+        return loaded, version, cache.version, after_create, after_cancel, cache.stats()
+
+    loaded, version, version_after, after_create, after_cancel, stats = run(memory_db, scenario)
+    assert loaded == [(_at(15), _at(17))]
+    assert version_after == version + 3
+    assert after_create == [(_at(15), _at(17)), (_at(19), _at(21))]
+    assert after_cancel == [(_at(19), _at(21))]
+    # Все чтения после загрузки — из памяти
+    assert stats['misses'] == 1 and stats['hits'] == 2 and stats['entries'] == 1
+
+def test_change_during_load_is_not_cached(monkeypatch, memory_db):
+    async def scenario(session):
+        cache = AvailabilityCache(ttl=60)
+        await add(session, 1, _at(15), _at(17))
+        original = availability_cache_module.fetch_active_reservations
+        calls = []
+
+        async def racing_fetch(*args, **kwargs):
+            rows = await original(*args, **kwargs)
+            calls.append(1)
+            if len(calls) == 1:
+                # Бронирование создано, пока шел запрос: загруженный результат его не содержит
+                created = await add(session, 1, _at(19), _at(21))
+                cache.upsert_reservation(created)
+            return rows
+
+        monkeypatch.setattr(availability_cache_module, 'fetch_active_reservations', racing_fetch)
+        during = await cache.get_busy(session, 1, DAY)
+        after = await cache.get_busy(session, 1, DAY)
+        return during, after, len(calls)
+
+    during, after, loads = run(memory_db, scenario)
+    # Результат гонки отдается вызвавшему, но хранится с меткой -inf и перечитывается при следующем чтении
+    assert during == [(_at(15), _at(17))]
+    assert after == [(_at(15), _at(17)), (_at(19), _at(21))]
+    assert loads == 2
+
+def test_ttl_reloads_changes_from_other_processes(memory_db):
+    async def scenario(session):
+        cache = AvailabilityCache(ttl=0.05)
+        await cache.get_busy(session, 1, DAY)
+        # Запись мимо кэша (другой процесс)
+        await add(session, 1, _at(15), _at(17))
+        stale = await cache.get_busy(session, 1, DAY)
+        await asyncio.sleep(0.06)
+        fresh = await cache.get_busy(session, 1, DAY)
+        return stale, fresh
+
+    stale, fresh = run(memory_db, scenario)
+    assert stale == []
+    assert fresh == [(_at(15), _at(17))]
+
+def test_invalidate_scopes(memory_db):
+    async def scenario(session):
+        cache = AvailabilityCache(ttl=60)
+        days = [DAY + timedelta(days=i) for i in range(3)]
+        await cache.get_reservations(session, [1, 2], days)
+        cache.invalidate(table_id=1, day=DAY)
+        after_key = cache.stats()['entries']
+        cache.invalidate(table_id=2)
+        after_table = cache.stats()['entries']
+        cache.invalidate_before(DAY + timedelta(days=2))
+        after_before = sorted(cache._entries)
+        cache.invalidate()
+        return after_key, after_table, after_before, cache.stats()
+
+    after_key, after_table, after_before, stats = run(memory_db, scenario)
+    assert (after_key, after_table) == (5, 2)
+    assert after_before == [(1, DAY + timedelta(days=2))]
+    assert stats['entries'] == 0 and stats['version'] == 4
+
+def test_random_writes_match_database(memory_db):
+    async def scenario(session):
+        rng = random.Random(11)
+        cache = AvailabilityCache(ttl=60)
+        days = [DAY + timedelta(days=i) for i in range(3)]
+        reservations = []
+        for step in range(300):
+            if reservations and rng.random() < 0.4:
+                reservation = rng.choice(reservations)
+                reservation.status = rng.choice(['pending', 'confirmed', 'cancelled', 'expired'])
+                await session.commit()
+            else:
+                # Часть бронирований переходит через полночь и попадает в два дня
+                start = _at(rng.randrange(10, 24), 30 * rng.randrange(2), day=rng.choice(days))
+                reservation = await add(session, rng.randrange(1, 4), start,
+                                        start + timedelta(minutes=30 * rng.randrange(1, 8)))
+                reservations.append(reservation)
+            cache.upsert_reservation(reservation)
+            if step % 25 == 0:
+                for table_id in (1, 2, 3):
+                    for day in days:
+                        start, end = day_bounds(day)
+                        expected = sorted(await fetch_busy_intervals(session, table_id, start, end))
+                        assert await cache.get_busy(session, table_id, day) == expected
+        return cache.stats()
+
+    stats = run(memory_db, scenario)
+    # Кэш загрузился один раз и дальше поддерживался записями
+    assert stats['misses'] == 9
@@ -0,0 +1,95 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+import bot
+from db import Reservation
+
+START = datetime(2030, 1, 15, 18, 0)
+
+def booking(hours_from_start, status, table_id=1):
+    start = START + timedelta(hours=hours_from_start)
+    return Reservation(table_id=table_id, user_id=1, start_time=start, end_time=start + timedelta(hours=2), status=status)
+
+class FakeCatalog:
+    async def get(self):
+        return SimpleNamespace(by_id={})
+
+class Query:
+    def __init__(self, data):
+        self.data = data
+
+    async def answer(self, text=None):
+        pass
+
+def run(monkeypatch, memory_db, scenario):
+    monkeypatch.setattr(bot, 'table_catalog', FakeCatalog())
+    monkeypatch.setattr(bot, 'table_booking_locks', bot.defaultdict(asyncio.Lock))
+    edits = []
+
+    async def safe_edit_message(update, text, reply_markup=None):
+        edits.append(text)
+    monkeypatch.setattr(bot, 'safe_edit_message', safe_edit_message)
+    return memory_db(lambda session_factory: scenario(session_factory, edits), bot)
+
+async def add(session_factory, *items):
+    async with session_factory() as session:
+        session.add_all(items)
+        await session.commit()
+        return [item.id for item in items]
+
+async def statuses(session_factory):
+    async with session_factory() as session:
+        return (await session.execute(select(Reservation.status).order_by(Reservation.id))).scalars().all()
+
+async def admin_action(action, booking_id):
+    update = SimpleNamespace(callback_query=Query(bot.cb(action, booking_id)))
+    context = SimpleNamespace(args=[str(booking_id)], user_data={})
+    handler = bot.handle_booking_confirmation if action == 'adm_confirm' else bot.handle_booking_cancellation
+    await handler(update, context)
+
+def test_reactivating_cancelled_booking_checks_conflicts(monkeypatch, memory_db):
+    async def scenario(session_factory, edits):
+        cancelled, pending = await add(session_factory, booking(0, 'cancelled'), booking(1, 'pending'))
+        await admin_action('adm_confirm', cancelled)
+        refused = await statuses(session_factory)
+        # Слот освободился: отмененное бронирование снова можно подтвердить
+        await admin_action('adm_cancel', pending)
+        await admin_action('adm_confirm', cancelled)
+        return refused, await statuses(session_factory), edits
+
+    refused, final, edits = run(monkeypatch, memory_db, scenario)
+    assert refused == ['cancelled', 'pending']
+    assert 'слот уже занят' in edits[0]
+    assert final == ['confirmed', 'cancelled']
+
+def test_concurrent_reactivation_keeps_one_booking_per_slot(monkeypatch, memory_db):
+    async def scenario(session_factory, edits):
+        ids = await add(session_factory, booking(0, 'cancelled'), booking(1, 'cancelled'), booking(0, 'cancelled', table_id=2))
+        await asyncio.gather(*(admin_action('adm_confirm', booking_id) for booking_id in ids))
+        return await statuses(session_factory)
+
+    first, second, other_table = run(monkeypatch, memory_db, scenario)
+    assert sorted([first, second]) == ['cancelled', 'confirmed']
+    assert other_table == 'confirmed'
+
+def test_exclusion_constraint_refusal_is_reported(monkeypatch, memory_db):
+    async def scenario(session_factory, edits):
+        (cancelled,) = await add(session_factory, booking(0, 'cancelled'))
+
+        def refusing_session():
+            # Слот занял другой процесс: PostgreSQL отклоняет запись ограничением исключения
+            session = session_factory()
+
+            async def commit():
+                raise IntegrityError('UPDATE reservations', None, Exception('reservations_no_overlap'))
+            session.commit = commit
+            return session
+        monkeypatch.setattr(bot, 'async_session', refusing_session)
+        await admin_action('adm_confirm', cancelled)
+        return await statuses(session_factory), edits
+
+    final, edits = run(monkeypatch, memory_db, scenario)
+    assert final == ['cancelled']
+    assert edits == ['Бронирование #1 нельзя подтвердить: слот уже занят другим бронированием.']
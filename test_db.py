@@ -0,0 +1,35 @@
+import asyncio
+import pytest
+from sqlalchemy import select, func
+from db import resolve_backend, create_backend, Table, ClubSettings
+from config import get_table_layout
+
+@pytest.mark.parametrize('url, expected', [
+    ('sqlite+aiosqlite:///billiards.db', 'async'),
+    ('sqlite:///database.db', 'sync'),
+    ('sqlite://', 'memory'),
+    ('sqlite+aiosqlite:///:memory:', 'memory'),
+])
+def test_resolve_backend_by_url(url, expected):
+    assert resolve_backend(url) == expected
+
+def test_resolve_backend_explicit():
+    assert resolve_backend('sqlite:///database.db', 'async') == 'async'
+    with pytest.raises(ValueError):
+        resolve_backend('sqlite://', 'mysql')
+
+@pytest.mark.parametrize('name', ['async', 'sync', 'memory'])
+def test_init_db_on_each_backend(tmp_path, name):
+    backend = create_backend(f"sqlite:///{tmp_path / 'test.db'}", name)
+
+    async def scenario():
+        await backend.init_db()
+        # Повторная инициализация не дублирует столы и настройки
+        await backend.init_db()
+        async with backend.async_session() as session:
+            tables = await session.scalar(select(func.count()).select_from(Table))
+            settings = await session.scalar(select(func.count()).select_from(ClubSettings))
+        await backend.dispose()
+        return tables, settings
+
+    assert asyncio.run(scenario()) == (len(get_table_layout()), 1)
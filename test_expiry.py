@@ -0,0 +1,48 @@
+from datetime import datetime, timedelta
+from sqlalchemy import select
+import expiry
+from db import Reservation
+
+NOW = datetime(2030, 1, 10, 12, 0)
+
+def booking(hours_from_now, status='pending', table_id=1):
+    start = NOW + timedelta(hours=hours_from_now)
+    return Reservation(table_id=table_id, user_id=1, start_time=start, end_time=start + timedelta(hours=1), status=status)
+
+async def add(session_factory, *items):
+    async with session_factory() as session:
+        session.add_all(items)
+        await session.commit()
+
+async def statuses(session_factory):
+    async with session_factory() as session:
+        return (await session.execute(select(Reservation.status).order_by(Reservation.id))).scalars().all()
+
+def test_expires_only_finished_active_bookings_in_batches(memory_db):
+    async def scenario(session_factory):
+        await add(session_factory,
+                  booking(-10), booking(-9, 'confirmed'), booking(-8), booking(-7), booking(-6, 'confirmed'),
+                  booking(-5, 'cancelled'), booking(-4, 'expired'),
+                  # Еще идет и еще не началось
+                  booking(-0.5), booking(2))
+        report = await expiry.expire_finished_bookings(now=NOW, batch_size=2)
+        return report, await statuses(session_factory)
+
+    report, result = memory_db(scenario, expiry)
+    assert (report.expired, report.batches) == (5, 3)
+    assert result == ['expired'] * 5 + ['cancelled', 'expired', 'pending', 'pending']
+
+def test_high_water_limits_next_run_to_newly_finished(memory_db):
+    async def scenario(session_factory):
+        await add(session_factory, booking(-3), booking(1))
+        first = await expiry.expire_finished_bookings(now=NOW)
+        # Бронь, закончившаяся до отметки, но записанная позже: обычный прогон ее не видит
+        await add(session_factory, booking(-5))
+        second = await expiry.expire_finished_bookings(now=NOW + timedelta(hours=3))
+        full = await expiry.expire_finished_bookings(now=NOW + timedelta(hours=3), full=True)
+        return first, second, full
+
+    first, second, full = memory_db(scenario, expiry)
+    assert (first.since, first.expired) == (None, 1)
+    assert (second.since, second.expired) == (NOW, 1)
+    assert full.expired == 1
@@ -0,0 +1,68 @@
+import asyncio
+import time
+from telegram.error import BadRequest, RetryAfter
+from notifications import NotificationDispatcher
+
+class FakeBot:
+    def __init__(self, failures=None, gate: asyncio.Event = None):
+        self.sent = []
+        self.failures = failures or {}
+        self.gate = gate
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.gate:
+            await self.gate.wait()
+        errors = self.failures.get(chat_id)
+        if errors:
+            raise errors.pop(0)
+        self.sent.append((chat_id, text, time.monotonic()))
+
+def test_send_returns_before_delivery():
+    async def scenario():
+        gate = asyncio.Event()
+        bot = FakeBot(gate=gate)
+        dispatcher = NotificationDispatcher()
+        tasks = dispatcher.send_many(bot, [1, 2, 3], 'Новое бронирование')
+        await asyncio.sleep(0.01)
+        queued = [task.done() for task in tasks]
+        gate.set()
+        await dispatcher.drain()
+        return queued, bot.sent, dispatcher.stats()
+
+    queued, sent, stats = asyncio.run(scenario())
+    assert queued == [False, False, False]
+    assert sorted(chat_id for chat_id, _, _ in sent) == [1, 2, 3]
+    assert stats['sent'] == 3 and stats['queued'] == 0
+
+def test_per_chat_order_and_rate_global_limit():
+    async def scenario():
+        bot = FakeBot()
+        dispatcher = NotificationDispatcher(global_rate=100, per_chat_rate=20)
+        started = time.monotonic()
+        for i in range(5):
+            dispatcher.send(bot, 1, f'сообщение {i}')
+        dispatcher.send_many(bot, range(100, 250), 'всем')
+        await dispatcher.drain()
+        return bot.sent, time.monotonic() - started
+
+    sent, elapsed = asyncio.run(scenario())
+    own = [(text, at) for chat_id, text, at in sent if chat_id == 1]
+    assert [text for text, _ in own] == [f'сообщение {i}' for i in range(5)]
+    assert all(b - a >= 0.045 for (_, a), (_, b) in zip(own, own[1:]))
+    # 155 сообщений при 100 в секунду и запасе в 100 токенов — не быстрее ~0,55 с
+    assert elapsed >= 0.5
+
+def test_retry_after_is_respected_and_bad_request_is_not_retried():
+    async def scenario():
+        bot = FakeBot(failures={1: [RetryAfter(0.2)], 2: [BadRequest('Chat not found')]})
+        dispatcher = NotificationDispatcher()
+        started = time.monotonic()
+        dispatcher.send(bot, 1, 'повтор')
+        dispatcher.send(bot, 2, 'ошибка')
+        await dispatcher.drain()
+        return bot.sent, time.monotonic() - started, dispatcher.stats()
+
+    sent, elapsed, stats = asyncio.run(scenario())
+    assert [chat_id for chat_id, _, _ in sent] == [1]
+    assert elapsed >= 0.2
+    assert (stats['sent'], stats['retried'], stats['failed']) == (1, 1, 1)
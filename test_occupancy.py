@@ -0,0 +1,65 @@
+from datetime import datetime, date, timedelta
+from sqlalchemy import select
+import occupancy
+from db import Reservation, ArchivedReservation, OccupancyDaily
+from occupancy import occupancy_buckets, record_transition, rebuild_occupancy, fetch_occupancy
+
+DAY = date(2030, 6, 1)
+
+def at(hour, minute=0, days=0):
+    return datetime.combine(DAY, datetime.min.time()) + timedelta(days=days, hours=hour, minutes=minute)
+
+def test_buckets_split_by_hour_and_midnight():
+    assert occupancy_buckets(at(15, 30), at(17, 15)) == {(DAY, 15): 30, (DAY, 16): 60, (DAY, 17): 15}
+    assert occupancy_buckets(at(23, 30), at(0, 30, days=1)) == {(DAY, 23): 30, (DAY + timedelta(days=1), 0): 30}
+    assert occupancy_buckets(at(15), at(15)) == {}
+
+def test_incremental_updates_match_rebuild(memory_db):
+    async def aggregate(session):
+        rows = (await session.execute(select(OccupancyDaily).order_by(
+            OccupancyDaily.day, OccupancyDaily.table_id, OccupancyDaily.hour))).scalars().all()
+        return [(r.day, r.table_id, r.hour, r.booked_minutes, r.bookings) for r in rows if r.booked_minutes or r.bookings]
+
+    async def scenario(session_factory):
+        transitions = [
+            (1, at(15), at(17), ['pending', 'confirmed', 'expired']),
+            (1, at(17, 30), at(19), ['pending', 'cancelled']),
+            (2, at(15), at(16, 30), ['pending', 'confirmed', 'cancelled']),
+            (2, at(16, 30), at(18), ['pending']),
+            (1, at(15, 30, days=1), at(17, days=1), ['pending', 'confirmed']),
+        ]
+        async with session_factory() as session:
+            for table_id, start, end, statuses in transitions:
+                reservation = Reservation(table_id=table_id, user_id=1, start_time=start, end_time=end, status=statuses[0])
+                session.add(reservation)
+                await record_transition(session, table_id, start, end, None, statuses[0])
+                for old, new in zip(statuses, statuses[1:]):
+                    await record_transition(session, table_id, start, end, old, new)
+                    reservation.status = new
+            # Бронирование из архива учитывается только пересборкой
+            session.add(ArchivedReservation(id=100, table_id=3, user_id=1, start_time=at(20, days=-1),
+                                            end_time=at(21, days=-1), status='expired'))
+            await session.commit()
+            incremental = await aggregate(session)
+            summary = await fetch_occupancy(session, DAY, DAY + timedelta(days=1))
+
+        report = await rebuild_occupancy(batch_size=2)
+        async with session_factory() as session:
+            rebuilt = await aggregate(session)
+        partial = await rebuild_occupancy(since=DAY + timedelta(days=1))
+        async with session_factory() as session:
+            rebuilt_partial = await aggregate(session)
+        return incremental, summary, report, rebuilt, partial, rebuilt_partial
+
+    incremental, summary, report, rebuilt, partial, rebuilt_partial = memory_db(scenario, occupancy)
+    assert incremental == [
+        (DAY, 1, 15, 60, 1), (DAY, 1, 16, 60, 0),
+        (DAY, 2, 16, 30, 1), (DAY, 2, 17, 60, 0),
+        (DAY + timedelta(days=1), 1, 15, 30, 1), (DAY + timedelta(days=1), 1, 16, 60, 0),
+    ]
+    # Каждое бронирование считается один раз — в часе начала; отмененные строки обнуляются
+    assert summary.by_table == {1: (210, 2), 2: (90, 1)}
+    assert summary.by_hour == {15: 90, 16: 150, 17: 60, 18: 0}
+    assert report.bookings == 4
+    assert rebuilt == [(DAY - timedelta(days=1), 3, 20, 60, 1)] + incremental
+    assert partial.bookings == 1 and rebuilt_partial == rebuilt
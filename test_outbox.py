@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+from sqlalchemy import select, update
+from telegram.error import BadRequest, TimedOut
+import outbox
+from db import OutboxMessage
+from notifications import NotificationDispatcher
+from outbox import OutboxWorker, enqueue, enqueue_many, retry_dead
+
+class FakeBot:
+    def __init__(self, failures=None):
+        self.sent = []
+        self.failures = failures or {}
+
+    async def send_message(self, chat_id, text, **kwargs):
+        errors = self.failures.get(chat_id)
+        if errors:
+            raise errors.pop(0)
+        self.sent.append((chat_id, text))
+
+def run(monkeypatch, memory_db, scenario):
+    # Без повторов внутри рассылки: повторы — забота очереди
+    monkeypatch.setattr(outbox, 'notification_dispatcher', NotificationDispatcher(per_chat_rate=100, max_retries=0))
+    return memory_db(scenario, outbox)
+
+async def statuses(session_factory):
+    async with session_factory() as session:
+        rows = (await session.execute(select(OutboxMessage).order_by(OutboxMessage.id))).scalars().all()
+        return [(row.chat_id, row.status, row.attempts) for row in rows]
+
+def test_only_committed_messages_are_sent_in_order(monkeypatch, memory_db):
+    async def scenario(session_factory):
+        async with session_factory() as session:
+            enqueue(session, 1, 'первое')
+            enqueue_many(session, [1, 2], 'второе')
+            await session.commit()
+        async with session_factory() as session:
+            enqueue(session, 3, 'откат')
+            await session.rollback()
+        bot = FakeBot()
+        worker = OutboxWorker(batch_size=2)
+        processed = await worker.drain(bot)
+        return processed, bot.sent, await statuses(session_factory), await worker.stats()
+
+    processed, sent, rows, stats = run(monkeypatch, memory_db, scenario)
+    assert processed == 3
+    assert [text for chat_id, text in sent if chat_id == 1] == ['первое', 'второе']
+    assert rows == [(1, 'sent', 1), (1, 'sent', 1), (2, 'sent', 1)]
+    assert stats['pending'] == 0 and stats['sent'] == 3
+
+def test_retries_then_dead_letters(monkeypatch, memory_db):
+    async def scenario(session_factory):
+        async with session_factory() as session:
+            enqueue(session, 1, 'сеть')
+            enqueue(session, 2, 'нет чата')
+            await session.commit()
+        bot = FakeBot(failures={1: [TimedOut(), TimedOut()], 2: [BadRequest('Chat not found')]})
+        worker = OutboxWorker(max_attempts=2)
+        await worker.drain(bot)
+        after_first = await statuses(session_factory)
+        # Повтор еще не наступил
+        assert await worker.drain(bot) == 0
+        async with session_factory() as session:
+            await session.execute(update(OutboxMessage).values(next_attempt_at=datetime.utcnow() - timedelta(seconds=1)))
+            await session.commit()
+        await worker.drain(bot)
+        after_second = await statuses(session_factory)
+        requeued = await retry_dead()
+        await worker.drain(bot)
+        return after_first, after_second, requeued, bot.sent, await statuses(session_factory)
+
+    after_first, after_second, requeued, sent, final = run(monkeypatch, memory_db, scenario)
+    assert after_first == [(1, 'pending', 1), (2, 'dead', 1)]
+    assert after_second == [(1, 'dead', 2), (2, 'dead', 1)]
+    assert requeued == 2
+    assert sorted(sent) == [(1, 'сеть'), (2, 'нет чата')]
+    assert final == [(1, 'sent', 1), (2, 'sent', 1)]
@@ -0,0 +1,71 @@
+from types import SimpleNamespace
+from sqlalchemy import select
+from telegram.error import BadRequest
+import bot
+import photo_registry as photo_registry_module
+from db import PhotoFile
+from photo_registry import PhotoFileRegistry
+
+STATES = [{'number': 1, 'is_available': True}, {'number': 2, 'is_available': False}]
+
+class FakeMessage:
+    """Сообщение, на которое бот отвечает схемой: Telegram выдает file_id каждой загрузке"""
+
+    def __init__(self, rejected=()):
+        self.rejected = set(rejected)
+        self.sent = []
+
+    async def reply_photo(self, photo, caption=None, reply_markup=None):
+        if photo in self.rejected:
+            raise BadRequest('Wrong file identifier/http url specified')
+        self.sent.append(photo)
+        file_id = photo if isinstance(photo, str) else f'file-{len(self.sent)}'
+        return SimpleNamespace(photo=[SimpleNamespace(file_id='thumb'), SimpleNamespace(file_id=file_id)])
+
+class FakeRenderService:
+    def __init__(self):
+        self.renders = 0
+
+    async def render_table_layout(self, table_states):
+        self.renders += 1
+        return b'png'
+
+def run(monkeypatch, memory_db, scenario):
+    registry = PhotoFileRegistry()
+    renderer = FakeRenderService()
+    monkeypatch.setattr(bot, 'photo_registry', registry)
+    monkeypatch.setattr(bot, 'render_service', renderer)
+    return memory_db(lambda session_factory: scenario(registry, renderer, session_factory), photo_registry_module)
+
+def test_file_id_is_reused_and_survives_restart(monkeypatch, memory_db):
+    async def scenario(registry, renderer, session_factory):
+        message = FakeMessage()
+        await bot.send_table_layout(message, STATES, 'Схема')
+        await bot.send_table_layout(message, STATES, 'Схема')
+        # Перезапуск: новый реестр читает file_id из таблицы photo_files
+        restarted = PhotoFileRegistry()
+        await restarted.load()
+        bot.photo_registry = restarted
+        await bot.send_table_layout(message, STATES, 'Схема')
+        async with session_factory() as session:
+            rows = (await session.execute(select(PhotoFile.file_id))).scalars().all()
+        return message.sent, renderer.renders, rows
+
+    sent, renders, rows = run(monkeypatch, memory_db, scenario)
+    # Изображение загружено один раз, дальше отправляется только file_id
+    assert sent == [b'png', 'file-1', 'file-1']
+    assert renders == 1 and rows == ['file-1']
+
+def test_rejected_file_id_is_forgotten_and_reuploaded(monkeypatch, memory_db):
+    async def scenario(registry, renderer, session_factory):
+        key = bot.format_table_layout_key(bot.get_table_layout_key(STATES))
+        await registry.remember(key, 'expired-id')
+        message = FakeMessage(rejected={'expired-id'})
+        await bot.send_table_layout(message, STATES, 'Схема')
+        async with session_factory() as session:
+            rows = (await session.execute(select(PhotoFile.key, PhotoFile.file_id))).all()
+        return message.sent, renderer.renders, registry.get(key), rows, key
+
+    sent, renders, file_id, rows, key = run(monkeypatch, memory_db, scenario)
+    assert sent == [b'png'] and renders == 1
+    assert file_id == 'file-1' and rows == [(key, 'file-1')]
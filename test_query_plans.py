@@ -0,0 +1,72 @@
+import re
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, select, inspect
+from db import Base, User, Table, Reservation, create_missing_indexes
+from queries import active_reservations_stmt, active_reservations_range_stmt, reservations_by_status_stmt
+from expiry import expiry_batch_stmt
+from archive import archive_candidates_stmt, history_stmt
+from admin_bookings import BookingListState, bookings_page_stmt
+from user_bookings import upcoming_stmt, past_stmt
+from outbox import due_batch_stmt
+
+NOW = datetime(2025, 4, 17, 15, 0)
+
+# Горячие запросы бота. Те, что собираются прямо в обработчиках bot.py, повторены здесь.
+HOT_QUERIES = {
+    'user_by_telegram_id': select(User).where(User.telegram_id == 123),
+    'table_by_number': select(Table).where(Table.number == 3),
+    'slot_conflict': active_reservations_stmt(1, NOW, NOW + timedelta(hours=2)),
+    'day_range_for_tables': active_reservations_range_stmt(NOW, NOW + timedelta(days=7), [1, 2, 3], with_ids=True),
+    'day_range_all_tables': active_reservations_range_stmt(NOW, NOW + timedelta(days=1)),
+    'index_by_status': reservations_by_status_stmt(NOW, NOW + timedelta(days=1), ('pending', 'confirmed')),
+    'user_upcoming': upcoming_stmt(1, NOW, None, 9),
+    'user_upcoming_next': upcoming_stmt(1, NOW, (NOW, 10), 9),
+    'user_past_next': past_stmt(1, NOW, (NOW, 10), 9),
+    'outbox_due': due_batch_stmt(NOW, 50),
+    'expiry_batch': expiry_batch_stmt(NOW - timedelta(hours=1), NOW, 500),
+    'expiry_batch_full': expiry_batch_stmt(None, NOW, 500),
+    'archive_batch': archive_candidates_stmt(NOW - timedelta(days=90), 500),
+    'history_by_user': select(history_stmt(user_id=1)),
+    'admin_page_first': bookings_page_stmt(BookingListState(), None, NOW, 8),
+    'admin_page_next_by_status': bookings_page_stmt(BookingListState(status='pending', direction='n', cursor=(NOW, 10)), None, NOW, 8),
+    'admin_page_prev_by_day': bookings_page_stmt(BookingListState(day=NOW.date(), direction='p', cursor=(NOW, 10)), None, NOW, 8),
+    'admin_page_by_table': bookings_page_stmt(BookingListState(table=3), 3, NOW, 8),
+}
+
+FULL_SCAN = re.compile(r'^SCAN (users|tables|reservations|reservations_archive|outbox)\b')
+
+@pytest.fixture(scope='module')
+def connection():
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    with engine.connect() as conn:
+        yield conn
+
+def explain(conn, stmt):
+    compiled = stmt.compile(dialect=conn.dialect, compile_kwargs={'render_postcompile': True})
+    params = compiled.construct_params()
+    values = tuple(
+        params[name].isoformat(' ') if isinstance(params[name], datetime) else params[name]
+        for name in compiled.positiontup
+    )
+    rows = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + str(compiled), values).fetchall()
+    return [row[-1] for row in rows]
+
+@pytest.mark.parametrize('name', sorted(HOT_QUERIES))
+def test_hot_query_uses_index(connection, name):
+    plan = explain(connection, HOT_QUERIES[name])
+    scans = [step for step in plan if FULL_SCAN.match(step)]
+    assert not scans, f"{name}: полное сканирование таблицы: {plan}"
+
+def test_create_missing_indexes_is_idempotent():
+    engine = create_engine('sqlite://')
+    with engine.begin() as conn:
+        # Имитируем старую базу: таблица есть, индексов нет
+        Reservation.__table__.create(conn)
+        for index in Reservation.__table__.indexes:
+            index.drop(conn)
+        create_missing_indexes(conn)
+        create_missing_indexes(conn)
+        names = {index['name'] for index in inspect(conn).get_indexes('reservations')}
+    assert {index.name for index in Reservation.__table__.indexes} <= names
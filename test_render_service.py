@@ -0,0 +1,85 @@
+import asyncio
+import threading
+import time
+import pytest
+import render_service as render_service_module
+from render_service import RenderService
+
+STATES = [{'number': 1, 'is_available': True}, {'number': 2, 'is_available': False}]
+
+@pytest.fixture
+def no_image_cache(monkeypatch):
+    monkeypatch.setattr(render_service_module, 'get_cached_table_layout_image', lambda key: None)
+
+def test_identical_requests_are_coalesced(monkeypatch, no_image_cache):
+    def slow_render(table_states):
+        time.sleep(0.05)
+        return b'png'
+
+    monkeypatch.setattr(render_service_module, 'create_table_layout_image', slow_render)
+
+    async def scenario():
+        service = RenderService(max_workers=2)
+        try:
+            results = await asyncio.gather(*(service.render_table_layout(STATES) for _ in range(8)))
+            return results, service.stats()
+        finally:
+            service.shutdown()
+
+    results, stats = asyncio.run(scenario())
+    assert results == [b'png'] * 8
+    assert stats['renders'] == 1 and stats['coalesced'] == 7
+    assert stats['queue_depth'] == 0 and stats['in_flight'] == 0
+
+def test_render_error_reaches_every_waiter(monkeypatch, no_image_cache):
+    calls = []
+
+    def failing_render(table_states):
+        calls.append(1)
+        time.sleep(0.02)
+        if len(calls) == 1:
+            raise ValueError('сломанный макет')
+        return b'png'
+
+    monkeypatch.setattr(render_service_module, 'create_table_layout_image', failing_render)
+
+    async def scenario():
+        service = RenderService(max_workers=1)
+        try:
+            results = await asyncio.gather(*(service.render_table_layout(STATES) for _ in range(3)), return_exceptions=True)
+            inflight = dict(service._inflight)
+            # Ошибка не остается в _inflight: следующий запрос отрисовывает заново
+            retry = await service.render_table_layout(STATES)
+            return results, inflight, retry, service.stats()
+        finally:
+            service.shutdown()
+
+    results, inflight, retry, stats = asyncio.run(scenario())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert inflight == {} and retry == b'png'
+    assert len(calls) == 2 and stats['queue_depth'] == 0
+
+def test_cancelled_renders_leave_queue(monkeypatch, no_image_cache):
+    release = threading.Event()
+
+    def blocking_render(table_states):
+        release.wait(1)
+        return b'png'
+
+    monkeypatch.setattr(render_service_module, 'create_table_layout_image', blocking_render)
+
+    async def scenario():
+        service = RenderService(max_workers=1)
+        running = asyncio.ensure_future(service.render_table_layout(STATES))
+        waiting = asyncio.ensure_future(service.render_table_layout([{'number': 3, 'is_available': True}]))
+        await asyncio.sleep(0.05)
+        queued = service.stats()['queue_depth']
+        service.shutdown()
+        release.set()
+        results = await asyncio.gather(running, waiting, return_exceptions=True)
+        return queued, results, service.stats()
+
+    queued, results, stats = asyncio.run(scenario())
+    assert queued == 1
+    assert results[0] == b'png' and isinstance(results[1], asyncio.CancelledError)
+    assert stats['queue_depth'] == 0 and stats['in_flight'] == 0
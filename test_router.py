@@ -0,0 +1,97 @@
+import asyncio
+from router import Router, cb, callback_payload, set_input_state, clear_input_state, INPUT_STATE_KEY
+
+class Ctx:
+    def __init__(self):
+        self.user_data = {}
+        self.args = None
+
+class Query:
+    def __init__(self, data):
+        self.data = data
+        self.answered = []
+
+    async def answer(self, text=None):
+        self.answered.append(text)
+
+class Obj:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+def make_update(data=None, user_id=1):
+    return Obj(callback_query=Query(data) if data is not None else None, effective_user=Obj(id=user_id))
+
+def build(calls):
+    def handler(name):
+        async def handle(update, context):
+            calls.append((name, context.args))
+        return handle
+
+    async def is_admin(user_id):
+        return user_id == 99
+
+    router = Router(is_admin=is_admin)
+    router.add('book', handler('book'))
+    router.add('confirm', handler('confirm'))
+    router.add('adm_confirm', handler('adm_confirm'), admin_only=True)
+    router.add('mb', handler('mb'))
+    router.add('time', handler('time'))
+    router.add_legacy('book', 'book')
+    router.add_legacy('confirm_booking', 'confirm')
+    router.add_legacy('confirm_booking', 'adm_confirm', with_args=True)
+    router.add_legacy('my_bookings', 'mb')
+    router.add_legacy('select_time', 'time', with_args=True)
+    router.add_state('settings', handler('settings'))
+    router.unknown_text = handler('unknown_text')
+    return router
+
+def test_cb_format_and_limit():
+    assert cb('time', 1.5, 2) == 'v1:time:1.5:2'
+    assert callback_payload('v1:ab:-:p') == 'ab:-:p'
+    assert callback_payload('all_bookings') == 'all_bookings'
+    try:
+        cb('x', 'y' * 64)
+    except ValueError:
+        pass
+    else:
+        assert False, 'callback_data длиннее 64 байт'
+
+def test_resolve_versioned_and_legacy():
+    router = build([])
+    resolve = lambda data: (lambda r: r and (r[0].action, r[1]))(router.resolve(data))
+    assert resolve('v1:book') == ('book', [])
+    assert resolve('v1:time:1.0:2.0') == ('time', ['1.0', '2.0'])
+    # Старые данные: "book" не совпадает с "my_bookings", "confirm_booking" — с "confirm_booking_5"
+    assert resolve('book') == ('book', [])
+    assert resolve('my_bookings') == ('mb', [])
+    assert resolve('confirm_booking') == ('confirm', [])
+    assert resolve('confirm_booking_5') == ('adm_confirm', ['5'])
+    assert resolve('select_time_1.0_2.0') == ('time', ['1.0', '2.0'])
+    assert resolve('mb:u:-:-') == ('mb', ['u', '-', '-'])
+    assert resolve('select_time') is None
+    assert resolve('v2:book') is None
+    assert resolve('unknown') is None
+
+def test_dispatch_admin_guard_and_text_state():
+    async def scenario():
+        calls = []
+        router = build(calls)
+        ctx = Ctx()
+        await router.dispatch(make_update('v1:time:1.0:2.0'), ctx)
+        denied = make_update('v1:adm_confirm:7', user_id=1)
+        await router.dispatch(denied, ctx)
+        await router.dispatch(make_update('v1:adm_confirm:7', user_id=99), ctx)
+        unknown = make_update('nothing')
+        await router.dispatch(unknown, ctx)
+        text_ctx = Ctx()
+        await router.dispatch_text(make_update(), text_ctx)
+        set_input_state(text_ctx, 'settings')
+        await router.dispatch_text(make_update(), text_ctx)
+        clear_input_state(text_ctx)
+        return calls, denied.callback_query.answered, unknown.callback_query.answered, text_ctx.user_data, router.unmatched
+
+    calls, denied, unknown, user_data, unmatched = asyncio.run(scenario())
+    assert calls == [('time', ['1.0', '2.0']), ('adm_confirm', ['7']), ('unknown_text', None), ('settings', None)]
+    assert denied == [None] and unknown == [None]
+    assert INPUT_STATE_KEY not in user_data
+    assert unmatched == 1
@@ -0,0 +1,58 @@
+import asyncio
+from datetime import time
+from sqlalchemy import select
+import settings_cache as settings_cache_module
+from db import ClubSettings
+from settings_cache import ClubSettingsCache, ClubSettingsSnapshot
+
+def run(memory_db, scenario):
+    async def seeded(session_factory):
+        async with session_factory() as session:
+            session.add(ClubSettings(opening_time='10:00', closing_time='14:00', slot_duration=60))
+            await session.commit()
+        cache = ClubSettingsCache()
+        loads = []
+        original = cache._load
+
+        async def counted_load():
+            loads.append(1)
+            return await original()
+
+        cache._load = counted_load
+        return await scenario(cache, session_factory), len(loads)
+    return memory_db(seeded, settings_cache_module)
+
+def test_get_loads_once_and_invalidate_reloads(memory_db):
+    async def scenario(cache, session_factory):
+        first, second = await asyncio.gather(cache.get(), cache.get())
+        async with session_factory() as session:
+            settings = await session.scalar(select(ClubSettings))
+            settings.closing_time = '16:00'
+            await session.commit()
+        cached = await cache.get()
+        cache.invalidate()
+        reloaded = await cache.get()
+        return first, second, cached, reloaded
+
+    (first, second, cached, reloaded), loads = run(memory_db, scenario)
+    assert first is second and first == ClubSettingsSnapshot('10:00', '14:00', 60)
+    # Изменение в базе мимо кэша не видно до invalidate()
+    assert cached.closing_time == '14:00' and reloaded.closing_time == '16:00'
+    assert loads == 2
+
+def test_set_notifies_listeners_and_rebuilds_slot_times(memory_db):
+    async def scenario(cache, session_factory):
+        received = []
+        cache.add_listener(received.append)
+        hourly = await cache.get_slot_times()
+        # Путь handle_settings_input: запись в базу, затем set() с новым снимком
+        updated = ClubSettingsSnapshot('10:00', '14:00', 120)
+        cache.set(updated)
+        two_hourly = await cache.get_slot_times()
+        return received, updated, hourly, two_hourly, await cache.get()
+
+    (received, updated, hourly, two_hourly, current), loads = run(memory_db, scenario)
+    assert hourly == [(time(h), time(h + 1)) for h in (10, 11, 12, 13)]
+    assert two_hourly == [(time(10), time(12)), (time(12), time(14))]
+    assert received[-1] is updated and current is updated
+    assert loads == 1
@@ -0,0 +1,61 @@
+import table_catalog as table_catalog_module
+from db import Table
+from table_catalog import TableCatalog
+
+def run(memory_db, scenario):
+    async def seeded(session_factory):
+        async with session_factory() as session:
+            session.add_all([Table(number=n, is_available=True) for n in (3, 1, 2)])
+            await session.commit()
+        return await scenario(session_factory)
+    return memory_db(seeded, table_catalog_module)
+
+def test_lookup_and_snapshot_swap_on_toggle(memory_db):
+    async def scenario(session_factory):
+        catalog = TableCatalog()
+        published = []
+        catalog.subscribe(published.append)
+        before = await catalog.get()
+        again = await catalog.get()
+        toggled = await catalog.toggle(2)
+        after = await catalog.get()
+        missing = await catalog.toggle(42)
+        async with session_factory() as session:
+            stored = await session.get(Table, toggled.id)
+        return before, again, toggled, after, missing, stored.is_available, published
+
+    before, again, toggled, after, missing, stored, published = run(memory_db, scenario)
+    assert before is again
+    assert [t.number for t in before.tables] == [1, 2, 3]
+    assert before.by_number[2].id == toggled.id and before.by_id[toggled.id].number == 2
+    # Старый снимок не меняется: читатели, взявшие его раньше, видят согласованное состояние
+    assert before.by_number[2].is_available and not after.by_number[2].is_available
+    assert after is not before and after.version == before.version + 1
+    assert not toggled.is_available and stored is False
+    assert missing is None
+    assert published == [before, after]
+
+def test_set_available_publishes_only_changes(memory_db):
+    async def scenario(session_factory):
+        catalog = TableCatalog()
+        assert catalog.set_available(1, False) is None
+        published = []
+
+        def failing(snapshot):
+            raise RuntimeError('подписчик упал')
+
+        catalog.subscribe(failing)
+        catalog.subscribe(published.append)
+        snapshot = await catalog.get()
+        table_id = snapshot.by_number[1].id
+        unchanged = catalog.set_available(table_id, True)
+        changed = catalog.set_available(table_id, False)
+        unknown = catalog.set_available(999, False)
+        return snapshot, unchanged, changed, unknown, published, await catalog.get()
+
+    snapshot, unchanged, changed, unknown, published, current = run(memory_db, scenario)
+    assert unchanged is snapshot.by_number[1]
+    assert not changed.is_available and unknown is None
+    # Ошибка одного подписчика не мешает остальным
+    assert published == [snapshot, current]
+    assert current.by_number[1] is changed and current.table_states()[0] == {'number': 1, 'is_available': False}
@@ -0,0 +1,45 @@
+import asyncio
+from telegram import Update
+from update_processor import PerUserUpdateProcessor
+
+def make_update(update_id: int, user_id: int) -> Update:
+    return Update.de_json({'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': 1700000000, 'text': 'привет',
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'Иван'}}}, None)
+
+def test_serial_per_user_concurrent_across_users_with_limit():
+    async def scenario():
+        processor = PerUserUpdateProcessor(limit=2, max_pending=100)
+        events = []
+        running = 0
+        peak = 0
+
+        async def handler(update_id, user_id, delay):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            events.append(('start', user_id, update_id))
+            await asyncio.sleep(delay)
+            events.append(('end', user_id, update_id))
+            running -= 1
+
+        # Как Application: по задаче на обновление в порядке поступления
+        plan = [(1, 10, 0.05), (2, 10, 0.0), (3, 20, 0.0), (4, 30, 0.0), (5, 10, 0.0)]
+        tasks = [
+            asyncio.create_task(processor.process_update(make_update(update_id, user_id), handler(update_id, user_id, delay)))
+            for update_id, user_id, delay in plan
+        ]
+        await asyncio.gather(*tasks)
+        return events, peak, processor.stats(), processor.lane_stats(10)
+
+    events, peak, stats, lane = asyncio.run(scenario())
+    # Пользователь 10: строго по порядку, следующее начинается после окончания предыдущего
+    user_events = [(kind, update_id) for kind, user_id, update_id in events if user_id == 10]
+    assert user_events == [('start', 1), ('end', 1), ('start', 2), ('end', 2), ('start', 5), ('end', 5)]
+    # Пользователи 20 и 30 не ждут, пока обработается медленное обновление пользователя 10
+    assert events.index(('end', 20, 3)) < events.index(('end', 10, 1))
+    assert events.index(('end', 30, 4)) < events.index(('end', 10, 1))
+    assert peak == 2
+    assert stats['processed'] == 5 and stats['in_flight'] == 0 and stats['waiting'] == 0
+    assert lane['processed'] == 3 and lane['max_wait_ms'] >= 40
@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+from db import Reservation, ArchivedReservation, User
+from user_bookings import UserBookingsCursor, fetch_user_bookings
+
+NOW = datetime(2030, 3, 10, 12, 0)
+
+def test_cursor_roundtrip():
+    for cursor in (UserBookingsCursor(), UserBookingsCursor('h'), UserBookingsCursor('u', (NOW, 42))):
+        assert UserBookingsCursor.decode(cursor.encode()) == cursor
+    assert UserBookingsCursor.decode('my_bookings') == UserBookingsCursor()
+
+def test_upcoming_first_then_history_with_archive(memory_db):
+    async def scenario(session_factory):
+        async with session_factory() as session:
+            session.add_all([User(telegram_id=10, name='Свой', phone='-'), User(telegram_id=20, name='Чужой', phone='-')])
+            await session.flush()
+            hours = [-30, -5, -1, 1, 3, 26, 50, -200]
+            session.add_all([
+                Reservation(table_id=1, user_id=1, start_time=NOW + timedelta(hours=h),
+                            end_time=NOW + timedelta(hours=h + 2), status='confirmed')
+                for h in hours
+            ])
+            # Чужое бронирование и старое из архива
+            session.add(Reservation(table_id=2, user_id=2, start_time=NOW, end_time=NOW + timedelta(hours=2)))
+            session.add(ArchivedReservation(id=1000, table_id=1, user_id=1, start_time=NOW - timedelta(days=120),
+                                            end_time=NOW - timedelta(days=120, hours=-2), status='expired'))
+            await session.commit()
+
+            pages = []
+            page = await fetch_user_bookings(session, 1, now=NOW, limit=3)
+            pages.append(page)
+            while page.next_cursor:
+                page = await fetch_user_bookings(session, 1, UserBookingsCursor.decode(page.next_cursor.encode()),
+                                                 now=NOW, limit=3)
+                pages.append(page)
+            return pages
+
+    pages = memory_db(scenario)
+    rows = [row for page in pages for row in page.rows]
+    assert all(len(page.rows) <= 3 for page in pages)
+    # Идущее сейчас (-1 ч) — среди предстоящих, затем по возрастанию; история — от новых к старым
+    assert [(row.start_time - NOW) / timedelta(hours=1) for row in rows] == [-1, 1, 3, 26, 50, -5, -30, -200, -2880]
+    assert [row.upcoming for row in rows] == [True] * 5 + [False] * 4
+    assert rows[-1].archived and rows[-1].id == 1000
@@ -0,0 +1,71 @@
+import asyncio
+import user_cache as user_cache_module
+from db import User
+from user_cache import UserIdentityCache, UserRecord
+
+def run(memory_db, scenario):
+    async def seeded(session_factory):
+        async with session_factory() as session:
+            session.add_all([User(telegram_id=100 + i, name=f'Клиент {i}', phone=f'+7{i}') for i in range(5)])
+            await session.commit()
+        return await scenario(session_factory)
+    return memory_db(seeded, user_cache_module)
+
+def test_hits_misses_and_lru_eviction(memory_db):
+    async def scenario(session_factory):
+        cache = UserIdentityCache(maxsize=2, ttl=60)
+        first = await cache.get(100)
+        again = await cache.get(100)
+        unknown = await cache.get(999)
+        await cache.get(101)
+        # Обращение делает 100 недавним: при добавлении 102 вытесняется 101
+        await cache.get(100)
+        await cache.get(102)
+        stats_before = cache.stats()
+        await cache.get(100)
+        await cache.get(101)
+        return first, again, unknown, stats_before, cache.stats()
+
+    first, again, unknown, before, after = run(memory_db, scenario)
+    assert first == again and first.name == 'Клиент 0'
+    # Незарегистрированный пользователь не кэшируется
+    assert unknown is None
+    assert before == {'size': 2, 'hits': 2, 'misses': 4, 'evictions': 1, 'hit_rate': 2 / 6}
+    # 100 остался (недавно использован), 101 был вытеснен и читается из базы снова
+    assert after['hits'] == 3 and after['misses'] == 5 and after['evictions'] == 2
+
+def test_ttl_expiry_reloads_from_database(memory_db):
+    async def scenario(session_factory):
+        cache = UserIdentityCache(maxsize=10, ttl=0.05)
+        await cache.get(100)
+        await cache.get(100)
+        await asyncio.sleep(0.06)
+        await cache.get(100)
+        return cache.stats()
+
+    stats = run(memory_db, scenario)
+    assert stats['hits'] == 1 and stats['misses'] == 2 and stats['size'] == 1
+
+def test_put_after_registration_is_served_without_stale_read(memory_db):
+    async def scenario(session_factory):
+        cache = UserIdentityCache(maxsize=10, ttl=60)
+        await cache.get(100)
+        # Повторная регистрация: запись в базу и put(), как в process_registration
+        async with session_factory() as session:
+            user = await session.get(User, 1)
+            user.name, user.phone = 'Иван', '+79990000000'
+            await session.commit()
+            cache.put(UserRecord.from_model(user))
+        record = await cache.get(100)
+        # Новый пользователь виден сразу: промах по незарегистрированному не запоминается
+        missing = await cache.get(200)
+        async with session_factory() as session:
+            session.add(User(telegram_id=200, name='Новый', phone='+1'))
+            await session.commit()
+        registered = await cache.get(200)
+        return record, missing, registered, cache.stats()
+
+    record, missing, registered, stats = run(memory_db, scenario)
+    assert (record.name, record.phone) == ('Иван', '+79990000000')
+    assert missing is None and registered.name == 'Новый'
+    assert stats['hits'] == 1 and stats['misses'] == 3
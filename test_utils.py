@@ -1,5 +1,5 @@
 import pytest
-from utils import get_time_slots, is_slot_available, format_time_slot
+from utils import get_time_slots, is_slot_available, format_time_slot, create_table_layout_image, get_table_layout_key, clear_render_cache
 from datetime import datetime, timedelta
 
 def test_get_time_slots():
@@ -33,3 +33,14 @@ def test_is_slot_available():
 def test_format_time_slot():
     slot = (datetime(2025, 4, 17, 10, 0), datetime(2025, 4, 17, 10, 30))
     assert format_time_slot(slot) == "10:00 - 10:30"
+
+def test_create_table_layout_image_cache():
+    clear_render_cache()
+    free = [{'number': 1, 'is_available': True}, {'number': 2, 'is_available': True}]
+    busy = [{'number': 1, 'is_available': True}, {'number': 2, 'is_available': False}]
+    first = create_table_layout_image(free)
+    assert first.startswith(b'\x89PNG')
+    # Повторный запрос с тем же состоянием отдает тот же объект из кэша
+    assert create_table_layout_image(list(reversed(free))) is first
+    assert create_table_layout_image(busy) != first
+    assert get_table_layout_key(free) != get_table_layout_key(busy)
@@ -0,0 +1,50 @@
+import asyncio
+import aiohttp
+from webhook_server import WebhookServer, SECRET_HEADER
+
+class FakeApplication:
+    def __init__(self):
+        self.bot = None
+        self.update_queue = asyncio.Queue()
+
+UPDATE = {'update_id': 7, 'message': {
+    'message_id': 1, 'date': 1700000000, 'text': '/start',
+    'chat': {'id': 42, 'type': 'private'}, 'from': {'id': 42, 'is_bot': False, 'first_name': 'Иван'}}}
+
+def test_secret_check_enqueue_and_stop():
+    async def scenario():
+        application = FakeApplication()
+        server = WebhookServer(application, path='/hook', listen='127.0.0.1', port=0, secret_token='s3cret')
+        await server.start()
+        port = server._runner.addresses[0][1]
+        url = f'http://127.0.0.1:{port}/hook'
+        statuses = []
+        async with aiohttp.ClientSession() as http:
+            for headers, body in (
+                ({}, UPDATE),
+                ({SECRET_HEADER: 'wrong'}, UPDATE),
+                ({SECRET_HEADER: 's3cret'}, UPDATE),
+            ):
+                async with http.post(url, json=body, headers=headers) as response:
+                    statuses.append(response.status)
+            async with http.post(url, data=b'not json', headers={SECRET_HEADER: 's3cret'}) as response:
+                statuses.append(response.status)
+            # Корректный JSON, но не объект
+            for body in ('update', [UPDATE]):
+                async with http.post(url, json=body, headers={SECRET_HEADER: 's3cret'}) as response:
+                    statuses.append(response.status)
+            queued = application.update_queue.qsize()
+            update = application.update_queue.get_nowait()
+            stats = server.stats()
+            # После stop() новые запросы не принимаются
+            server._accepting = False
+            async with http.post(url, json=UPDATE, headers={SECRET_HEADER: 's3cret'}) as response:
+                statuses.append(response.status)
+        await server.stop()
+        return statuses, queued, update, stats
+
+    statuses, queued, update, stats = asyncio.run(scenario())
+    assert statuses == [403, 403, 200, 400, 400, 400, 503]
+    assert queued == 1
+    assert update.update_id == 7 and update.effective_chat.id == 42
+    assert stats['received'] == 1 and stats['rejected'] == 2 and stats['malformed'] == 3
@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+from config import UPDATE_CONCURRENCY, UPDATE_MAX_PENDING
+
+logger = logging.getLogger(__name__)
+
+# Сколько очередей пользователей держать, прежде чем удалять простаивающие
+MAX_IDLE_LANES = 1024
+# Сколько очередей с наибольшим ожиданием показывать в stats()
+SLOWEST_LANES = 5
+
+def lane_key(update: object) -> Optional[int]:
+    """Ключ очереди: пользователь, а для обновлений без пользователя — чат; None — без очереди"""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_user:
+        return update.effective_user.id
+    if update.effective_chat:
+        return update.effective_chat.id
+    return None
+
+class _UserLane:
+    """Очередь одного пользователя: его обновления обрабатываются строго по порядку"""
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.pending = 0
+        self.processed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Обработка обновлений разных пользователей параллельно, одного пользователя — по очереди,
+    чтобы цепочки в context.user_data (selected_table, start_time и т. п.) не перемешивались.
+    Одновременно выполняется не больше limit обработчиков.
+
+    Порядок важен: сначала очередь пользователя, потом общий слот. Если бы слот
+    брался первым (как семафор BaseUpdateProcessor), обновления одного пользователя,
+    ждущие своей очереди, занимали бы слоты и задерживали остальных. Поэтому
+    базовому классу передается max_pending — предел принятых, но еще не обработанных
+    обновлений, а limit соблюдается собственным семафором.
+    """
+
+    def __init__(self, limit: int = UPDATE_CONCURRENCY, max_pending: int = UPDATE_MAX_PENDING):
+        # PTB обрабатывает обновления параллельно только при max_concurrent_updates > 1
+        super().__init__(max(max_pending, limit, 2))
+        if limit < 1:
+            raise ValueError("limit должен быть положительным")
+        self.limit = limit
+        self._slots = asyncio.Semaphore(limit)
+        self._lanes = {}
+        self.in_flight = 0
+        self.waiting = 0
+        self.processed = 0
+        self.total_lane_wait = 0.0
+        self.total_slot_wait = 0.0
+        self.max_wait = 0.0
+
+    def _lane(self, key: int) -> _UserLane:
+        lane = self._lanes.get(key)
+        if lane is None:
+            if len(self._lanes) >= MAX_IDLE_LANES:
+                self._prune()
+            lane = self._lanes[key] = _UserLane()
+        return lane
+
+    def _prune(self):
+        for key, lane in list(self._lanes.items()):
+            if not lane.pending:
+                del self._lanes[key]
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        # До первого await: очередь пользователя занимается в порядке поступления обновлений
+        queued_at = time.perf_counter()
+        key = lane_key(update)
+        lane = self._lane(key) if key is not None else None
+        if lane:
+            lane.pending += 1
+        self.waiting += 1
+        started = False
+        try:
+            if lane:
+                await lane.lock.acquire()
+            try:
+                lane_ready_at = time.perf_counter()
+                async with self._slots:
+                    started_at = time.perf_counter()
+                    self._record_wait(lane, lane_ready_at - queued_at, started_at - lane_ready_at)
+                    self.waiting -= 1
+                    self.in_flight += 1
+                    started = True
+                    try:
+                        await coroutine
+                    finally:
+                        self.in_flight -= 1
+            finally:
+                if lane:
+                    lane.lock.release()
+        finally:
+            if lane:
+                lane.pending -= 1
+            if not started:
+                self.waiting -= 1
+                # Отмена до начала обработки (остановка бота): без предупреждения "never awaited"
+                coroutine.close()
+
+    def _record_wait(self, lane: Optional[_UserLane], lane_wait: float, slot_wait: float):
+        waited = lane_wait + slot_wait
+        self.processed += 1
+        self.total_lane_wait += lane_wait
+        self.total_slot_wait += slot_wait
+        self.max_wait = max(self.max_wait, waited)
+        if lane:
+            lane.processed += 1
+            lane.total_wait += waited
+            lane.max_wait = max(lane.max_wait, waited)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        logger.info(f"Статистика обработки обновлений: {self.stats()}")
+
+    def lane_stats(self, key: int) -> Optional[dict]:
+        """Ожидание в очереди одного пользователя (None — очередь уже удалена или не создавалась)"""
+        lane = self._lanes.get(key)
+        if lane is None:
+            return None
+        return {
+            'pending': lane.pending,
+            'processed': lane.processed,
+            'avg_wait_ms': round(lane.total_wait / lane.processed * 1000, 1) if lane.processed else 0.0,
+            'max_wait_ms': round(lane.max_wait * 1000, 1),
+        }
+
+    def stats(self) -> dict:
+        """
+        Ожидание до начала обработки: lane — за предыдущими обновлениями того же
+        пользователя, slot — свободного места под общим ограничением
+        """
+        slowest = sorted(self._lanes, key=lambda key: self._lanes[key].max_wait, reverse=True)[:SLOWEST_LANES]
+        return {
+            'limit': self.limit,
+            'in_flight': self.in_flight,
+            'waiting': self.waiting,
+            'lanes': len(self._lanes),
+            'processed': self.processed,
+            'avg_lane_wait_ms': round(self.total_lane_wait / self.processed * 1000, 1) if self.processed else 0.0,
+            'avg_slot_wait_ms': round(self.total_slot_wait / self.processed * 1000, 1) if self.processed else 0.0,
+            'max_wait_ms': round(self.max_wait * 1000, 1),
+            'slowest_lanes': {key: self.lane_stats(key) for key in slowest if self._lanes[key].processed},
+        }
@@ -0,0 +1,92 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional, Tuple
+from sqlalchemy import select, literal, tuple_
+from db import Reservation
+from archive import history_stmt
+from admin_bookings import encode_time, decode_time
+from router import cb, callback_payload
+from config import BOOKINGS_PAGE_SIZE
+
+CALLBACK_PREFIX = 'mb'
+# Статусы, которые пользователь может отменить сам
+CANCELLABLE_STATUSES = ('pending', 'confirmed')
+
+@dataclass(frozen=True)
+class UserBookingsCursor:
+    """
+    Положение в списке "Мои бронирования": сначала предстоящие (section='u', по возрастанию
+    времени начала), затем история (section='h', от новых к старым, включая архив).
+    position — ключ (start_time, id) последней показанной строки раздела; None — начало раздела.
+    Сериализуется в данные кнопки: v1:mb:<раздел>:<время>:<id>.
+    """
+    section: str = 'u'
+    position: Optional[Tuple[datetime, int]] = None
+
+    def encode(self) -> str:
+        if self.position:
+            return cb(CALLBACK_PREFIX, self.section, encode_time(self.position[0]), self.position[1])
+        return cb(CALLBACK_PREFIX, self.section, '-', '-')
+
+    @classmethod
+    def decode(cls, data: str) -> 'UserBookingsCursor':
+        """Разбирает данные кнопки; для 'my_bookings' и неизвестного формата — начало списка"""
+        parts = callback_payload(data).split(':')
+        if len(parts) != 4 or parts[0] != CALLBACK_PREFIX or parts[1] not in ('u', 'h'):
+            return cls()
+        try:
+            position = (decode_time(parts[2]), int(parts[3])) if parts[2] != '-' else None
+        except ValueError:
+            return cls()
+        return cls(parts[1], position)
+
+@dataclass
+class UserBookingsPage:
+    rows: List
+    next_cursor: Optional[UserBookingsCursor]
+
+def upcoming_stmt(user_id: int, now: datetime, after: Optional[Tuple[datetime, int]], limit: int):
+    """Незакончившиеся бронирования пользователя по индексу ix_reservations_user_start"""
+    stmt = select(
+        Reservation.id, Reservation.table_id, Reservation.start_time, Reservation.end_time, Reservation.status,
+        literal(False).label('archived'), literal(True).label('upcoming')
+    ).where(Reservation.user_id == user_id, Reservation.end_time > now)
+    if after:
+        stmt = stmt.where(tuple_(Reservation.start_time, Reservation.id) > tuple_(*after))
+    return stmt.order_by(Reservation.start_time, Reservation.id).limit(limit)
+
+def past_stmt(user_id: int, now: datetime, before: Optional[Tuple[datetime, int]], limit: int):
+    """Закончившиеся бронирования пользователя из основной таблицы и архива, от новых к старым"""
+    history = history_stmt(user_id=user_id)
+    stmt = select(history, literal(False).label('upcoming')).where(history.c.end_time <= now)
+    if before:
+        stmt = stmt.where(tuple_(history.c.start_time, history.c.id) < tuple_(*before))
+    return stmt.order_by(history.c.start_time.desc(), history.c.id.desc()).limit(limit)
+
+async def fetch_user_bookings(session, user_id: int, cursor: UserBookingsCursor = None,
+                              now: datetime = None, limit: int = BOOKINGS_PAGE_SIZE) -> UserBookingsPage:
+    """
+    Одна страница бронирований пользователя (внутренний id, не telegram_id).
+    Читается не больше limit + 1 строки каждого раздела: история подгружается,
+    только когда предстоящие бронирования закончились.
+    """
+    cursor = cursor or UserBookingsCursor()
+    now = now or datetime.now()
+    rows = []
+    history_position = cursor.position
+    if cursor.section == 'u':
+        rows = (await session.execute(upcoming_stmt(user_id, now, cursor.position, limit + 1))).all()
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            return UserBookingsPage(rows[:limit], UserBookingsCursor('u', (last.start_time, last.id)))
+        history_position = None
+
+    rest = limit - len(rows)
+    past = (await session.execute(past_stmt(user_id, now, history_position, rest + 1))).all()
+    rows += past[:rest]
+    next_cursor = None
+    if len(past) > rest:
+        # Если на странице нет строк истории, следующая начинается с ее начала
+        position = (past[rest - 1].start_time, past[rest - 1].id) if rest else history_position
+        next_cursor = UserBookingsCursor('h', position)
+    return UserBookingsPage(rows, next_cursor)
@@ -0,0 +1,81 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+from sqlalchemy import select
+from db import async_session, User
+from config import USER_CACHE_SIZE, USER_CACHE_TTL
+
+@dataclass(frozen=True)
+class UserRecord:
+    """Облегченная запись пользователя для обработчиков (без ORM-сессии)"""
+    id: int
+    telegram_id: int
+    name: str
+    phone: str
+    is_admin: bool
+
+    @classmethod
+    def from_model(cls, user: User) -> 'UserRecord':
+        return cls(user.id, user.telegram_id, user.name, user.phone, bool(user.is_admin))
+
+class UserIdentityCache:
+    """
+    Ограниченный кэш telegram_id -> UserRecord с TTL и вытеснением LRU.
+    Незарегистрированные пользователи не кэшируются, поэтому регистрация
+    видна сразу; изменения данных при регистрации записываются через put().
+    """
+
+    def __init__(self, maxsize: int = USER_CACHE_SIZE, ttl: int = USER_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def get(self, telegram_id: int) -> Optional[UserRecord]:
+        """Возвращает пользователя по telegram_id из кэша или из базы; None, если он не зарегистрирован"""
+        entry = self._entries.get(telegram_id)
+        if entry is not None:
+            expires_at, record = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(telegram_id)
+                self.hits += 1
+                return record
+            del self._entries[telegram_id]
+
+        self.misses += 1
+        async with async_session() as session:
+            user = await session.scalar(select(User).where(User.telegram_id == telegram_id))
+        if not user:
+            return None
+        record = UserRecord.from_model(user)
+        self.put(record)
+        return record
+
+    def put(self, record: UserRecord):
+        self._entries[record.telegram_id] = (time.monotonic() + self.ttl, record)
+        self._entries.move_to_end(record.telegram_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, telegram_id: int = None):
+        """Удаляет запись пользователя; без аргумента очищает кэш"""
+        if telegram_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(telegram_id, None)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+user_cache = UserIdentityCache()
@@ -1,15 +1,153 @@
 from datetime import datetime, timedelta
 from PIL import Image, ImageDraw, ImageFont
 import io
+import threading
+import zlib
+from collections import OrderedDict
 from typing import List, Tuple
 from functools import lru_cache
 from config import get_table_layout
+from availability import AvailabilityIndex
+
+# Максимальное количество готовых PNG в кэше отрисовки.
+# При 9 столах возможны всего 512 состояний доступности, поэтому кэш небольшой.
+RENDER_CACHE_SIZE = 128
+
+_render_cache = OrderedDict()
+_render_cache_lock = threading.Lock()
+_render_plans = {}
+
+@lru_cache(maxsize=1)
+def _load_font():
+    """Подбирает шрифт один раз за время жизни процесса"""
+    try:
+        return ImageFont.truetype("arial.ttf", 32)
+    except Exception:
+        try:
+            return ImageFont.truetype("DejaVuSans-Bold.ttf", 32)
+        except Exception:
+            return ImageFont.load_default()
+
+def get_layout_version(layout=None) -> int:
+    """
+    Возвращает версию макета столов (контрольная сумма геометрии из config.get_table_layout()).
+    Значение стабильно между перезапусками, поэтому его можно хранить в базе.
+    """
+    if layout is None:
+        layout = get_table_layout()
+    return zlib.crc32(repr(tuple(tuple(sorted(t.items())) for t in layout)).encode())
+
+class RenderPlan:
+    """
+    Предварительно рассчитанный план отрисовки макета:
+    статический фон и координаты прямоугольников и подписей столов.
+    Строится один раз на каждую версию макета и размер изображения.
+    """
+
+    def __init__(self, layout, width: int, height: int):
+        self.font = _load_font()
+        self.background = Image.new('RGB', (width, height), '#f0f0f0')
+        draw = ImageDraw.Draw(self.background)
+        draw.line([(200, 0), (200, 600)], fill='black', width=4)
+        draw.line([(0, 300), (200, 300)], fill='black', width=4)
+
+        # (номер стола, прямоугольник, позиция подписи, текст подписи)
+        self.tables = []
+        for table_layout in layout:
+            text = str(table_layout['number'])
+            text_bbox = draw.textbbox((0, 0), text, font=self.font)
+            text_width = text_bbox[2] - text_bbox[0]
+            text_height = text_bbox[3] - text_bbox[1]
+            rect = (
+                table_layout['x'],
+                table_layout['y'],
+                table_layout['x'] + table_layout['width'],
+                table_layout['y'] + table_layout['height']
+            )
+            text_pos = (
+                table_layout['x'] + (table_layout['width'] - text_width) // 2,
+                table_layout['y'] + (table_layout['height'] - text_height) // 2
+            )
+            self.tables.append((table_layout['number'], rect, text_pos, text))
+
+    def render(self, present_mask: int, available_mask: int) -> bytes:
+        image = self.background.copy()
+        draw = ImageDraw.Draw(image)
+        for i, (_, rect, text_pos, text) in enumerate(self.tables):
+            bit = 1 << i
+            if not present_mask & bit:
+                continue
+            color = 'green' if available_mask & bit else 'red'
+            draw.rectangle(rect, fill=color, outline='black', width=3)
+            draw.text(text_pos, text, fill='white', font=self.font)
+
+        img_byte_arr = io.BytesIO()
+        image.save(img_byte_arr, format='PNG')
+        return img_byte_arr.getvalue()
+
+def _get_render_plan(version: int, layout, width: int, height: int) -> RenderPlan:
+    key = (version, width, height)
+    plan = _render_plans.get(key)
+    if plan is None:
+        plan = RenderPlan(layout, width, height)
+        # Планы для устаревших версий макета больше не нужны
+        for stale_key in [k for k in _render_plans if k[0] != version]:
+            del _render_plans[stale_key]
+        _render_plans[key] = plan
+    return plan
+
+def _tables_to_dict(tables) -> dict:
+    """Приводит список словарей или кортеж пар ключ-значение к словарю {номер: данные}"""
+    tables_dict = {}
+    for t in tables:
+        t_dict = t if isinstance(t, dict) else dict(t)
+        if 'number' in t_dict:
+            tables_dict[t_dict['number']] = t_dict
+    return tables_dict
+
+def get_table_layout_key(tables, width: int = 800, height: int = 600) -> tuple:
+    """
+    Возвращает ключ состояния макета: версия макета, размер и битовые маски
+    присутствия и доступности столов (бит i соответствует i-му столу макета)
+    
+    Args:
+        tables: Список или кортеж с данными о столах
+        width: Ширина изображения
+        height: Высота изображения
+        
+    Returns:
+        tuple: (версия макета, ширина, высота, маска присутствия, маска доступности)
+    """
+    layout = get_table_layout()
+    tables_dict = _tables_to_dict(tables)
+    present_mask = 0
+    available_mask = 0
+    for i, table_layout in enumerate(layout):
+        table_data = tables_dict.get(table_layout['number'])
+        if table_data is None:
+            continue
+        present_mask |= 1 << i
+        if table_data['is_available']:
+            available_mask |= 1 << i
+    return (get_layout_version(layout), width, height, present_mask, available_mask)
+
+def format_table_layout_key(key: tuple) -> str:
+    """Преобразует ключ состояния макета в строку для хранения в базе данных"""
+    version, width, height, present_mask, available_mask = key
+    return f"layout:{version}:{width}x{height}:{present_mask}:{available_mask}"
+
+def get_cached_table_layout_image(key: tuple):
+    """Возвращает готовое изображение из кэша по ключу состояния макета или None"""
+    with _render_cache_lock:
+        img_bytes = _render_cache.get(key)
+        if img_bytes is not None:
+            _render_cache.move_to_end(key)
+        return img_bytes
 
-# Удаляем декоратор lru_cache, так как он не работает с нехешируемыми типами (списками)
-# @lru_cache(maxsize=16)
 def create_table_layout_image(tables, width: int = 800, height: int = 600) -> bytes:
     """
-    Создает изображение с расположением столов
+    Создает изображение с расположением столов.
+    Готовые PNG кэшируются (LRU) по битовой маске доступности столов и версии макета.
     
     Args:
         tables: Список или кортеж с данными о столах
@@ -19,57 +157,29 @@ def create_table_layout_image(tables, width: int = 800, height: int = 600) -> by
     Returns:
         bytes: Изображение в формате PNG
     """
-    # Преобразуем в кортеж для кэширования, если передан список
-    if isinstance(tables, list):
-        tables_tuple = tuple(tuple(sorted(t.items())) for t in tables)
-        # Создаем словарь для быстрого доступа к данным
-        tables_dict = {t['number']: t for t in tables}
-    else:
-        tables_tuple = tables
-        # Если уже кортеж, создаем словарь из него
-        tables_dict = {}
-        for t in tables:
-            # Преобразуем кортеж пар ключ-значение в словарь
-            t_dict = dict(t)
-            if 'number' in t_dict:
-                tables_dict[t_dict['number']] = t_dict
-    
+    key = get_table_layout_key(tables, width, height)
+    img_bytes = get_cached_table_layout_image(key)
+    if img_bytes is not None:
+        return img_bytes
+
+    version, _, _, present_mask, available_mask = key
     layout = get_table_layout()
-    image = Image.new('RGB', (width, height), '#f0f0f0')
-    draw = ImageDraw.Draw(image)
-    draw.line([(200, 0), (200, 600)], fill='black', width=4)
-    draw.line([(0, 300), (200, 300)], fill='black', width=4)
-    try:
-        font = ImageFont.truetype("arial.ttf", 32)
-    except:
-        try:
-            font = ImageFont.truetype("DejaVuSans-Bold.ttf", 32)
-        except:
-            font = ImageFont.load_default()
-    
-    for table_layout in layout:
-        table_number = table_layout['number']
-        if table_number in tables_dict:
-            table_data = tables_dict[table_number]
-            color = 'green' if table_data['is_available'] else 'red'
-            draw.rectangle([
-                table_layout['x'],
-                table_layout['y'],
-                table_layout['x'] + table_layout['width'],
-                table_layout['y'] + table_layout['height']
-            ], fill=color, outline='black', width=3)
-            text = str(table_layout['number'])
-            text_bbox = draw.textbbox((0, 0), text, font=font)
-            text_width = text_bbox[2] - text_bbox[0]
-            text_height = text_bbox[3] - text_bbox[1]
-            text_x = table_layout['x'] + (table_layout['width'] - text_width) // 2
-            text_y = table_layout['y'] + (table_layout['height'] - text_height) // 2
-            draw.text((text_x, text_y), text, fill='white', font=font)
-    
-    img_byte_arr = io.BytesIO()
-    image.save(img_byte_arr, format='PNG')
-    img_byte_arr.seek(0)
-    return img_byte_arr.getvalue()
+    with _render_cache_lock:
+        plan = _get_render_plan(version, layout, width, height)
+    img_bytes = plan.render(present_mask, available_mask)
+
+    with _render_cache_lock:
+        _render_cache[key] = img_bytes
+        _render_cache.move_to_end(key)
+        while len(_render_cache) > RENDER_CACHE_SIZE:
+            _render_cache.popitem(last=False)
+    return img_bytes
+
+def clear_render_cache():
+    """Сбрасывает кэш готовых изображений и планы отрисовки"""
+    with _render_cache_lock:
+        _render_cache.clear()
+        _render_plans.clear()
 
 def get_time_slots(opening_time: str, closing_time: str, slot_duration: int) -> List[Tuple[datetime, datetime]]:
     today = datetime.now().date()
@@ -88,9 +198,11 @@ def get_time_slots(opening_time: str, closing_time: str, slot_duration: int) ->
 def format_time_slot(slot: Tuple[datetime, datetime]) -> str:
     return f"{slot[0].strftime('%H:%M')} - {slot[1].strftime('%H:%M')}"
 
-def is_slot_available(table_id: int, start_time: datetime, end_time: datetime, reservations: List[dict]) -> bool:
-    for r in reservations:
-        if r['table_id'] == table_id and r['status'] == 'confirmed':
-            if not (end_time <= r['start_time'] or start_time >= r['end_time']):
-                return False
-    return True
+def is_slot_available(table_id: int, start_time: datetime, end_time: datetime, reservations) -> bool:
+    """
+    Свободен ли слот стола. reservations — AvailabilityIndex (поиск бинарный) или список
+    бронирований-словарей, по которому строится индекс; стол занимают все статусы, кроме cancelled
+    """
+    if not isinstance(reservations, AvailabilityIndex):
+        reservations = AvailabilityIndex.from_reservations(reservations)
+    return reservations.is_available(table_id, start_time, end_time)
@@ -0,0 +1,89 @@
+import hmac
+import logging
+import secrets
+import time
+from aiohttp import web
+from telegram import Update
+from config import WEBHOOK_PATH, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_SECRET_TOKEN
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+# Сколько секунд при остановке ждать запросов, которые уже принимаются
+SHUTDOWN_TIMEOUT = 10
+
+class WebhookServer:
+    """
+    Встроенный HTTP-сервер (aiohttp) для режима webhook.
+    Запрос проверяется по секретному заголовку, обновление кладется в очередь
+    приложения (application.update_queue) и Telegram сразу получает 200:
+    обработка идет с той же конкурентностью, что и при long polling.
+    Порядок остановки: stop() перестает принимать запросы, затем
+    application.stop() дообрабатывает уже поставленные в очередь обновления.
+    """
+
+    def __init__(self, application, path: str = WEBHOOK_PATH, listen: str = WEBHOOK_LISTEN,
+                 port: int = WEBHOOK_PORT, secret_token: str = WEBHOOK_SECRET_TOKEN):
+        self.application = application
+        self.path = path
+        self.listen = listen
+        self.port = port
+        # Webhook регистрируется при каждом запуске, поэтому случайный секрет всегда совпадает
+        self.secret_token = secret_token or secrets.token_urlsafe(32)
+        self._runner = None
+        self._accepting = False
+        self.received = 0
+        self.rejected = 0
+        self.malformed = 0
+        self.total_enqueue_time = 0.0
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        return app
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if not self._accepting:
+            # Telegram повторит доставку после перезапуска
+            return web.Response(status=503)
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ''), self.secret_token):
+            self.rejected += 1
+            return web.Response(status=403)
+        started = time.perf_counter()
+        try:
+            data = await request.json()
+            # Строка или список — корректный JSON, но не обновление: de_json упал бы с другой ошибкой (500)
+            if not isinstance(data, dict):
+                raise TypeError(f"ожидался объект, получен {type(data).__name__}")
+            update = Update.de_json(data, self.application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            self.malformed += 1
+            logger.warning(f"Некорректное обновление в webhook: {e}")
+            return web.Response(status=400)
+        await self.application.update_queue.put(update)
+        self.received += 1
+        self.total_enqueue_time += time.perf_counter() - started
+        return web.Response()
+
+    async def start(self):
+        self._runner = web.AppRunner(self.build_app(), access_log=None, shutdown_timeout=SHUTDOWN_TIMEOUT)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.listen, self.port).start()
+        self._accepting = True
+        logger.info(f"Webhook-сервер слушает {self.listen}:{self.port}{self.path}")
+
+    async def stop(self):
+        """Перестает принимать обновления и закрывает сервер, дождавшись начатых запросов"""
+        self._accepting = False
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def stats(self) -> dict:
+        return {
+            'received': self.received,
+            'rejected': self.rejected,
+            'malformed': self.malformed,
+            'queue_size': self.application.update_queue.qsize(),
+            'avg_enqueue_ms': round(self.total_enqueue_time / self.received * 1000, 3) if self.received else 0.0,
+        }